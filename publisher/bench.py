@@ -0,0 +1,264 @@
+"""
+Benchmark harness untuk aggregator.
+
+Menjalankan publisher async konkuren terhadap aggregator (uvicorn lokal
+lewat --url, atau app di proses yang sama lewat --in-process), lalu
+mengukur throughput ingest end-to-end, latency /publish (p50/p95/p99),
+waktu sampai consumer selesai menguras antrian, dan peak RSS. Hasil
+ditulis sebagai JSON agar bisa dibandingkan antar commit.
+
+Contoh:
+    python publisher/bench.py --in-process --events 20000 --output bench.json
+    python publisher/bench.py --url http://localhost:8080 --rate 5000 --server-pid 1234
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("bench")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@dataclass
+class BenchConfig:
+    events: int = 20000
+    batch_size: int = 100
+    concurrency: int = 16
+    rate: float = 0  # event/detik; 0 = tanpa batas
+    duplicate_ratio: float = 0.2
+    topics: int = 10
+    payload_bytes: int = 64
+    seed: int = 42
+    drain_timeout: float = 120
+    busy_retries: int = 50
+
+def build_batches(config: BenchConfig) -> List[List[dict]]:
+    """
+    Membuat semua batch di muka (deterministik per seed) agar biaya membuat
+    event tidak ikut terukur. Duplikat diambil dari event yang muncul sebelumnya.
+    """
+    rng = random.Random(config.seed)
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    filler = "x" * config.payload_bytes
+    seen: List[dict] = []
+    events: List[dict] = []
+    for _ in range(config.events):
+        if seen and rng.random() < config.duplicate_ratio:
+            events.append(rng.choice(seen))
+            continue
+        event = {
+            "topic": f"bench-topic-{rng.randrange(max(1, config.topics))}",
+            "event_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "timestamp": timestamp,
+            "source": "bench-publisher",
+            "payload": {"value": rng.randint(1, 1000), "data": filler},
+        }
+        seen.append(event)
+        events.append(event)
+    return [events[i:i + config.batch_size] for i in range(0, len(events), config.batch_size)]
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentile nearest-rank dari list yang sudah terurut."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(pct / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+def peak_rss_kib(server_pid: Optional[int]) -> Optional[int]:
+    """Peak RSS (KiB) proses server: VmHWM dari /proc, atau proses ini sendiri jika in-process."""
+    if server_pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open(f"/proc/{server_pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError as e:
+        logger.warning(f"Cannot read RSS of pid {server_pid}: {e}")
+    return None
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def _stats(client: httpx.AsyncClient) -> Dict[str, Any]:
+    response = await client.get("/stats")
+    response.raise_for_status()
+    return response.json()
+
+def _processed(stats: Dict[str, Any]) -> int:
+    return stats["unique_processed_total"] + stats["duplicate_dropped_total"]
+
+async def run_benchmark(client: httpx.AsyncClient, config: BenchConfig, server_pid: Optional[int] = None) -> Dict[str, Any]:
+    batches = build_batches(config)
+    baseline = await _stats(client)
+    latencies: List[float] = []
+    counters = {"requests": 0, "failed": 0, "busy": 0, "events_sent": 0}
+    next_batch = 0
+    start = time.perf_counter()
+
+    async def worker():
+        nonlocal next_batch
+        while next_batch < len(batches):
+            index = next_batch
+            next_batch += 1
+            batch = batches[index]
+            if config.rate > 0:
+                # Jadwal tetap: batch ke-i dikirim paling cepat pada i * batch_size / rate
+                delay = start + index * config.batch_size / config.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            for attempt in range(config.busy_retries + 1):
+                sent_at = time.perf_counter()
+                try:
+                    response = await client.post("/publish", json={"events": batch})
+                except httpx.HTTPError as e:
+                    logger.warning(f"Publish failed: {e}")
+                    counters["failed"] += 1
+                    break
+                latencies.append(time.perf_counter() - sent_at)
+                counters["requests"] += 1
+                if response.status_code != 503:
+                    if response.status_code == 200:
+                        counters["events_sent"] += len(batch)
+                    else:
+                        counters["failed"] += 1
+                    break
+                counters["busy"] += 1
+                await asyncio.sleep(min(0.01 * 2 ** attempt, 0.5))
+            else:
+                counters["failed"] += 1
+
+    await asyncio.gather(*(worker() for _ in range(max(1, config.concurrency))))
+    published = time.perf_counter()
+
+    # Selesai jika semua event yang diterima server sudah di-commit consumer
+    deadline = published + config.drain_timeout
+    while True:
+        stats = await _stats(client)
+        received = stats["received_total"] - baseline["received_total"]
+        processed = _processed(stats) - _processed(baseline)
+        if processed >= received or time.perf_counter() > deadline:
+            break
+        await asyncio.sleep(0.01)
+    drained = time.perf_counter()
+    if processed < received:
+        logger.warning(f"Drain timed out: {processed}/{received} event(s) processed.")
+
+    latencies.sort()
+    return {
+        "events_sent": counters["events_sent"],
+        "events_received": received,
+        "events_processed": processed,
+        "unique_processed": stats["unique_processed_total"] - baseline["unique_processed_total"],
+        "duplicates_dropped": stats["duplicate_dropped_total"] - baseline["duplicate_dropped_total"],
+        "requests": counters["requests"],
+        "requests_failed": counters["failed"],
+        "busy_responses": counters["busy"],
+        "publish_seconds": round(published - start, 4),
+        "drain_seconds": round(drained - published, 4),
+        "total_seconds": round(drained - start, 4),
+        "throughput_eps": round(processed / max(drained - start, 1e-9), 1),
+        "latency_ms": {
+            name: round(percentile(latencies, pct) * 1000, 3)
+            for name, pct in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))
+        },
+        "peak_rss_kib": peak_rss_kib(server_pid),
+    }
+
+@asynccontextmanager
+async def in_process_client(db_path: Optional[str]) -> AsyncIterator[httpx.AsyncClient]:
+    """Menjalankan app aggregator (termasuk lifespan) di proses ini lewat ASGITransport."""
+    if db_path is not None:
+        # DB_PATH dibaca saat src.database di-import
+        os.environ["DB_PATH"] = db_path
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from src.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://aggregator") as client:
+            yield client
+
+async def main_async(args: argparse.Namespace) -> Dict[str, Any]:
+    config = BenchConfig(
+        events=args.events,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        duplicate_ratio=args.duplicate_ratio,
+        topics=args.topics,
+        payload_bytes=args.payload_bytes,
+        seed=args.seed,
+        drain_timeout=args.drain_timeout,
+    )
+    if args.in_process:
+        with tempfile.TemporaryDirectory() as tmp:
+            async with in_process_client(args.db_path or os.path.join(tmp, "bench.db")) as client:
+                results = await run_benchmark(client, config)
+    else:
+        async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+            results = await run_benchmark(client, config, server_pid=args.server_pid)
+    return {
+        "git_commit": git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "mode": "in-process" if args.in_process else args.url,
+        "config": asdict(config),
+        "results": results,
+    }
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    defaults = BenchConfig()
+    parser = argparse.ArgumentParser(description="Benchmark ingest aggregator.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:8080", help="Base URL aggregator")
+    target.add_argument("--in-process", action="store_true", help="Jalankan app di proses ini (tanpa jaringan)")
+    parser.add_argument("--db-path", help="File SQLite untuk --in-process (default: file sementara)")
+    parser.add_argument("--server-pid", type=int, help="PID server untuk mengukur peak RSS (mode --url)")
+    parser.add_argument("--events", type=int, default=defaults.events)
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size)
+    parser.add_argument("--concurrency", type=int, default=defaults.concurrency)
+    parser.add_argument("--rate", type=float, default=defaults.rate, help="Target event/detik (0 = tanpa batas)")
+    parser.add_argument("--duplicate-ratio", type=float, default=defaults.duplicate_ratio)
+    parser.add_argument("--topics", type=int, default=defaults.topics, help="Jumlah topic berbeda")
+    parser.add_argument("--payload-bytes", type=int, default=defaults.payload_bytes)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--drain-timeout", type=float, default=defaults.drain_timeout)
+    parser.add_argument("--output", help="Tulis hasil JSON ke file ini (default: stdout)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        logger.info(f"Results written to {args.output}")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
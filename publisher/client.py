@@ -0,0 +1,374 @@
+"""
+Library client publisher untuk aggregator.
+
+`AsyncPublisher` (asyncio) dan `Publisher` (sync, berbasis thread) sama-sama:
+- memakai satu pool koneksi keep-alive (httpx),
+- mengumpulkan event menjadi batch berdasarkan ukuran (`batch_size`) dan
+  waktu tunggu (`linger_ms`),
+- mengirim beberapa batch sekaligus (`max_in_flight`); jika semua slot
+  terpakai, `publish()` ikut menunggu (backpressure),
+- mengompres body dengan gzip jika lebih besar dari `compress_min_bytes`,
+- mengulang 429/503/error koneksi dengan exponential backoff + jitter yang
+  menghormati header `Retry-After`.
+
+Contoh:
+    async with AsyncPublisher("http://localhost:8080") as publisher:
+        for event in events:
+            await publisher.publish(event)
+
+    with Publisher("http://localhost:8080") as publisher:
+        publisher.publish_many(events)
+"""
+import asyncio
+import email.utils
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger("publisher.client")
+
+# Status yang aman diulang: antrian aggregator penuh / rate limit.
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+@dataclass
+class PublisherConfig:
+    batch_size: int = 500
+    linger_ms: float = 20
+    max_in_flight: int = 4
+    compress_min_bytes: int = 1024  # 0 = selalu gzip; None = tidak pernah
+    max_retries: int = 8
+    backoff_base: float = 0.05
+    backoff_max: float = 5.0
+    timeout: float = 30.0
+
+class PublishError(Exception):
+    """Batch gagal dikirim (status non-retryable atau retry habis)."""
+
+    def __init__(self, message: str, events: int, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.events = events
+        self.status_code = status_code
+
+class _Stats:
+    def __init__(self):
+        self.batches_sent = 0
+        self.events_sent = 0
+        self.events_failed = 0
+        self.retries = 0
+        self.bytes_sent = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(vars(self))
+
+def encode_batch(events: List[Dict[str, Any]], compress_min_bytes: Optional[int]) -> Tuple[bytes, Dict[str, str]]:
+    """Body JSON /publish (di-gzip jika cukup besar) beserta header-nya."""
+    body = json.dumps({"events": events}, separators=(",", ":"), default=str).encode()
+    headers = {"Content-Type": "application/json"}
+    if compress_min_bytes is not None and len(body) >= compress_min_bytes:
+        # Level 1: rasio kompresi JSON sudah baik, CPU publisher tetap murah
+        body = gzip.compress(body, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Nilai `Retry-After` (detik atau HTTP-date) dalam detik; None jika tidak ada/tidak valid."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+def backoff_delay(attempt: int, config: PublisherConfig, retry_after: Optional[float] = None) -> float:
+    """
+    Jeda sebelum percobaan ke-(attempt + 1): full jitter di atas exponential
+    backoff, tetapi tidak kurang dari `Retry-After` yang diminta server.
+    """
+    delay = random.uniform(0, min(config.backoff_max, config.backoff_base * 2 ** attempt))
+    if retry_after is not None:
+        # Sedikit jitter di atas Retry-After agar publisher tidak kembali bersamaan
+        delay = min(config.backoff_max, retry_after) + delay * 0.1
+    return delay
+
+def _failure(response: httpx.Response, events: int) -> PublishError:
+    return PublishError(f"Publish failed with HTTP {response.status_code}: {response.text[:200]}", events, response.status_code)
+
+class AsyncPublisher:
+    """Publisher asyncio; satu instance dipakai bersama oleh banyak task."""
+
+    def __init__(
+        self,
+        base_url: str,
+        config: Optional[PublisherConfig] = None,
+        client: Optional[httpx.AsyncClient] = None,
+        on_error: Optional[Callable[[PublishError], None]] = None
+    ):
+        self.config = config or PublisherConfig()
+        self._owns_client = client is None
+        self._client = client or httpx.AsyncClient(
+            base_url=base_url,
+            timeout=self.config.timeout,
+            limits=httpx.Limits(
+                max_connections=self.config.max_in_flight,
+                max_keepalive_connections=self.config.max_in_flight
+            )
+        )
+        self._url = base_url.rstrip("/") + "/publish"
+        self.on_error = on_error
+        self.stats = _Stats()
+        self._buffer: List[Dict[str, Any]] = []
+        self._slots = asyncio.Semaphore(self.config.max_in_flight)
+        self._in_flight: set = set()
+        self._linger_task: Optional[asyncio.Task] = None
+        self.errors: List[PublishError] = []
+
+    async def __aenter__(self) -> "AsyncPublisher":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def publish(self, event: Dict[str, Any]):
+        """Menambahkan satu event ke batch; menunggu hanya jika semua slot kirim terpakai."""
+        self._buffer.append(event)
+        if len(self._buffer) >= self.config.batch_size:
+            await self._dispatch()
+        elif self._linger_task is None:
+            self._linger_task = asyncio.create_task(self._linger())
+
+    async def publish_many(self, events: Iterable[Dict[str, Any]]):
+        for event in events:
+            await self.publish(event)
+
+    async def flush(self):
+        """Mengirim sisa buffer dan menunggu semua batch yang sedang dikirim."""
+        while self._buffer or self._in_flight:
+            if self._buffer:
+                await self._dispatch()
+            else:
+                await asyncio.gather(*list(self._in_flight), return_exceptions=True)
+
+    async def close(self):
+        try:
+            await self.flush()
+        finally:
+            if self._linger_task is not None:
+                self._linger_task.cancel()
+                self._linger_task = None
+            if self._owns_client:
+                await self._client.aclose()
+
+    async def _linger(self):
+        await asyncio.sleep(self.config.linger_ms / 1000)
+        self._linger_task = None
+        if self._buffer:
+            await self._dispatch()
+
+    async def _dispatch(self):
+        # Slot diambil dulu: batch baru dikeluarkan dari buffer setelah pasti
+        # terkirim, jadi pembatalan selama menunggu tidak menghilangkan event.
+        await self._slots.acquire()
+        batch = self._buffer[:self.config.batch_size]
+        del self._buffer[:self.config.batch_size]
+        if not batch:
+            self._slots.release()
+            return
+        if not self._buffer and self._linger_task is not None and self._linger_task is not asyncio.current_task():
+            self._linger_task.cancel()
+            self._linger_task = None
+        task = asyncio.create_task(self._send(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, batch: List[Dict[str, Any]]):
+        config = self.config
+        try:
+            body, headers = encode_batch(batch, config.compress_min_bytes)
+            for attempt in range(config.max_retries + 1):
+                retry_after = None
+                try:
+                    response = await self._client.post(self._url, content=body, headers=headers)
+                except httpx.TransportError as e:
+                    error = PublishError(f"Publish failed: {e!r}", len(batch))
+                else:
+                    if response.status_code < 300:
+                        self.stats.batches_sent += 1
+                        self.stats.events_sent += len(batch)
+                        self.stats.bytes_sent += len(body)
+                        return
+                    error = _failure(response, len(batch))
+                    if response.status_code not in RETRYABLE_STATUS:
+                        break
+                    retry_after = parse_retry_after(response.headers.get("retry-after"))
+                if attempt == config.max_retries:
+                    break
+                self.stats.retries += 1
+                await asyncio.sleep(backoff_delay(attempt, config, retry_after))
+            self._fail(error)
+        finally:
+            self._slots.release()
+
+    def _fail(self, error: PublishError):
+        self.stats.events_failed += error.events
+        self.errors.append(error)
+        logger.error(str(error))
+        if self.on_error is not None:
+            self.on_error(error)
+
+class Publisher:
+    """
+    Publisher sinkron: `publish()` mengisi buffer, batch dikirim oleh thread
+    pool berukuran `max_in_flight` yang berbagi satu `httpx.Client`.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        config: Optional[PublisherConfig] = None,
+        client: Optional[httpx.Client] = None,
+        on_error: Optional[Callable[[PublishError], None]] = None
+    ):
+        self.config = config or PublisherConfig()
+        self._owns_client = client is None
+        self._client = client or httpx.Client(
+            base_url=base_url,
+            timeout=self.config.timeout,
+            limits=httpx.Limits(
+                max_connections=self.config.max_in_flight,
+                max_keepalive_connections=self.config.max_in_flight
+            )
+        )
+        self._url = base_url.rstrip("/") + "/publish"
+        self.on_error = on_error
+        self.stats = _Stats()
+        self.errors: List[PublishError] = []
+        self._lock = threading.Lock()
+        # Diberi sinyal setiap kali satu batch selesai (berhasil atau gagal)
+        self._done = threading.Condition(self._lock)
+        self._buffer: List[Dict[str, Any]] = []
+        self._slots = threading.BoundedSemaphore(self.config.max_in_flight)
+        self._executor = ThreadPoolExecutor(self.config.max_in_flight, thread_name_prefix="publisher")
+        # Batch yang sudah keluar dari buffer tetapi belum selesai dikirim
+        self._outstanding = 0
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+
+    def __enter__(self) -> "Publisher":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def publish(self, event: Dict[str, Any]):
+        """Menambahkan satu event ke batch; memblok hanya jika semua slot kirim terpakai."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Publisher is closed")
+            self._buffer.append(event)
+            batch = self._take_if(len(self._buffer) >= self.config.batch_size)
+            if batch is None and self._timer is None:
+                self._timer = threading.Timer(self.config.linger_ms / 1000, self._linger)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._dispatch(batch)
+
+    def publish_many(self, events: Iterable[Dict[str, Any]]):
+        for event in events:
+            self.publish(event)
+
+    def flush(self):
+        """Mengirim sisa buffer dan menunggu semua batch yang sedang dikirim."""
+        with self._lock:
+            batch = self._take_if(bool(self._buffer))
+        if batch:
+            self._dispatch(batch)
+        with self._done:
+            self._done.wait_for(lambda: not self._outstanding)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._closed = True
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            self._executor.shutdown(wait=True)
+            if self._owns_client:
+                self._client.close()
+
+    def _take_if(self, condition: bool) -> Optional[List[Dict[str, Any]]]:
+        # Dipanggil dengan _lock dipegang
+        if not condition:
+            return None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        self._outstanding += 1
+        return batch
+
+    def _linger(self):
+        with self._lock:
+            self._timer = None
+            batch = self._take_if(bool(self._buffer) and not self._closed)
+        if batch:
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Dict[str, Any]]):
+        self._slots.acquire()
+        self._executor.submit(self._send, batch)
+
+    def _send(self, batch: List[Dict[str, Any]]):
+        config = self.config
+        try:
+            body, headers = encode_batch(batch, config.compress_min_bytes)
+            for attempt in range(config.max_retries + 1):
+                retry_after = None
+                try:
+                    response = self._client.post(self._url, content=body, headers=headers)
+                except httpx.TransportError as e:
+                    error = PublishError(f"Publish failed: {e!r}", len(batch))
+                else:
+                    if response.status_code < 300:
+                        with self._lock:
+                            self.stats.batches_sent += 1
+                            self.stats.events_sent += len(batch)
+                            self.stats.bytes_sent += len(body)
+                        return
+                    error = _failure(response, len(batch))
+                    if response.status_code not in RETRYABLE_STATUS:
+                        break
+                    retry_after = parse_retry_after(response.headers.get("retry-after"))
+                if attempt == config.max_retries:
+                    break
+                with self._lock:
+                    self.stats.retries += 1
+                time.sleep(backoff_delay(attempt, config, retry_after))
+            with self._lock:
+                self.stats.events_failed += error.events
+                self.errors.append(error)
+            logger.error(str(error))
+            if self.on_error is not None:
+                self.on_error(error)
+        finally:
+            self._slots.release()
+            with self._done:
+                self._outstanding -= 1
+                self._done.notify_all()
@@ -1,13 +1,15 @@
-import requests
+import httpx
 import uuid
 import time
 import random
 import logging
 
+from client import Publisher, PublisherConfig
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-AGGREGATOR_URL = "http://aggregator:8080/publish"
+AGGREGATOR_URL = "http://aggregator:8080"
 NUM_UNIQUE_EVENTS = 4000
 NUM_DUPLICATES = 1000 # Total 5000, 20% duplikasi
 BATCH_SIZE = 100
@@ -28,26 +30,16 @@ def wait_for_aggregator():
     wait = 2
     for i in range(retries):
         try:
-            response = requests.get("http://aggregator:8080/")
+            response = httpx.get(AGGREGATOR_URL + "/")
             if response.status_code == 200:
                 logger.info("Aggregator is up!")
                 return True
-        except requests.ConnectionError:
+        except httpx.TransportError:
             logger.info(f"Aggregator not ready. Retrying in {wait}s...")
             time.sleep(wait)
     logger.error("Aggregator did not start. Exiting.")
     return False
 
-def send_batch(batch: list):
-    try:
-        response = requests.post(AGGREGATOR_URL, json={"events": batch})
-        if response.status_code == 200:
-            logger.info(f"Successfully sent batch of {len(batch)} events.")
-        else:
-            logger.warning(f"Failed to send batch. Status: {response.status_code}, Body: {response.text}")
-    except requests.ConnectionError as e:
-        logger.error(f"Connection error sending batch: {e}")
-
 def main():
     if not wait_for_aggregator():
         return
@@ -62,15 +54,13 @@ def main():
     all_events = unique_events + duplicate_events
     random.shuffle(all_events) # Acak urutan
     
-    total_sent = 0
-    for i in range(0, len(all_events), BATCH_SIZE):
-        batch = all_events[i:i+BATCH_SIZE]
-        send_batch(batch)
-        total_sent += len(batch)
-        time.sleep(0.1) # Beri nafas sedikit
+    # Batching, koneksi keep-alive, kompresi, dan retry 503 ditangani client
+    with Publisher(AGGREGATOR_URL, PublisherConfig(batch_size=BATCH_SIZE)) as publisher:
+        publisher.publish_many(all_events)
+    stats = publisher.stats.snapshot()
         
     logger.info(f"--- Publishing complete ---")
-    logger.info(f"Total events sent: {total_sent}")
+    logger.info(f"Total events sent: {stats['events_sent']} ({stats['events_failed']} failed, {stats['retries']} retries)")
     logger.info(f"Expected unique: {NUM_UNIQUE_EVENTS}")
     logger.info(f"Expected duplicates: {NUM_DUPLICATES}")
     logger.info("Publisher finished. Cek 'GET /stats' di aggregator.")
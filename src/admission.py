@@ -0,0 +1,173 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from .models import EventRecord
+
+# Tolak batch jika estimasi waktu menguras antrian shard (kedalaman / throughput
+# consumer) melebihi ini (detik); 0 = hanya tolak jika antrian benar-benar penuh.
+ADMISSION_MAX_LAG_SECONDS = float(os.environ.get("ADMISSION_MAX_LAG_SECONDS", "10"))
+# Rate limit per source (event/detik, token bucket); 0 = tanpa rate limit.
+ADMISSION_SOURCE_RATE = float(os.environ.get("ADMISSION_SOURCE_RATE", "0"))
+# Kapasitas bucket per source (event); 0 = sama dengan satu detik rate.
+ADMISSION_SOURCE_BURST = float(os.environ.get("ADMISSION_SOURCE_BURST", "0"))
+# Jumlah source yang diingat bucket-nya; yang paling lama tidak aktif dilupakan.
+ADMISSION_MAX_SOURCES = 10000
+
+# Batas saran Retry-After (detik).
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+def retry_after_header(seconds: float) -> str:
+    """Nilai header `Retry-After`: detik bulat, dibatasi MIN/MAX_RETRY_AFTER."""
+    return str(max(MIN_RETRY_AFTER, min(MAX_RETRY_AFTER, math.ceil(seconds))))
+
+class Rejection:
+    """Alasan batch ditolak dan kapan sebaiknya dicoba lagi."""
+
+    __slots__ = ("reason", "retry_after")
+
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+class AdmissionController:
+    """
+    Admission control untuk submit non-blocking: sebuah batch diterima utuh
+    atau ditolak utuh, sebelum satu event pun masuk antrian atau ingest log.
+
+    Urutan pemeriksaan: rate limit per source (429), lalu kapasitas dan lag
+    consumer per shard (503). Kapasitas yang sudah disetujui tetapi belum
+    dipakai (mis. sedang menunggu fsync ingest log) tetap direservasi sampai
+    `Admission.release()`, sehingga `put_nowait` setelahnya tidak mungkin gagal.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        max_lag_seconds: float = ADMISSION_MAX_LAG_SECONDS,
+        source_rate: float = ADMISSION_SOURCE_RATE,
+        source_burst: float = ADMISSION_SOURCE_BURST,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.pipeline = pipeline
+        self.max_lag_seconds = max_lag_seconds
+        self.source_rate = source_rate
+        self.source_burst = source_burst or source_rate
+        self.clock = clock
+        self._reserved: Counter = Counter()
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.admitted_total = 0
+        self.rejected_total: Counter = Counter()
+
+    def _shard_needs(self, events: Sequence[EventRecord]) -> Counter:
+        return Counter(self.pipeline.route(event).index for event in events)
+
+    def _bucket(self, source: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            bucket = self._buckets[source] = TokenBucket(self.source_burst, now)
+            if len(self._buckets) > ADMISSION_MAX_SOURCES:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(source)
+            bucket.tokens = min(self.source_burst, bucket.tokens + (now - bucket.updated) * self.source_rate)
+            bucket.updated = now
+        return bucket
+
+    def _check_rate(self, events: Sequence[EventRecord], take: bool) -> Optional[Rejection]:
+        if self.source_rate <= 0:
+            return None
+        now = self.clock()
+        needs = Counter(event.source for event in events)
+        buckets = {source: self._bucket(source, now) for source in needs}
+        wait = 0.0
+        for source, need in needs.items():
+            # Batch lebih besar dari burst tetap bisa lewat saat bucket penuh (saldo jadi negatif)
+            deficit = min(need, self.source_burst) - buckets[source].tokens
+            if deficit > 0:
+                wait = max(wait, deficit / self.source_rate)
+        if wait > 0:
+            return Rejection("rate_limited", wait)
+        if take:
+            for source, need in needs.items():
+                buckets[source].tokens -= need
+        return None
+
+    def _check_capacity(self, needs: Counter) -> Optional[Rejection]:
+        worst: Optional[Rejection] = None
+        for index, need in needs.items():
+            shard = self.pipeline.shards[index]
+            depth = shard.queue.qsize() + self._reserved[index]
+            free = shard.queue.maxsize - depth if shard.queue.maxsize > 0 else need
+            throughput = shard.events_per_second()
+            rejection = None
+            if need > free:
+                # Perkiraan waktu sampai cukup tempat kosong di antrian
+                rejection = Rejection("queue_full", (need - free) / throughput if throughput else MIN_RETRY_AFTER)
+            elif self.max_lag_seconds > 0 and throughput > 0:
+                lag = (depth + need) / throughput
+                if lag > self.max_lag_seconds:
+                    rejection = Rejection("overloaded", lag - self.max_lag_seconds)
+            if rejection is not None and (worst is None or rejection.retry_after > worst.retry_after):
+                worst = rejection
+        return worst
+
+    def admit(self, events: Sequence[EventRecord]) -> "Admission":
+        """
+        Memeriksa dan (jika lolos) mereservasi tempat untuk seluruh batch.
+        Hasilnya harus dilepas dengan `Admission.release()` setelah event
+        masuk antrian (atau batal).
+        """
+        needs = self._shard_needs(events)
+        rejection = self._check_rate(events, take=False) or self._check_capacity(needs)
+        if rejection is None:
+            # Token baru diambil jika kapasitas juga tersedia
+            self._check_rate(events, take=True)
+            self._reserved.update(needs)
+            self.admitted_total += len(events)
+            return Admission(self, needs, None)
+        self.rejected_total[rejection.reason] += len(events)
+        return Admission(self, Counter(), rejection)
+
+    async def wait_for_tokens(self, events: Sequence[EventRecord]):
+        """Untuk submit yang boleh menunggu (NDJSON stream): tidur sampai rate limit mengizinkan."""
+        while True:
+            rejection = self._check_rate(events, take=True)
+            if rejection is None:
+                return
+            await asyncio.sleep(rejection.retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_lag_seconds": self.max_lag_seconds,
+            "source_rate": self.source_rate,
+            "source_burst": self.source_burst,
+            "admitted_total": self.admitted_total,
+            "rejected_total": dict(self.rejected_total),
+            "tracked_sources": len(self._buckets),
+        }
+
+class Admission:
+    """Hasil `AdmissionController.admit`: `rejection` None berarti diterima."""
+
+    __slots__ = ("_controller", "_needs", "rejection")
+
+    def __init__(self, controller: AdmissionController, needs: Counter, rejection: Optional[Rejection]):
+        self._controller = controller
+        self._needs = needs
+        self.rejection = rejection
+
+    def release(self):
+        self._controller._reserved.subtract(self._needs)
+        self._needs = Counter()
@@ -1,40 +1,173 @@
 import asyncio
 import logging
-from .models import Event
-from .database import store_processed_event
+import os
+import time
+from typing import Callable, List, Optional, Sequence
+from .models import EventRecord
+from .database import Database
+from .dedup_cache import DedupCache
+from .metrics import BATCH_EVENTS, QUEUE_WAIT
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def event_consumer(queue: asyncio.Queue):
-    """Tugas background yang berjalan selamanya, memproses event dari antrian."""
-    logger.info("Event consumer started...")
+# Jumlah maksimum event yang ditulis dalam satu transaksi.
+CONSUMER_BATCH_SIZE = int(os.environ.get("CONSUMER_BATCH_SIZE", "500"))
+# Waktu maksimum (ms) menunggu event berikutnya sebelum batch ditulis.
+CONSUMER_LINGER_MS = float(os.environ.get("CONSUMER_LINGER_MS", "5"))
+# Interval (detik) log ringkasan consumer; log per event hanya di level DEBUG.
+CONSUMER_LOG_INTERVAL = float(os.environ.get("CONSUMER_LOG_INTERVAL", "10"))
+
+async def drain_batch(queue: asyncio.Queue, batch_size: int, linger_ms: float) -> List[EventRecord]:
+    """
+    Mengambil sampai `batch_size` event dari antrian. Menunggu (blocking) event
+    pertama, lalu mengumpulkan sisanya paling lama `linger_ms` milidetik.
+    """
+    batch = [await queue.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + linger_ms / 1000
+    while len(batch) < batch_size:
+        try:
+            batch.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            # Sengaja tidak memakai wait_for(queue.get()) supaya item tidak
+            # hilang ketika timeout dan get() selesai bersamaan.
+            await asyncio.sleep(remaining)
+    return batch
+
+async def _process_batch(
+    db: Database,
+    batch: List[EventRecord],
+    known_duplicates: Sequence[EventRecord] = (),
+    log_seqs: Sequence[int] = ()
+) -> List[Optional[bool]]:
+    """
+    Menulis batch; jika transaksi batch gagal, ulangi per event agar satu event
+    rusak tidak menggagalkan yang lain. Event yang tetap gagal bernilai None.
+    """
+    try:
+        return await db.store_processed_events_batch(batch, known_duplicates, log_seqs=log_seqs)
+    except Exception as e:
+        logger.error(f"Batch of {len(batch)} events failed, retrying one by one: {e}")
+
+    # Counter received, duplikat dari cache, dan seq ingest log ikut di
+    # transaksi pertama yang berhasil
+    pending_duplicates = known_duplicates
+    pending_received = len(batch) + len(known_duplicates)
+    pending_seqs = log_seqs
+    results = []
+    for event in batch:
+        try:
+            results.extend(await db.store_processed_events_batch(
+                [event], pending_duplicates, pending_received, pending_seqs
+            ))
+            pending_duplicates = pending_seqs = ()
+            pending_received = 0
+        except Exception as e:
+            logger.error(f"Error storing event {event.event_id}: {e}")
+            results.append(None)
+    if pending_duplicates or pending_received or pending_seqs:
+        await db.store_processed_events_batch([], pending_duplicates, pending_received, pending_seqs)
+    return results
+
+class _LogSummary:
+    """Mengagregasi hasil consumer dan menulisnya sebagai satu baris log per interval."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.new = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.batches = 0
+        self._since = time.monotonic()
+
+    def record(self, new: int, duplicates: int, failed: int):
+        self.new += new
+        self.duplicates += duplicates
+        self.failed += failed
+        self.batches += 1
+        now = time.monotonic()
+        if now - self._since >= self.interval:
+            logger.info(
+                f"Consumer processed {self.new} new, {self.duplicates} duplicate, {self.failed} failed "
+                f"event(s) in {self.batches} batch(es) over the last {now - self._since:.1f}s."
+            )
+            self.new = self.duplicates = self.failed = self.batches = 0
+            self._since = now
+
+async def event_consumer(
+    queue: asyncio.Queue,
+    db: Database,
+    dedup_cache: Optional[DedupCache] = None,
+    batch_size: int = CONSUMER_BATCH_SIZE,
+    linger_ms: float = CONSUMER_LINGER_MS,
+    on_batch: Optional[Callable[[int], None]] = None
+):
+    """
+    Tugas background yang berjalan selamanya, memproses event dari antrian per batch.
+    `on_batch(n)` dipanggil setelah setiap batch berisi n event selesai diproses.
+    """
+    logger.info(f"Event consumer started (batch_size={batch_size}, linger_ms={linger_ms})...")
+    summary = _LogSummary(CONSUMER_LOG_INTERVAL)
+    debug = logger.isEnabledFor(logging.DEBUG)
     while True:
-        event: Event = None  # Inisialisasi di luar try block
+        batch: List[EventRecord] = []  # Inisialisasi di luar try block
         try:
-            event = await queue.get()
-            
-            # Proses Idempotent
-            is_new = await store_processed_event(event)
-            
-            if is_new:
-                logger.info(f"Processed new event: {event.event_id} (Topic: {event.topic})")
-            else:
-                logger.warning(f"Detected duplicate event: {event.event_id} (Topic: {event.topic})")
-            
-            # Pindahkan task_done() ke DALAM try block
-            # Ini memastikan task_done() HANYA dipanggil jika get() BERHASIL
-            queue.task_done()
-            
+            batch = await drain_batch(queue, batch_size, linger_ms)
+            dequeued_at = time.monotonic()
+            for event in batch:
+                if event._enqueued_at:
+                    QUEUE_WAIT.observe(dequeued_at - event._enqueued_at)
+            BATCH_EVENTS.observe(len(batch))
+
+            # Duplikat yang sudah dikenal cache ditolak tanpa menyentuh dedup_keys
+            to_store = batch
+            cached_duplicates = []
+            if dedup_cache is not None:
+                to_store = []
+                for event in batch:
+                    if dedup_cache.is_known_duplicate(event.topic, event.event_id):
+                        cached_duplicates.append(event)
+                    else:
+                        to_store.append(event)
+
+            # Proses Idempotent untuk sisa batch dalam satu transaksi
+            log_seqs = [event._log_seq for event in batch if event._log_seq is not None]
+            results = await _process_batch(db, to_store, cached_duplicates, log_seqs)
+            if dedup_cache is not None:
+                dedup_cache.record_committed([(e.topic, e.event_id) for e in to_store], results)
+
+            # Log per event terlalu mahal di bawah beban; hanya di level DEBUG,
+            # selebihnya diringkas per interval.
+            new_count = results.count(True)
+            failed_count = results.count(None)
+            summary.record(new_count, len(batch) - new_count - failed_count, failed_count)
+            if debug:
+                for event, is_new in zip(to_store, results):
+                    if is_new:
+                        logger.debug(f"Processed new event: {event.event_id} (Topic: {event.topic})")
+                    elif is_new is not None:
+                        logger.debug(f"Detected duplicate event: {event.event_id} (Topic: {event.topic})")
+                for event in cached_duplicates:
+                    logger.debug(f"Detected duplicate event (cache): {event.event_id} (Topic: {event.topic})")
+
+            if on_batch is not None:
+                on_batch(len(batch))
+
+            # task_done() HANYA untuk event yang berhasil di-get()
+            for _ in batch:
+                queue.task_done()
+
         except asyncio.CancelledError:
             logger.info("Event consumer shutting down...")
             break # Keluar dari loop
-            
+
         except Exception as e:
             logger.error(f"Error in consumer: {e}")
-            # JIKA event-nya berhasil di-get() TAPI gagal diproses,
-            # kita tetap harus panggil task_done() agar queue tidak macet.
-            if event is not None:
+            # Event yang sudah di-get() tetap harus di-task_done()
+            # agar queue tidak macet.
+            for _ in batch:
                 queue.task_done()
-            # Jika event adalah None, berarti queue.get() yang gagal,
-            # jadi JANGAN panggil task_done().
\ No newline at end of file
@@ -1,43 +1,233 @@
 import aiosqlite
+import asyncio
+import base64
+import datetime
+import json
 import os
 import logging
 import sqlite3
-from .models import Event
-from typing import List, Dict, Optional, Any
+import heapq
+import time
+from contextlib import asynccontextmanager
+from collections import Counter
+from functools import lru_cache
+from .metrics import BATCH_COMMIT_LATENCY
+from .models import EventRecord, datetime_to_ms, ms_to_datetime
+from .payload_codec import PayloadCodec, UnknownDictionary, normalize_legacy, train_dictionary
+from .stats import StatsCounters
+from typing import AsyncIterator, List, Dict, Optional, Any, Sequence, Tuple, Union
 
 DB_PATH = os.environ.get("DB_PATH", "aggregator.db")
 logging.info(f"Database path set to: {DB_PATH}")
 
-async def init_db():
+# Pragma yang bisa di-tuning lewat environment variable.
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", "-16000"))  # negatif = KiB
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+DB_READER_POOL_SIZE = int(os.environ.get("DB_READER_POOL_SIZE", "4"))
+
+# Ukuran cache prepared statement per koneksi (sqlite3 menyimpan statement
+# yang sudah di-compile berdasarkan teks SQL-nya).
+STATEMENT_CACHE_SIZE = 256
+
+# Partisi tabel event berdasarkan timestamp event: "none" (satu tabel
+# events), "day", atau "hour".
+STORAGE_PARTITIONING = os.environ.get("STORAGE_PARTITIONING", "none")
+PARTITION_SECONDS = {"day": 86400, "hour": 3600}
+# Baris per transaksi saat memindahkan data layout lama ke layout ringkas.
+LAYOUT_MIGRATION_CHUNK_SIZE = int(os.environ.get("LAYOUT_MIGRATION_CHUNK_SIZE", "1000"))
+
+# Tabel event tanpa partisi; tetap terdaftar di katalog (tanpa batas waktu)
+# sehingga data lama tetap terbaca setelah partisi diaktifkan.
+EVENTS_TABLE = "events"
+
+# Layout lama (sebelum topic/source di-intern): topic/source TEXT per baris,
+# timestamp TEXT, dan processed_events ber-key event_id saja. Tabel-tabel ini
+# tetap dibaca sampai isinya dipindahkan oleh `migrate_legacy_layout`.
+LEGACY_EVENTS_TABLE = "processed_events"
+LEGACY_DEDUP_TABLE = "dedup_store"
+# Partisi layout lama di-rename dengan prefix ini agar namanya tidak bentrok.
+LEGACY_PREFIX = "legacy_"
+
+# Batas baris per statement multi-row agar jumlah parameter tetap di bawah
+# SQLITE_MAX_VARIABLE_NUMBER pada build SQLite lama (32766).
+MAX_ROWS_PER_STATEMENT = 256
+
+def _partition_schema(name: str) -> List[str]:
     """
-    Versi ASYNC: Inisialisasi tabel database jika belum ada.
-    Digunakan oleh aplikasi utama (Docker).
+    Tabel event (utama atau partisi) dan index-nya. Clustered pada
+    (topic_id, event_id), key yang sama dengan dedup_keys; ts adalah epoch
+    milidetik. Index sekunder WITHOUT ROWID otomatis membawa kolom PK yang
+    belum disebut, jadi urutan (ts, event_id, topic_id) tersedia tanpa kolom ekstra.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS dedup_store (
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            topic_id INTEGER NOT NULL,
             event_id TEXT NOT NULL,
-            topic TEXT NOT NULL,
-            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (event_id, topic)
-        )""")
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS processed_events (
-            event_id TEXT PRIMARY KEY,
-            topic TEXT,
-            timestamp TIMESTAMP,
-            source TEXT,
-            payload TEXT 
-        )""")
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS statistics (
-            stat_name TEXT PRIMARY KEY,
-            value INTEGER DEFAULT 0
-        )""")
-        await db.execute("INSERT OR IGNORE INTO statistics (stat_name, value) VALUES ('received_total', 0)")
-        await db.execute("INSERT OR IGNORE INTO statistics (stat_name, value) VALUES ('unique_processed_total', 0)")
-        await db.execute("INSERT OR IGNORE INTO statistics (stat_name, value) VALUES ('duplicate_dropped_total', 0)")
-        await db.commit()
+            ts INTEGER NOT NULL,
+            source_id INTEGER NOT NULL,
+            payload,
+            PRIMARY KEY (topic_id, event_id)
+        ) WITHOUT ROWID""",
+        f"CREATE INDEX IF NOT EXISTS {name}_by_ts ON {name} (ts, event_id)",
+        f"CREATE INDEX IF NOT EXISTS {name}_by_topic ON {name} (topic_id, ts, event_id)",
+        f"CREATE INDEX IF NOT EXISTS {name}_by_source ON {name} (source_id, ts, event_id)",
+    ]
+
+SCHEMA_STATEMENTS = [
+    # Dictionary nama topic dan source; baris event hanya menyimpan id-nya.
+    """
+    CREATE TABLE IF NOT EXISTS topics (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS sources (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )""",
+    # Key dedup; processed_at dalam epoch detik. Tanpa index di processed_at:
+    # compaction memindai key per rentang (lihat delete_expired_dedup).
+    """
+    CREATE TABLE IF NOT EXISTS dedup_keys (
+        topic_id INTEGER NOT NULL,
+        event_id TEXT NOT NULL,
+        processed_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        PRIMARY KEY (topic_id, event_id)
+    ) WITHOUT ROWID""",
+    *_partition_schema(EVENTS_TABLE),
+    """
+    CREATE TABLE IF NOT EXISTS statistics (
+        stat_name TEXT PRIMARY KEY,
+        value INTEGER DEFAULT 0
+    )""",
+    # Jumlah event unik per topic, dipelihara di transaksi yang sama dengan
+    # batch event supaya /stats tidak perlu GROUP BY di tabel event.
+    """
+    CREATE TABLE IF NOT EXISTS topic_stats (
+        topic TEXT PRIMARY KEY,
+        unique_count INTEGER NOT NULL DEFAULT 0
+    )""",
+    # Katalog partisi event: rentang [start_ts, end_ts) tiap tabel (epoch
+    # milidetik), dipakai /events untuk melewati partisi di luar rentang query.
+    """
+    CREATE TABLE IF NOT EXISTS event_partitions (
+        name TEXT PRIMARY KEY,
+        start_ts INTEGER,
+        end_ts INTEGER
+    )""",
+    f"INSERT OR IGNORE INTO event_partitions (name, start_ts, end_ts) VALUES ('{EVENTS_TABLE}', NULL, NULL)",
+    # Rollup jumlah event per (topic, source, menit timestamp event), dipelihara
+    # di transaksi batch; /stats/timeseries hanya membaca tabel ini.
+    """
+    CREATE TABLE IF NOT EXISTS event_rollups (
+        topic TEXT NOT NULL,
+        source TEXT NOT NULL,
+        minute INTEGER NOT NULL,
+        unique_count INTEGER NOT NULL DEFAULT 0,
+        duplicate_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (topic, source, minute)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_rollups_minute ON event_rollups (minute)",
+    # Dictionary kompresi payload (lihat src/payload_codec.py); tidak pernah
+    # dihapus karena payload lama merujuk id-nya.
+    """
+    CREATE TABLE IF NOT EXISTS payload_dictionaries (
+        id INTEGER PRIMARY KEY,
+        codec TEXT NOT NULL,
+        data BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    # Checkpoint ingest log: seq tertinggi yang semua record di bawahnya sudah di-commit.
+    """
+    CREATE TABLE IF NOT EXISTS ingest_checkpoint (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        seq INTEGER NOT NULL
+    )""",
+]
+
+STAT_NAMES = [
+    "received_total", "unique_processed_total", "duplicate_dropped_total",
+    # Diisi oleh compaction retensi (lihat src/retention.py)
+    "events_expired_total", "dedup_expired_total",
+]
+
+def is_legacy_table(name: str) -> bool:
+    """Apakah tabel event memakai layout lama (lihat LEGACY_EVENTS_TABLE)."""
+    return name == LEGACY_EVENTS_TABLE or name.startswith(LEGACY_PREFIX)
+
+async def _table_exists(db: aiosqlite.Connection, name: str) -> bool:
+    async with db.execute("SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?)", (name,)) as cursor:
+        return bool((await cursor.fetchone())[0])
+
+async def _upgrade_legacy_catalog(db: aiosqlite.Connection):
+    """
+    Katalog dari layout lama menyimpan batas partisi sebagai teks timestamp.
+    Partisinya di-rename dengan LEGACY_PREFIX (partisi baru memakai nama yang
+    sama) dan batasnya diubah ke epoch milidetik.
+    """
+    async with db.execute("SELECT name FROM event_partitions WHERE start_ts GLOB '*-*'") as cursor:
+        names = [row[0] for row in await cursor.fetchall()]
+    for name in names:
+        await db.execute(f"ALTER TABLE {name} RENAME TO {LEGACY_PREFIX}{name}")
+        await db.execute(
+            "UPDATE event_partitions SET name = ?, "
+            "start_ts = CAST(strftime('%s', start_ts) AS INTEGER) * 1000, "
+            "end_ts = CAST(strftime('%s', end_ts) AS INTEGER) * 1000 WHERE name = ?",
+            (LEGACY_PREFIX + name, name)
+        )
+    if names:
+        logging.info(f"Renamed {len(names)} legacy partition(s) for layout migration.")
+
+async def init_db(db: Optional[aiosqlite.Connection] = None):
+    """
+    Versi ASYNC: Inisialisasi tabel database jika belum ada.
+    Digunakan oleh aplikasi utama (Docker). Jika `db` diberikan, koneksi itu
+    yang dipakai (mis. koneksi writer milik `Database`).
+    """
+    if db is None:
+        async with aiosqlite.connect(DB_PATH) as conn:
+            await init_db(conn)
+        return
+
+    if await _table_exists(db, "event_partitions"):
+        await _upgrade_legacy_catalog(db)
+    for statement in SCHEMA_STATEMENTS:
+        await db.execute(statement)
+    if await _table_exists(db, LEGACY_EVENTS_TABLE):
+        await db.execute(
+            "INSERT OR IGNORE INTO event_partitions (name, start_ts, end_ts) VALUES (?, NULL, NULL)",
+            (LEGACY_EVENTS_TABLE,)
+        )
+    for stat_name in STAT_NAMES:
+        await db.execute("INSERT OR IGNORE INTO statistics (stat_name, value) VALUES (?, 0)", (stat_name,))
+    async with db.execute("SELECT name FROM event_partitions") as cursor:
+        legacy_tables = [row[0] for row in await cursor.fetchall() if is_legacy_table(row[0])]
+    # DB lama belum punya topic_stats: isi sekali dari tabel event layout lama.
+    async with db.execute("SELECT EXISTS (SELECT 1 FROM topic_stats)") as cursor:
+        has_topic_stats = (await cursor.fetchone())[0]
+    if not has_topic_stats:
+        for table in legacy_tables:
+            await db.execute(
+                f"INSERT INTO topic_stats (topic, unique_count) SELECT topic, COUNT(*) FROM {table} "
+                "WHERE topic IS NOT NULL GROUP BY topic "
+                "ON CONFLICT(topic) DO UPDATE SET unique_count = unique_count + excluded.unique_count"
+            )
+    # DB lama belum punya rollup: isi sekali dari event yang tersimpan
+    # (duplikat masa lalu tidak tercatat, jadi duplicate_count mulai dari 0).
+    async with db.execute("SELECT EXISTS (SELECT 1 FROM event_rollups)") as cursor:
+        has_rollups = (await cursor.fetchone())[0]
+    if not has_rollups:
+        for table in legacy_tables:
+            await db.execute(
+                "INSERT INTO event_rollups (topic, source, minute, unique_count) "
+                f"SELECT topic, source, CAST(strftime('%s', timestamp) AS INTEGER) / 60, COUNT(*) FROM {table} "
+                "WHERE topic IS NOT NULL AND source IS NOT NULL GROUP BY 1, 2, 3 "
+                "ON CONFLICT(topic, source, minute) DO UPDATE SET unique_count = unique_count + excluded.unique_count"
+            )
+    await db.commit()
     logging.info("Database initialized successfully.")
 
 def init_db_sync():
@@ -50,118 +240,1112 @@ def init_db_sync():
         # sqlite3.connect akan membuat file jika belum ada.
         with sqlite3.connect(DB_PATH) as db:
             cursor = db.cursor()
-            # 1. Buat tabel (jika belum ada)
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS dedup_store (
-                event_id TEXT NOT NULL,
-                topic TEXT NOT NULL,
-                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (event_id, topic)
-            )""")
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS processed_events (
-                event_id TEXT PRIMARY KEY,
-                topic TEXT,
-                timestamp TIMESTAMP,
-                source TEXT,
-                payload TEXT 
-            )""")
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS statistics (
-                stat_name TEXT PRIMARY KEY,
-                value INTEGER DEFAULT 0
-            )""")
-            
-            # 2. HAPUS SEMUA DATA LAMA (ini aman dari file lock)
-            cursor.execute("DELETE FROM dedup_store")
-            cursor.execute("DELETE FROM processed_events")
-            
-            # 3. RESET statistik
-            cursor.execute("UPDATE statistics SET value = 0")
-            
-            # 4. Pastikan statistik ada
-            cursor.execute("INSERT OR IGNORE INTO statistics (stat_name, value) VALUES ('received_total', 0)")
-            cursor.execute("INSERT OR IGNORE INTO statistics (stat_name, value) VALUES ('unique_processed_total', 0)")
-            cursor.execute("INSERT OR IGNORE INTO statistics (stat_name, value) VALUES ('duplicate_dropped_total', 0)")
-            
+            # 1. HAPUS SEMUA TABEL (termasuk partisi dan layout lama; aman dari file lock)
+            tables = cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            ).fetchall()
+            for (name,) in tables:
+                cursor.execute(f"DROP TABLE IF EXISTS {name}")
+
+            # 2. Buat ulang tabel
+            for statement in SCHEMA_STATEMENTS:
+                cursor.execute(statement)
+
+            # 3. Pastikan statistik ada (semuanya 0)
+            for stat_name in STAT_NAMES:
+                cursor.execute("INSERT OR IGNORE INTO statistics (stat_name, value) VALUES (?, 0)", (stat_name,))
+
             db.commit()
         logging.info("Sync database reset successfully.")
     except Exception as e:
         logging.error(f"Failed to init/reset sync DB: {e}")
 
-# ... (sisa file database.py Anda tidak berubah) ...
-async def store_processed_event(event: Event) -> bool:
+def to_db_timestamp(value: datetime.datetime) -> str:
     """
-    Mencoba menyimpan event. Bersifat Idempotent.
-    Mengembalikan True jika event baru diproses, False jika duplikat.
+    Menormalkan timestamp ke UTC dengan format yang sama seperti adapter
+    default sqlite3 (`isoformat(" ")`), sehingga urutan string = urutan waktu.
+    Timestamp tanpa zona waktu dianggap UTC. Format ini dipakai response
+    /events dan tabel layout lama.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).isoformat(" ")
+
+def ms_to_db_timestamp(value: int) -> str:
+    """Epoch milidetik (kolom `ts`) ke format timestamp response /events."""
+    return to_db_timestamp(ms_to_datetime(value))
+
+def db_timestamp_to_ms(value: Optional[str]) -> int:
+    """Kebalikan `ms_to_db_timestamp` untuk timestamp teks layout lama (0 jika tidak valid)."""
+    try:
+        return datetime_to_ms(datetime.datetime.fromisoformat(value))
+    except (TypeError, ValueError):
+        return 0
+
+def encode_cursor(timestamp_ms: int, event_id: str, topic_id: int) -> str:
+    """Cursor opaque untuk keyset pagination /events."""
+    raw = json.dumps([timestamp_ms, event_id, topic_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[int, str, int]:
+    """
+    Kebalikan `encode_cursor`; ValueError jika cursor tidak valid. Cursor
+    format lama [timestamp teks, event_id] tetap diterima.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) == 2 and isinstance(values[0], str):
+            values = [db_timestamp_to_ms(values[0]), values[1], 0]
+        timestamp_ms, event_id, topic_id = values
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(timestamp_ms, int) or not isinstance(event_id, str) or not isinstance(topic_id, int):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return timestamp_ms, event_id, topic_id
+
+def _event_filters(
+    legacy: bool,
+    topic: Optional[str],
+    source: Optional[str],
+    since: Optional[datetime.datetime],
+    until: Optional[datetime.datetime]
+) -> Tuple[List[str], List[Any]]:
+    """
+    Kondisi WHERE (dan parameternya) untuk filter event yang dipakai bersama.
+    Di layout ringkas nama topic/source dicari lewat subquery konstan,
+    sehingga index (topic_id, ts, ...) tetap terpakai.
+    """
+    conditions = []
+    params: List[Any] = []
+    if topic:
+        conditions.append("topic = ?" if legacy else "topic_id = (SELECT id FROM topics WHERE name = ?)")
+        params.append(topic)
+    if source:
+        conditions.append("source = ?" if legacy else "source_id = (SELECT id FROM sources WHERE name = ?)")
+        params.append(source)
+    if since:
+        conditions.append("timestamp >= ?" if legacy else "ts >= ?")
+        params.append(to_db_timestamp(since) if legacy else datetime_to_ms(since))
+    if until:
+        conditions.append("timestamp < ?" if legacy else "ts < ?")
+        params.append(to_db_timestamp(until) if legacy else datetime_to_ms(until))
+    return conditions, params
+
+# Kolom SELECT per layout, dalam urutan (topic, event_id, timestamp, source, payload).
+_LEGACY_COLUMNS = "topic, event_id, timestamp, source"
+_COMPACT_COLUMNS = "topic_id, event_id, ts, source_id"
+
+def _chunk_sizes(total: int) -> List[int]:
+    """
+    Memecah `total` baris menjadi ukuran chunk MAX_ROWS_PER_STATEMENT lalu
+    pangkat dua, supaya variasi teks SQL multi-row sedikit dan prepared
+    statement-nya bisa dipakai ulang dari cache.
+    """
+    sizes = [MAX_ROWS_PER_STATEMENT] * (total // MAX_ROWS_PER_STATEMENT)
+    rest = total % MAX_ROWS_PER_STATEMENT
+    size = MAX_ROWS_PER_STATEMENT
+    while rest:
+        size //= 2
+        if rest >= size:
+            sizes.append(size)
+            rest -= size
+    return sizes
+
+@lru_cache(maxsize=None)
+def _dedup_insert_sql(rows: int) -> str:
+    # OR IGNORE + RETURNING hanya mengembalikan baris yang benar-benar masuk,
+    # jadi sisanya adalah duplikat (sudah ada di DB atau muncul dua kali di batch).
+    placeholders = ", ".join(["(?, ?)"] * rows)
+    return f"INSERT OR IGNORE INTO dedup_keys (topic_id, event_id) VALUES {placeholders} RETURNING topic_id, event_id"
+
+@lru_cache(maxsize=None)
+def _legacy_dedup_sql(rows: int) -> str:
+    placeholders = ", ".join(["(?, ?)"] * rows)
+    return f"SELECT event_id, topic FROM {LEGACY_DEDUP_TABLE} WHERE (event_id, topic) IN (VALUES {placeholders})"
+
+_TOPIC_STATS_UPSERT_SQL = (
+    "INSERT INTO topic_stats (topic, unique_count) VALUES (?, ?) "
+    "ON CONFLICT(topic) DO UPDATE SET unique_count = unique_count + excluded.unique_count"
+)
+
+_ROLLUP_UPSERT_SQL = (
+    "INSERT INTO event_rollups (topic, source, minute, unique_count, duplicate_count) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(topic, source, minute) DO UPDATE SET "
+    "unique_count = unique_count + excluded.unique_count, "
+    "duplicate_count = duplicate_count + excluded.duplicate_count"
+)
+
+# Resolusi yang didukung /stats/timeseries (detik per bucket).
+TIMESERIES_BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+
+def _rollup_rows(new_events: Sequence[EventRecord], duplicates: Sequence[EventRecord]) -> List[Tuple]:
+    """Baris upsert event_rollups: (topic, source, menit, unik, duplikat)."""
+    counts: Dict[Tuple[str, str, int], List[int]] = {}
+    for index, group in enumerate((new_events, duplicates)):
+        for event in group:
+            key = (event.topic, event.source, event.timestamp_ms // 60000)
+            counts.setdefault(key, [0, 0])[index] += 1
+    return [(*key, unique, duplicate) for key, (unique, duplicate) in counts.items()]
+
+@lru_cache(maxsize=None)
+def _event_insert_sql(rows: int, table: str = EVENTS_TABLE) -> str:
+    placeholders = ", ".join(["(?, ?, ?, ?, ?)"] * rows)
+    return (
+        f"INSERT OR IGNORE INTO {table} (topic_id, event_id, ts, source_id, payload) "
+        f"VALUES {placeholders}"
+    )
+
+def partition_for(timestamp_ms: int, granularity: str) -> Tuple[str, int, int]:
+    """(nama tabel, start_ts, end_ts) partisi yang memuat `timestamp_ms`; batas dalam epoch milidetik."""
+    span = PARTITION_SECONDS[granularity] * 1000
+    start = timestamp_ms // span * span
+    name = "events_p" + ms_to_datetime(start).strftime("%Y%m%d" if granularity == "day" else "%Y%m%d%H")
+    return name, start, start + span
+
+def _is_missing_table(error: Exception) -> bool:
+    # Partisi bisa di-drop compaction di antara membaca katalog dan query-nya
+    return isinstance(error, sqlite3.OperationalError) and "no such table" in str(error)
+
+class NameTable:
+    """
+    Cache dua arah nama <-> id untuk tabel dictionary `topics` / `sources`.
+    Nama baru di-intern oleh writer di dalam transaksi batch dan baru masuk
+    cache setelah commit (`remember`); proses lain memuat ulang saat bertemu
+    id yang belum dikenal.
+    """
+
+    def __init__(self, table: str):
+        self.table = table
+        self.ids: Dict[str, int] = {}
+        self.names: Dict[int, str] = {}
+
+    def remember(self, mapping: Dict[str, int]):
+        for name, name_id in mapping.items():
+            self.ids[name] = name_id
+            self.names[name_id] = name
+
+    async def load(self, conn: aiosqlite.Connection):
+        async with conn.execute(f"SELECT name, id FROM {self.table}") as cursor:
+            self.remember(dict(await cursor.fetchall()))
+
+    async def intern(self, conn: aiosqlite.Connection, names) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """(id semua `names`, id yang baru dibuat). Dipanggil di dalam transaksi writer."""
+        ids = {}
+        created = {}
+        for name in names:
+            name_id = self.ids.get(name)
+            if name_id is None:
+                async with conn.execute(
+                    f"INSERT INTO {self.table} (name) VALUES (?) "
+                    "ON CONFLICT(name) DO UPDATE SET name = excluded.name RETURNING id",
+                    (name,)
+                ) as cursor:
+                    name_id = created[name] = (await cursor.fetchone())[0]
+            ids[name] = name_id
+        return ids, created
+
+class Database:
+    """
+    Storage layer aggregator: satu koneksi writer khusus (dipakai consumer)
+    dan pool kecil koneksi reader read-only untuk /stats dan /events.
+    Dengan WAL, reader membaca snapshot terakhir tanpa menunggu writer,
+    dan writer tidak pernah diblok oleh reader.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        reader_pool_size: int = DB_READER_POOL_SIZE,
+        counters: Optional[StatsCounters] = None,
+        read_only: bool = False,
+        partitioning: str = STORAGE_PARTITIONING
+    ):
+        if partitioning != "none" and partitioning not in PARTITION_SECONDS:
+            raise ValueError(f"Unknown partitioning {partitioning!r}, expected none, day or hour")
+        self.path = path or DB_PATH
+        self.partitioning = partitioning
+        # Partisi yang sudah ada di DB (sisi writer), agar CREATE hanya sekali per partisi.
+        self._partitions: set = set()
+        # Naik setiap kali writer meng-commit perubahan; dipakai cache baca
+        # sebagai versi data. Dimulai dari waktu sekarang (ns) agar nilainya
+        # tidak terulang setelah restart.
+        self.commit_seq = time.time_ns()
+        # Mode read-only (HTTP worker di mode multi-process): hanya pool reader,
+        # skema dan penulisan menjadi tanggung jawab proses writer.
+        self.read_only = read_only
+        # Counter in-memory yang di-update setelah setiap commit batch.
+        self.counters = counters or StatsCounters()
+        self.reader_pool_size = max(1, reader_pool_size)
+        self.writer: Optional[aiosqlite.Connection] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._reader_pool: Optional[asyncio.Queue] = None
+        # Koneksi writer dipakai bersama; lock menjaga agar transaksi tidak saling bercampur.
+        self._write_lock = asyncio.Lock()
+        # Ingest log opsional; checkpoint-nya ikut ditulis di transaksi batch.
+        self.ingest_log = None
+        # Encoding kolom payload (kompresi + dictionary)
+        self.codec = PayloadCodec()
+        # Dictionary nama topic/source (id kecil di setiap baris event)
+        self.topics = NameTable("topics")
+        self.sources = NameTable("sources")
+        # dedup_store layout lama masih ada: ikut diperiksa sampai dipindahkan
+        self._legacy_dedup = False
+
+    async def _apply_pragmas(self, conn: aiosqlite.Connection):
+        await conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        await conn.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+        await conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+
+    async def _open_reader(self) -> aiosqlite.Connection:
+        reader = await aiosqlite.connect(
+            f"file:{self.path}?mode=ro",
+            uri=True,
+            isolation_level=None,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        await self._apply_pragmas(reader)
+        await reader.execute("PRAGMA query_only = 1")
+        return reader
+
+    async def open(self):
+        """Membuka koneksi writer (mode WAL), membuat skema, lalu mengisi pool reader."""
+        if not self.read_only:
+            self.writer = await aiosqlite.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE)
+            # Harus sebelum journal_mode dan pembuatan tabel; no-op untuk DB lama
+            # (yang tetap NONE sampai di-VACUUM manual).
+            await self.writer.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await self.writer.execute("PRAGMA journal_mode = WAL")
+            await self.writer.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+            await self._apply_pragmas(self.writer)
+            await init_db(self.writer)
+
+        self._reader_pool = asyncio.Queue()
+        for _ in range(self.reader_pool_size):
+            reader = await self._open_reader()
+            self._readers.append(reader)
+            self._reader_pool.put_nowait(reader)
+        await self.load_payload_dictionaries()
+        await self.load_names()
+        if not self.read_only:
+            self.counters.load(*await self.load_stats())
+            self._partitions = {name for name, _, _ in await self.list_partitions()}
+            self._legacy_dedup = await _table_exists(self.writer, LEGACY_DEDUP_TABLE)
+        logging.info(f"Storage opened at {self.path} (WAL, {self.reader_pool_size} readers).")
+
+    async def close(self):
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+        if self.writer is not None:
+            await self.writer.close()
+            self.writer = None
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Meminjam satu koneksi read-only dari pool."""
+        conn = await self._reader_pool.get()
         try:
-            await db.execute(
-                "INSERT INTO dedup_store (event_id, topic) VALUES (?, ?)",
-                (event.event_id, event.topic)
+            yield conn
+        finally:
+            self._reader_pool.put_nowait(conn)
+
+    async def load_names(self):
+        async with self.reader() as db:
+            await self.topics.load(db)
+            await self.sources.load(db)
+
+    def _group_by_table(self, items: List[Any], timestamp_ms=lambda event: event.timestamp_ms) -> Dict[str, List[Any]]:
+        """Mengelompokkan item per tabel event tujuan menurut `timestamp_ms(item)`."""
+        if self.partitioning == "none":
+            return {EVENTS_TABLE: items} if items else {}
+        span = PARTITION_SECONDS[self.partitioning] * 1000
+        buckets: Dict[int, List[Any]] = {}
+        for item in items:
+            buckets.setdefault(timestamp_ms(item) // span, []).append(item)
+        return {
+            partition_for(timestamp_ms(bucket_items[0]), self.partitioning)[0]: bucket_items
+            for bucket_items in buckets.values()
+        }
+
+    async def _create_partition(self, name: str, timestamp_ms: int):
+        """Membuat tabel partisi dan mendaftarkannya di katalog (di dalam transaksi batch)."""
+        _, start_ts, end_ts = partition_for(timestamp_ms, self.partitioning)
+        for statement in _partition_schema(name):
+            await self.writer.execute(statement)
+        await self.writer.execute(
+            "INSERT OR IGNORE INTO event_partitions (name, start_ts, end_ts) VALUES (?, ?, ?)",
+            (name, start_ts, end_ts)
+        )
+
+    async def store_processed_events_batch(
+        self,
+        events: List[EventRecord],
+        known_duplicates: Union[int, Sequence[EventRecord]] = 0,
+        received: Optional[int] = None,
+        log_seqs: Sequence[int] = ()
+    ) -> List[bool]:
+        """
+        Menyimpan satu batch event dalam SATU transaksi. Bersifat Idempotent.
+        Mengembalikan list bool sejajar dengan `events`: True jika event baru,
+        False jika duplikat (termasuk duplikat di dalam batch itu sendiri).
+        `known_duplicates` adalah duplikat yang sudah ditolak oleh dedup cache;
+        hanya counter-nya yang ikut ditambahkan di transaksi ini. Jika berupa
+        list event (bukan jumlah), duplikat itu juga masuk rollup.
+
+        Semua counter (received, unique, duplicate, per-topic) ditulis di
+        transaksi yang sama dengan event-nya, sehingga nilai persisten selalu
+        konsisten dengan event yang tersimpan walau proses crash. `received`
+        default-nya seluruh event batch (termasuk `known_duplicates`).
+        `log_seqs` adalah seq ingest log milik batch ini; checkpoint log yang
+        baru ikut ditulis di transaksi yang sama.
+        """
+        cached_duplicates: Sequence[EventRecord] = ()
+        if not isinstance(known_duplicates, int):
+            cached_duplicates = known_duplicates
+            known_duplicates = len(cached_duplicates)
+        if received is None:
+            received = len(events) + known_duplicates
+        if not events and not known_duplicates and not received and not log_seqs:
+            return []
+        checkpoint = None
+        created: List[str] = []
+        started = time.perf_counter()
+
+        async with self._write_lock:
+            db = self.writer
+            inserted = set()
+            try:
+                topic_ids, new_topics = await self.topics.intern(db, {event.topic for event in events})
+                candidates = events
+                if self._legacy_dedup:
+                    known = await self._legacy_duplicates(db, events)
+                    candidates = [event for event in events if (event.event_id, event.topic) not in known]
+                start = 0
+                for size in _chunk_sizes(len(candidates)):
+                    chunk = candidates[start:start + size]
+                    start += size
+                    params = [value for event in chunk for value in (topic_ids[event.topic], event.event_id)]
+                    async with db.execute(_dedup_insert_sql(size), params) as cursor:
+                        async for row in cursor:
+                            inserted.add((row[0], row[1]))
+
+                results = []
+                new_events = []
+                duplicates = list(cached_duplicates)
+                for event in events:
+                    key = (topic_ids[event.topic], event.event_id)
+                    if key in inserted:
+                        # Kemunculan pertama saja yang dianggap baru
+                        inserted.discard(key)
+                        results.append(True)
+                        new_events.append(event)
+                    else:
+                        results.append(False)
+                        duplicates.append(event)
+
+                source_ids, new_sources = await self.sources.intern(db, {event.source for event in new_events})
+                for table, table_events in self._group_by_table(new_events).items():
+                    if table not in self._partitions:
+                        await self._create_partition(table, table_events[0].timestamp_ms)
+                        created.append(table)
+                    start = 0
+                    for size in _chunk_sizes(len(table_events)):
+                        chunk = table_events[start:start + size]
+                        start += size
+                        params = [
+                            value for event in chunk
+                            for value in (
+                                topic_ids[event.topic], event.event_id, event.timestamp_ms,
+                                source_ids[event.source], self.codec.encode(event.payload)
+                            )
+                        ]
+                        await db.execute(_event_insert_sql(size, table), params)
+
+                unique_count = len(new_events)
+                duplicate_count = len(events) - unique_count + known_duplicates
+                topic_counts = Counter(event.topic for event in new_events)
+                await db.executemany(
+                    "UPDATE statistics SET value = value + ? WHERE stat_name = ?",
+                    [
+                        (received, "received_total"),
+                        (unique_count, "unique_processed_total"),
+                        (duplicate_count, "duplicate_dropped_total"),
+                    ]
+                )
+                if topic_counts:
+                    await db.executemany(_TOPIC_STATS_UPSERT_SQL, topic_counts.items())
+                if new_events or duplicates:
+                    await db.executemany(_ROLLUP_UPSERT_SQL, _rollup_rows(new_events, duplicates))
+                if log_seqs and self.ingest_log is not None:
+                    # Dihitung di dalam write lock: tidak ada commit lain di antaranya
+                    checkpoint = self.ingest_log.watermark(exclude=log_seqs)
+                    await db.execute(
+                        "INSERT INTO ingest_checkpoint (id, seq) VALUES (1, ?) "
+                        "ON CONFLICT(id) DO UPDATE SET seq = excluded.seq",
+                        (checkpoint,)
+                    )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+        # Baru dicatat setelah commit: jika rollback, CREATE TABLE dan id nama baru ikut batal
+        self._partitions.update(created)
+        self.topics.remember(new_topics)
+        self.sources.remember(new_sources)
+        self.commit_seq += 1
+        BATCH_COMMIT_LATENCY.observe(time.perf_counter() - started)
+        self.counters.record_committed(unique_count, duplicate_count, topic_counts)
+        if checkpoint is not None:
+            self.ingest_log.ack(log_seqs, checkpoint)
+        return results
+
+    async def _legacy_duplicates(self, db: aiosqlite.Connection, events: Sequence[EventRecord]) -> set:
+        """Key (event_id, topic) batch yang sudah ada di dedup_store layout lama."""
+        known = set()
+        start = 0
+        for size in _chunk_sizes(len(events)):
+            chunk = events[start:start + size]
+            start += size
+            params = [value for event in chunk for value in (event.event_id, event.topic)]
+            async with db.execute(_legacy_dedup_sql(size), params) as cursor:
+                async for row in cursor:
+                    known.add((row[0], row[1]))
+        return known
+
+    async def delete_expired_events(
+        self,
+        cutoff: int,
+        limit: int,
+        topic: Optional[str] = None,
+        exclude_topics: Sequence[str] = (),
+        table: str = EVENTS_TABLE
+    ) -> int:
+        """
+        Menghapus paling banyak `limit` event dengan timestamp < `cutoff`
+        (epoch milidetik) dari `table` dalam satu transaksi pendek: hanya milik
+        `topic` jika diberikan, selain itu semua topic kecuali `exclude_topics`.
+        Mengembalikan jumlah baris terhapus.
+        """
+        legacy = is_legacy_table(table)
+        if legacy:
+            where, params = "timestamp < ?", [ms_to_db_timestamp(cutoff)]
+        else:
+            where, params = "ts < ?", [cutoff]
+        if topic is not None:
+            where += " AND topic = ?" if legacy else " AND topic_id = (SELECT id FROM topics WHERE name = ?)"
+            params.append(topic)
+        elif exclude_topics:
+            placeholders = ", ".join("?" * len(exclude_topics))
+            where += (
+                f" AND topic NOT IN ({placeholders})" if legacy
+                else f" AND topic_id NOT IN (SELECT id FROM topics WHERE name IN ({placeholders}))"
             )
-            await db.execute(
-                "INSERT OR IGNORE INTO processed_events (event_id, topic, timestamp, source, payload) VALUES (?, ?, ?, ?, ?)",
-                (event.event_id, event.topic, event.timestamp, event.source, str(event.payload))
+            params.extend(exclude_topics)
+        key = "rowid" if legacy else "topic_id, event_id"
+        return await self._delete_chunk(
+            f"DELETE FROM {table} WHERE ({key}) IN (SELECT {key} FROM {table} WHERE {where} LIMIT ?)",
+            params + [limit],
+            "events_expired_total"
+        )
+
+    async def drop_partition(self, name: str) -> int:
+        """
+        Menghapus satu partisi utuh (DROP TABLE, tanpa DELETE per baris) beserta
+        entri katalognya. Mengembalikan jumlah event yang ikut terhapus.
+        """
+        if name in (EVENTS_TABLE, LEGACY_EVENTS_TABLE):
+            raise ValueError("The unpartitioned events table cannot be dropped")
+        async with self._write_lock:
+            db = self.writer
+            try:
+                async with db.execute(f"SELECT COUNT(*) FROM {name}") as cursor:
+                    rows = (await cursor.fetchone())[0]
+                await db.execute(
+                    "UPDATE statistics SET value = value + ? WHERE stat_name = 'events_expired_total'", (rows,)
+                )
+                await db.execute("DELETE FROM event_partitions WHERE name = ?", (name,))
+                await db.execute(f"DROP TABLE {name}")
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            self._partitions.discard(name)
+            self.commit_seq += 1
+        return rows
+
+    async def partition_has_topic(self, name: str, topic: str) -> bool:
+        condition = "topic = ?" if is_legacy_table(name) else "topic_id = (SELECT id FROM topics WHERE name = ?)"
+        async with self.reader() as db:
+            async with db.execute(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE {condition})", (topic,)) as cursor:
+                return bool((await cursor.fetchone())[0])
+
+    async def delete_expired_dedup(
+        self,
+        cutoff: int,
+        limit: int,
+        after: Optional[Tuple[int, str]] = None
+    ) -> Tuple[int, Optional[Tuple[int, str]]]:
+        """
+        Memindai `limit` key dedup berikutnya (urutan key, mulai setelah
+        `after`) dan menghapus yang processed_at-nya < `cutoff` (epoch detik).
+        Mengembalikan (jumlah terhapus, key terakhir yang dipindai); key None
+        berarti pemindaian sudah sampai akhir. Dengan begitu jalur insert
+        tidak perlu index tambahan di processed_at.
+        """
+        after = after or (0, "")
+        async with self.reader() as db:
+            async with db.execute(
+                "SELECT topic_id, event_id FROM dedup_keys WHERE (topic_id, event_id) > (?, ?) "
+                "ORDER BY topic_id, event_id LIMIT 1 OFFSET ?",
+                (*after, limit - 1)
+            ) as cursor:
+                boundary = await cursor.fetchone()
+        where, params = "(topic_id, event_id) > (?, ?)", list(after)
+        if boundary is not None:
+            boundary = tuple(boundary)
+            where += " AND (topic_id, event_id) <= (?, ?)"
+            params.extend(boundary)
+        deleted = await self._delete_chunk(
+            f"DELETE FROM dedup_keys WHERE {where} AND processed_at < ?",
+            params + [cutoff],
+            "dedup_expired_total"
+        )
+        return deleted, boundary
+
+    async def _delete_chunk(self, sql: str, params: Sequence[Any], stat_name: str) -> int:
+        async with self._write_lock:
+            db = self.writer
+            try:
+                async with db.execute(sql, params) as cursor:
+                    deleted = cursor.rowcount
+                if deleted:
+                    await db.execute(
+                        "UPDATE statistics SET value = value + ? WHERE stat_name = ?", (deleted, stat_name)
+                    )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        if deleted:
+            self.commit_seq += 1
+        return deleted
+
+    async def incremental_vacuum(self, pages: int) -> int:
+        """Mengembalikan paling banyak `pages` halaman kosong ke OS; jumlah yang dibebaskan."""
+        async with self._write_lock:
+            async with self.writer.execute("PRAGMA freelist_count") as cursor:
+                before = (await cursor.fetchone())[0]
+            if not before:
+                return 0
+            # Pragma ini membebaskan satu halaman per langkah; fetchall() menjalankan semuanya
+            async with self.writer.execute(f"PRAGMA incremental_vacuum({int(pages)})") as cursor:
+                await cursor.fetchall()
+            async with self.writer.execute("PRAGMA freelist_count") as cursor:
+                after = (await cursor.fetchone())[0]
+        return before - after
+
+    async def storage_info(self) -> Dict[str, Any]:
+        async with self.reader() as db:
+            values = {}
+            for pragma in ("auto_vacuum", "page_count", "freelist_count", "page_size"):
+                async with db.execute(f"PRAGMA {pragma}") as cursor:
+                    values[pragma] = (await cursor.fetchone())[0]
+        return values
+
+    async def load_stats(self):
+        """Membaca counter persisten dan jumlah event per topic dari DB."""
+        stats = {}
+        topics = {}
+        async with self.reader() as db:
+            async with db.execute("SELECT stat_name, value FROM statistics") as cursor:
+                async for row in cursor:
+                    stats[row[0]] = row[1]
+
+            async with db.execute("SELECT topic, unique_count FROM topic_stats") as cursor:
+                async for row in cursor:
+                    topics[row[0]] = row[1]
+        return stats, topics
+
+    async def load_checkpoint(self) -> int:
+        """Checkpoint ingest log yang tersimpan (0 jika belum ada)."""
+        async with self.reader() as db:
+            async with db.execute("SELECT seq FROM ingest_checkpoint WHERE id = 1") as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistik dari counter in-memory (O(1), tanpa akses DB)."""
+        return self.counters.snapshot()
+
+    async def get_timeseries(
+        self,
+        since: datetime.datetime,
+        until: datetime.datetime,
+        bucket: str = "minute",
+        topic: Optional[str] = None,
+        source: Optional[str] = None,
+        group_by: Optional[str] = "topic"
+    ) -> List[Dict[str, Any]]:
+        """
+        Jumlah event unik dan duplikat per bucket waktu [since, until), hanya
+        dari event_rollups (tidak menyentuh tabel event). `group_by` "topic",
+        "source", atau None (total semua). Bucket tanpa event tidak dikirim.
+        """
+        bucket_minutes = TIMESERIES_BUCKETS[bucket] // 60
+        # Menit yang awalnya di [since, until): pembulatan ke atas keduanya
+        start = -(-datetime_to_ms(since) // 60000)
+        end = -(-datetime_to_ms(until) // 60000)
+        conditions, params = ["minute >= ?", "minute < ?"], [start, end]
+        if topic:
+            conditions.append("topic = ?")
+            params.append(topic)
+        if source:
+            conditions.append("source = ?")
+            params.append(source)
+        group_column = {"topic": "topic", "source": "source", None: "NULL"}[group_by]
+        query = (
+            f"SELECT minute / {bucket_minutes} * {bucket_minutes} AS bucket, {group_column}, "
+            "SUM(unique_count), SUM(duplicate_count) FROM event_rollups "
+            f"WHERE {' AND '.join(conditions)} GROUP BY 1, 2 ORDER BY 1, 2"
+        )
+        points = []
+        async with self.reader() as db:
+            async with db.execute(query, params) as cursor:
+                async for row in cursor:
+                    point = {"bucket": ms_to_datetime(row[0] * 60000), "unique": row[2], "duplicates": row[3]}
+                    if group_by:
+                        point[group_by] = row[1]
+                    points.append(point)
+        return points
+
+    async def load_payload_dictionaries(self):
+        async with self.reader() as db:
+            async with db.execute("SELECT id, codec, data FROM payload_dictionaries") as cursor:
+                self.codec.load_dictionaries(await cursor.fetchall())
+
+    async def decode_payloads(self, values: Sequence[Any]) -> List[Optional[str]]:
+        """Nilai kolom payload ke teks JSON; memuat ulang dictionary sekali jika ada yang baru."""
+        try:
+            return [self.codec.decode(value) for value in values]
+        except UnknownDictionary:
+            # Dilatih setelah koneksi ini dibuka (mis. oleh proses writer)
+            await self.load_payload_dictionaries()
+            return [self.codec.decode(value) for value in values]
+
+    async def train_payload_dictionary(self, samples: int = 2000, size: int = 16 * 1024) -> Optional[int]:
+        """
+        Melatih dictionary dari `samples` payload terbaru, menyimpannya, dan
+        langsung memakainya untuk insert berikutnya. None jika codec "none"
+        atau sampel tidak cukup untuk dictionary yang berguna.
+        """
+        if self.codec.codec == "none":
+            return None
+        values = []
+        async with self.reader() as db:
+            partitions = sorted(
+                await self.list_partitions(db), key=lambda p: -1 if p[2] is None else p[2], reverse=True
             )
-            await db.execute("UPDATE statistics SET value = value + 1 WHERE stat_name = 'unique_processed_total'")
-            await db.commit()
-            return True # Event baru
-            
-        except aiosqlite.IntegrityError:
-            await db.execute("UPDATE statistics SET value = value + 1 WHERE stat_name = 'duplicate_dropped_total'")
-            await db.commit()
-            return False # Duplikat terdeteksi
-        except Exception as e:
-            logging.error(f"Error storing event {event.event_id}: {e}")
-            await db.rollback()
-            return False
-
-async def update_received_count(count: int):
-    """Update statistik event yang diterima."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE statistics SET value = value + ? WHERE stat_name = 'received_total'", (count,))
-        await db.commit()
-
-async def get_stats() -> Dict[str, Any]:
-    """Mengambil statistik dari DB."""
-    stats = {}
-    topics = {}
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT stat_name, value FROM statistics") as cursor:
-            async for row in cursor:
-                stats[row[0]] = row[1]
-        
-        async with db.execute("SELECT topic, COUNT(*) FROM processed_events GROUP BY topic") as cursor:
-            async for row in cursor:
-                topics[row[0]] = row[1]
-                
-    stats["topics"] = topics
-    return stats
-
-async def get_events(topic: Optional[str] = None, limit: int = 100) -> List[Event]:
-    """Mengambil daftar event unik yang telah diproses."""
-    events = []
-    query = "SELECT topic, event_id, timestamp, source, payload FROM processed_events"
-    params = []
-    
-    if topic:
-        query += " WHERE topic = ?"
-        params.append(topic)
-        
-    query += " ORDER BY timestamp DESC LIMIT ?"
-    params.append(limit)
-    
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute(query, params) as cursor:
-            async for row in cursor:
-                event_data = {
-                    "topic": row[0],
-                    "event_id": row[1],
-                    "timestamp": row[2],
-                    "source": row[3],
-                    "payload": row[4] 
-                }
-                events.append(event_data)
-    return events
\ No newline at end of file
+            for name, _, _ in partitions:
+                order = "rowid" if is_legacy_table(name) else "ts"
+                query = f"SELECT payload FROM {name} ORDER BY {order} DESC LIMIT ?"
+                async with db.execute(query, (samples - len(values),)) as cursor:
+                    values.extend(row[0] for row in await cursor.fetchall())
+                if len(values) >= samples:
+                    break
+        texts = [text for text in await self.decode_payloads(values) if text]
+        data = train_dictionary([text.encode() for text in texts], size, self.codec.codec)
+        if len(data) < 64:
+            return None
+        async with self._write_lock:
+            async with self.writer.execute(
+                "INSERT INTO payload_dictionaries (codec, data) VALUES (?, ?)", (self.codec.codec, data)
+            ) as cursor:
+                dict_id = cursor.lastrowid
+            await self.writer.commit()
+        await self.load_payload_dictionaries()
+        logging.info(f"Trained payload dictionary {dict_id} ({len(data)} bytes) from {len(texts)} payloads.")
+        return dict_id
+
+    async def migrate_payloads(self, chunk_size: int = 1000) -> Dict[str, int]:
+        """
+        Menulis ulang payload TEXT lama (repr dict Python atau JSON tanpa
+        kompresi) dengan encoding saat ini, per chunk `chunk_size` baris
+        dalam transaksi pendek sehingga bisa dijalankan saat aggregator hidup.
+        Payload yang sudah BLOB dilewati. Ruang yang dibebaskan dikembalikan
+        lewat incremental vacuum (atau VACUUM manual untuk DB lama).
+        """
+        result = {"rows_scanned": 0, "rows_rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+        for name, _, _ in await self.list_partitions():
+            # Keyset per tabel: rowid di layout lama, primary key di layout ringkas
+            key, last = ("rowid", (0,)) if is_legacy_table(name) else ("topic_id, event_id", (0, ""))
+            placeholders = ", ".join("?" * len(last))
+            while True:
+                async with self._write_lock:
+                    db = self.writer
+                    try:
+                        async with db.execute(
+                            f"SELECT {key}, payload FROM {name} WHERE ({key}) > ({placeholders}) "
+                            f"AND typeof(payload) = 'text' ORDER BY {key} LIMIT ?",
+                            (*last, chunk_size)
+                        ) as cursor:
+                            rows = await cursor.fetchall()
+                        updates = []
+                        for row in rows:
+                            text = row[-1]
+                            encoded = self.codec.encode(normalize_legacy(text).encode())
+                            if encoded != text:
+                                updates.append((encoded, *row[:-1]))
+                                result["bytes_before"] += len(text.encode())
+                                result["bytes_after"] += len(encoded.encode() if isinstance(encoded, str) else encoded)
+                        if updates:
+                            await db.executemany(
+                                f"UPDATE {name} SET payload = ? WHERE ({key}) = ({placeholders})", updates
+                            )
+                        await db.commit()
+                    except Exception:
+                        await db.rollback()
+                        raise
+                if updates:
+                    self.commit_seq += 1
+                result["rows_scanned"] += len(rows)
+                result["rows_rewritten"] += len(updates)
+                if len(rows) < chunk_size:
+                    break
+                last = tuple(rows[-1][:-1])
+                # Beri kesempatan consumer mengambil write lock di antara chunk
+                await asyncio.sleep(0)
+        logging.info(f"Payload migration: {result}")
+        return result
+
+    @property
+    def needs_layout_migration(self) -> bool:
+        """Masih ada tabel layout lama (sisi writer; diisi saat open)."""
+        return self._legacy_dedup or any(is_legacy_table(name) for name in self._partitions)
+
+    async def migrate_legacy_layout(self, chunk_size: int = LAYOUT_MIGRATION_CHUNK_SIZE) -> Dict[str, int]:
+        """
+        Memindahkan isi tabel layout lama (dedup_store, processed_events, dan
+        partisi legacy_*) ke layout ringkas, per chunk `chunk_size` baris.
+        Setiap chunk menyisipkan ke tabel baru DAN menghapus dari tabel lama
+        dalam satu transaksi, jadi setiap snapshot reader melihat tiap baris
+        tepat sekali dan aggregator tetap melayani selama migrasi. Payload teks
+        lama sekalian dinormalkan ke JSON dan di-encode ulang. Tabel lama
+        di-drop setelah kosong.
+        """
+        result = {"dedup_keys_moved": 0, "events_moved": 0, "tables_dropped": 0}
+        if self._legacy_dedup:
+            while True:
+                moved = await self._migrate_chunk(LEGACY_DEDUP_TABLE, chunk_size, self._move_dedup_rows)
+                result["dedup_keys_moved"] += moved
+                if not moved:
+                    break
+                await asyncio.sleep(0)
+            result["tables_dropped"] += 1
+        for name in [name for name in sorted(self._partitions) if is_legacy_table(name)]:
+            while True:
+                moved = await self._migrate_chunk(name, chunk_size, self._move_event_rows)
+                result["events_moved"] += moved
+                if not moved:
+                    break
+                await asyncio.sleep(0)
+            result["tables_dropped"] += 1
+        logging.info(f"Legacy layout migration finished: {result}")
+        return result
+
+    async def _migrate_chunk(self, table: str, chunk_size: int, move) -> int:
+        """Satu transaksi migrasi; tabel lama di-drop jika sudah kosong. Jumlah baris dipindahkan."""
+        async with self._write_lock:
+            db = self.writer
+            try:
+                moved, last_rowid, names = await move(db, table, chunk_size)
+                if moved:
+                    await db.execute(f"DELETE FROM {table} WHERE rowid <= ?", (last_rowid,))
+                else:
+                    await db.execute("DELETE FROM event_partitions WHERE name = ?", (table,))
+                    await db.execute(f"DROP TABLE {table}")
+                await db.commit()
+            except BaseException:
+                # Termasuk CancelledError saat shutdown: jangan tinggalkan transaksi setengah jalan
+                await db.rollback()
+                raise
+            self._partitions.update(names.get("partitions", ()))
+            self.topics.remember(names.get("topics", {}))
+            self.sources.remember(names.get("sources", {}))
+            if not moved:
+                self._partitions.discard(table)
+                if table == LEGACY_DEDUP_TABLE:
+                    self._legacy_dedup = False
+            self.commit_seq += 1
+        return moved
+
+    async def _move_dedup_rows(self, db: aiosqlite.Connection, table: str, chunk_size: int):
+        async with db.execute(
+            f"SELECT rowid, event_id, topic, CAST(strftime('%s', processed_at) AS INTEGER) FROM {table} "
+            "ORDER BY rowid LIMIT ?",
+            (chunk_size,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        if not rows:
+            return 0, None, {}
+        topic_ids, new_topics = await self.topics.intern(db, {row[2] for row in rows})
+        await db.executemany(
+            "INSERT OR IGNORE INTO dedup_keys (topic_id, event_id, processed_at) VALUES (?, ?, ?)",
+            [(topic_ids[topic], event_id, processed_at or 0) for _, event_id, topic, processed_at in rows]
+        )
+        return len(rows), rows[-1][0], {"topics": new_topics}
+
+    async def _move_event_rows(self, db: aiosqlite.Connection, table: str, chunk_size: int):
+        async with db.execute(
+            f"SELECT rowid, {_LEGACY_COLUMNS}, payload FROM {table} ORDER BY rowid LIMIT ?", (chunk_size,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        if not rows:
+            return 0, None, {}
+        topic_ids, new_topics = await self.topics.intern(db, {row[1] or "" for row in rows})
+        source_ids, new_sources = await self.sources.intern(db, {row[4] or "" for row in rows})
+        converted = []
+        for _, topic, event_id, timestamp, source, payload in rows:
+            if isinstance(payload, str):
+                payload = self.codec.encode(normalize_legacy(payload).encode())
+            converted.append(
+                (topic_ids[topic or ""], event_id, db_timestamp_to_ms(timestamp), source_ids[source or ""], payload)
+            )
+        created = []
+        for target, target_rows in self._group_by_table(converted, timestamp_ms=lambda row: row[2]).items():
+            if target not in self._partitions:
+                await self._create_partition(target, target_rows[0][2])
+                created.append(target)
+            await db.executemany(_event_insert_sql(1, target), target_rows)
+        return len(rows), rows[-1][0], {"topics": new_topics, "sources": new_sources, "partitions": created}
+
+    async def iter_dedup_keys(self, recent_first: bool = False) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Semua key dedup (topic, event_id), termasuk dedup_store layout lama
+        yang belum dipindahkan; `recent_first` = urut processed_at terbaru dulu.
+        Pemanggil yang berhenti di tengah harus menutup iterator (`aclosing`).
+        """
+        queries = [
+            "SELECT t.name, d.event_id, d.processed_at FROM dedup_keys d JOIN topics t ON t.id = d.topic_id"
+        ]
+        if self._legacy_dedup:
+            queries.append(
+                f"SELECT topic, event_id, CAST(strftime('%s', processed_at) AS INTEGER) FROM {LEGACY_DEDUP_TABLE}"
+            )
+        query = " UNION ALL ".join(queries) + (" ORDER BY 3 DESC" if recent_first else "")
+        async with self.reader() as db:
+            async with db.execute(query) as cursor:
+                async for row in cursor:
+                    yield row[0], row[1]
+
+    async def list_partitions(self, conn: Optional[aiosqlite.Connection] = None) -> List[Tuple[str, Optional[int], Optional[int]]]:
+        """Isi katalog partisi: (nama, start_ts, end_ts) dalam epoch milidetik; batas None = tidak dibatasi."""
+        if conn is None:
+            async with self.reader() as conn:
+                return await self.list_partitions(conn)
+        async with conn.execute("SELECT name, start_ts, end_ts FROM event_partitions") as cursor:
+            # Katalog dari layout lama berafinitas TEXT, jadi nilainya dibaca sebagai teks angka
+            return [
+                (name, None if start is None else int(start), None if end is None else int(end))
+                for name, start, end in await cursor.fetchall()
+            ]
+
+    @staticmethod
+    def _prune(partitions, lower: Optional[int], upper: Optional[int], upper_inclusive: bool = False):
+        """Partisi yang rentangnya beririsan dengan [lower, upper)."""
+        result = []
+        for name, start_ts, end_ts in partitions:
+            if lower is not None and end_ts is not None and end_ts <= lower:
+                continue
+            if upper is not None and start_ts is not None and (
+                start_ts > upper if upper_inclusive else start_ts >= upper
+            ):
+                continue
+            result.append((name, start_ts, end_ts))
+        return result
+
+    def _table_query(
+        self,
+        name: str,
+        filters: Tuple[Optional[str], Optional[str], Optional[datetime.datetime], Optional[datetime.datetime]],
+        after: Optional[Tuple[int, str, int]],
+        descending: bool,
+        include_payload: bool = True
+    ) -> Tuple[str, List[Any]]:
+        """SELECT (dan parameternya) satu tabel event, urut (ts, event_id, topic_id)."""
+        legacy = is_legacy_table(name)
+        conditions, params = _event_filters(legacy, *filters)
+        if after:
+            cursor_ts, cursor_id, cursor_topic = after
+            if legacy:
+                conditions.append("(timestamp, event_id) < (?, ?)")
+                params.extend((ms_to_db_timestamp(cursor_ts), cursor_id))
+            elif filters[0]:
+                # Satu topic: topic_id konstan, index (topic_id, ts, event_id) tetap terpakai
+                conditions.append("(ts, event_id) < (?, ?)")
+                params.extend((cursor_ts, cursor_id))
+            else:
+                conditions.append("(ts, event_id, topic_id) < (?, ?, ?)")
+                params.extend((cursor_ts, cursor_id, cursor_topic))
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        direction = " DESC" if descending else ""
+        if legacy:
+            order = f"timestamp{direction}, event_id{direction}"
+        else:
+            order = f"ts{direction}, event_id{direction}, topic_id{direction}"
+        columns = _LEGACY_COLUMNS if legacy else _COMPACT_COLUMNS
+        payload = "payload" if include_payload else "NULL"
+        return f"SELECT {columns}, {payload} FROM {name}{where} ORDER BY {order}", params
+
+    def _normalize(self, name: str, row) -> Tuple:
+        """Baris tabel mana pun ke (ts, event_id, topic_id, topic, source_id, source, payload)."""
+        if is_legacy_table(name):
+            topic, event_id, timestamp, source, payload = row
+            return (db_timestamp_to_ms(timestamp), event_id, self.topics.ids.get(topic, 0), topic, None, source, payload)
+        topic_id, event_id, ts, source_id, payload = row
+        return (ts, event_id, topic_id, None, source_id, None, payload)
+
+    async def _names_of(self, row: Tuple) -> Tuple[str, str]:
+        """(topic, source) baris hasil `_normalize`; memuat ulang dictionary nama sekali jika ada id baru."""
+        _, _, topic_id, topic, source_id, source, _ = row
+        if topic is None:
+            topic = self.topics.names.get(topic_id)
+            source = self.sources.names.get(source_id)
+            if topic is None or source is None:
+                await self.load_names()
+                topic = self.topics.names.get(topic_id)
+                source = self.sources.names.get(source_id)
+        return topic, source
+
+    async def get_events(
+        self,
+        topic: Optional[str] = None,
+        limit: int = 100,
+        after: Optional[str] = None,
+        since: Optional[datetime.datetime] = None,
+        until: Optional[datetime.datetime] = None,
+        source: Optional[str] = None,
+        include_payload: bool = True
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Mengambil daftar event unik yang telah diproses, terbaru dulu, dengan
+        keyset pagination pada (timestamp, event_id, topic). Mengembalikan
+        (events, next_cursor); next_cursor None jika tidak ada halaman lagi.
+        `since` inklusif, `until` eksklusif. ValueError jika `after` tidak valid.
+
+        Partisi yang di luar rentang waktu (since/until/cursor) dilewati lewat
+        katalog; sisanya di-query dari yang terbaru dan berhenti begitu partisi
+        berikutnya pasti lebih tua dari `limit` baris yang sudah terkumpul.
+        Payload hanya dibaca dan didekode (dekompresi) jika `include_payload`,
+        dan hanya untuk baris yang benar-benar dikembalikan.
+        """
+        filters = (topic, source, since, until)
+        upper = datetime_to_ms(until) if until else None
+        upper_inclusive = False
+        cursor_key = None
+        if after:
+            cursor_key = decode_cursor(after)
+            if upper is None or cursor_key[0] < upper:
+                upper, upper_inclusive = cursor_key[0], True
+
+        rows: List[Tuple] = []
+        async with self.reader() as db:
+            partitions = self._prune(
+                await self.list_partitions(db), datetime_to_ms(since) if since else None, upper, upper_inclusive
+            )
+            # Partisi tanpa batas (tabel utama dan tabel lama) dulu, lalu yang paling baru
+            partitions = [p for p in partitions if p[2] is None] + sorted(
+                (p for p in partitions if p[2] is not None), key=lambda p: p[2], reverse=True
+            )
+            for name, _, end_ts in partitions:
+                if len(rows) >= limit and end_ts is not None and end_ts <= rows[limit - 1][0]:
+                    break
+                query, params = self._table_query(name, filters, cursor_key, True, include_payload)
+                try:
+                    async with db.execute(query + " LIMIT ?", params + [limit]) as cursor:
+                        rows.extend(self._normalize(name, row) for row in await cursor.fetchall())
+                except sqlite3.OperationalError as e:
+                    if not _is_missing_table(e):
+                        raise
+                    continue
+                if len(partitions) > 1:
+                    rows.sort(key=lambda row: row[:3], reverse=True)
+                    del rows[limit:]
+
+        events = []
+        for row in rows:
+            topic_name, source_name = await self._names_of(row)
+            events.append({
+                "topic": topic_name, "event_id": row[1], "timestamp": ms_to_db_timestamp(row[0]), "source": source_name
+            })
+        if include_payload:
+            payloads = await self.decode_payloads([row[6] for row in rows])
+            for event, payload in zip(events, payloads):
+                event["payload"] = payload
+        next_cursor = None
+        if len(rows) == limit:
+            last = rows[-1]
+            next_cursor = encode_cursor(last[0], last[1], last[2])
+        return events, next_cursor
+
+    async def iter_events(
+        self,
+        topic: Optional[str] = None,
+        since: Optional[datetime.datetime] = None,
+        until: Optional[datetime.datetime] = None,
+        source: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, str, str, str, str]]:
+        """
+        Men-stream baris (topic, event_id, timestamp, source, payload) terlama
+        dulu langsung dari cursor, tanpa menampung hasil di list. Memakai
+        koneksi read-only tersendiri agar export panjang tidak menghabiskan
+        pool reader; dengan WAL, export juga tidak memblok writer.
+
+        Seluruh export berjalan dalam satu transaksi baca (snapshot konsisten
+        walau partisi di-drop di tengah jalan). Partisi dibuka berurutan
+        menurut start_ts dan di-merge, jadi biasanya hanya satu cursor aktif.
+        """
+        filters = (topic, source, since, until)
+
+        conn = await self._open_reader()
+        try:
+            await conn.execute("BEGIN")
+            pending = self._prune(
+                await self.list_partitions(conn),
+                datetime_to_ms(since) if since else None,
+                datetime_to_ms(until) if until else None
+            )
+            pending.sort(key=lambda p: -1 if p[1] is None else p[1])
+            pending.reverse()  # pop() dari belakang = start_ts terkecil
+
+            async def rows_of(name: str):
+                query, params = self._table_query(name, filters, None, False)
+                async with conn.execute(query, params) as cursor:
+                    async for row in cursor:
+                        yield self._normalize(name, row)
+
+            heap: List[Tuple] = []
+
+            async def advance(index: int, stream):
+                row = await anext(stream, None)
+                if row is not None:
+                    heapq.heappush(heap, (row[:3], index, row, stream))
+
+            opened = 0
+            while pending or heap:
+                # Buka partisi yang mungkin berisi baris <= kepala heap saat ini
+                while pending and (not heap or pending[-1][1] is None or pending[-1][1] <= heap[0][0][0]):
+                    await advance(opened, rows_of(pending.pop()[0]))
+                    opened += 1
+                if heap:
+                    _, index, row, stream = heapq.heappop(heap)
+                    topic_name, source_name = await self._names_of(row)
+                    payload = row[6]
+                    if not isinstance(payload, str):
+                        payload = (await self.decode_payloads([payload]))[0]
+                    yield (topic_name, row[1], ms_to_db_timestamp(row[0]), source_name, payload)
+                    await advance(index, stream)
+            await conn.execute("COMMIT")
+        finally:
+            await conn.close()
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import math
+import os
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Jumlah key (topic, event_id) terbaru yang diingat secara exact.
+DEDUP_CACHE_SIZE = int(os.environ.get("DEDUP_CACHE_SIZE", "100000"))
+# Kapasitas Bloom filter; 0 = Bloom filter dimatikan.
+DEDUP_BLOOM_CAPACITY = int(os.environ.get("DEDUP_BLOOM_CAPACITY", "0"))
+DEDUP_BLOOM_ERROR_RATE = float(os.environ.get("DEDUP_BLOOM_ERROR_RATE", "0.001"))
+
+def cache_key(topic: str, event_id: str) -> str:
+    """Satu string per key lebih hemat memori daripada tuple dua string."""
+    return f"{topic}\x00{event_id}"
+
+class BloomFilter:
+    """Bloom filter sederhana berbasis bytearray dengan double hashing."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+class DedupCache:
+    """
+    Cache membership di depan `dedup_keys`.
+
+    - LRU exact berisi key yang SUDAH di-commit ke DB: hit = duplikat pasti,
+      bisa ditolak tanpa I/O ke SQLite.
+    - Bloom filter (opsional) hanya bersifat advisory: jawaban "mungkin ada"
+      tetap dikonfirmasi oleh primary key di DB, yang tetap menjadi sumber
+      kebenaran. Jika DB ternyata menerima event itu sebagai baru, dihitung
+      sebagai false positive.
+    """
+
+    def __init__(
+        self,
+        max_size: int = DEDUP_CACHE_SIZE,
+        bloom_capacity: int = DEDUP_BLOOM_CAPACITY,
+        bloom_error_rate: float = DEDUP_BLOOM_ERROR_RATE
+    ):
+        self.max_size = max_size
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self.bloom: Optional[BloomFilter] = (
+            BloomFilter(bloom_capacity, bloom_error_rate) if bloom_capacity > 0 else None
+        )
+        self.hits = 0
+        self.misses = 0
+        self.bloom_positives = 0
+        self.bloom_false_positives = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def is_known_duplicate(self, topic: str, event_id: str) -> bool:
+        """True jika key pasti sudah ada di DB (LRU hit)."""
+        if self.max_size <= 0:
+            return False
+        key = cache_key(topic, event_id)
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def _remember(self, key: str):
+        if self.max_size > 0:
+            self._lru[key] = None
+            self._lru.move_to_end(key)
+            if len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+        if self.bloom is not None:
+            self.bloom.add(key)
+
+    def record_committed(self, keys: List[Tuple[str, str]], results: List[Optional[bool]]):
+        """
+        Dipanggil SETELAH transaksi batch commit. `results` sejajar dengan `keys`:
+        True = baru, False = duplikat menurut DB, None = gagal disimpan (tidak diingat).
+        """
+        for (topic, event_id), is_new in zip(keys, results):
+            if is_new is None:
+                continue
+            key = cache_key(topic, event_id)
+            if self.bloom is not None and key in self.bloom:
+                self.bloom_positives += 1
+                if is_new:
+                    self.bloom_false_positives += 1
+            self._remember(key)
+
+    async def warm(self, db, accept: Optional[Callable[[str, str], bool]] = None):
+        """
+        Mengisi Bloom filter dari seluruh key dedup di DB dan LRU dari key terbaru.
+        `accept(topic, event_id)` membatasi key yang diambil (mis. hanya key milik satu shard).
+        """
+        recent = []
+        if self.bloom is not None:
+            async for topic, event_id in db.iter_dedup_keys():
+                if accept is None or accept(topic, event_id):
+                    self.bloom.add(cache_key(topic, event_id))
+        if self.max_size > 0:
+            async with aclosing(db.iter_dedup_keys(recent_first=True)) as keys:
+                async for topic, event_id in keys:
+                    if accept is None or accept(topic, event_id):
+                        recent.append(cache_key(topic, event_id))
+                        if len(recent) >= self.max_size:
+                            break
+        # Key hasil warm-up lebih tua dari key yang sudah dicatat consumer,
+        # jadi disisipkan di depan LRU (yang terbaru paling dekat ke belakang).
+        for key in recent:
+            if len(self._lru) >= self.max_size:
+                break
+            if key not in self._lru:
+                self._lru[key] = None
+                self._lru.move_to_end(key, last=False)
+        logger.info(f"Dedup cache warmed: {len(self._lru)} LRU keys, bloom={self.bloom is not None}.")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._lru),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bloom_positives": self.bloom_positives,
+            "bloom_false_positives": self.bloom_false_positives,
+        }
@@ -0,0 +1,41 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Tuple
+
+EXPORT_COLUMNS = ("topic", "event_id", "timestamp", "source", "payload")
+
+# Baris dikumpulkan sampai ukuran ini sebelum dikirim, supaya tidak ada satu
+# pesan ASGI per baris tetapi memori tetap konstan.
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+Row = Tuple[str, str, str, str, str]
+
+async def ndjson_lines(rows: AsyncIterator[Row]) -> AsyncIterator[bytes]:
+    """Satu objek JSON per baris untuk setiap event."""
+    chunk = []
+    size = 0
+    async for row in rows:
+        line = json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(chunk).encode()
+            chunk.clear()
+            size = 0
+    if chunk:
+        yield "".join(chunk).encode()
+
+async def csv_lines(rows: AsyncIterator[Row]) -> AsyncIterator[bytes]:
+    """CSV dengan baris header."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
@@ -0,0 +1,141 @@
+import datetime
+import json
+import os
+from typing import Any, Dict, List, Tuple, Union
+
+from .models import EventRecord, datetime_to_ms
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - dependensi opsional
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependensi opsional
+    orjson = None
+
+# Jika aktif, /publish dan /publish/stream memakai decoder cepat di modul ini
+# alih-alih validasi penuh pydantic `Event`.
+INGEST_FAST_PATH = os.environ.get("INGEST_FAST_PATH", "0").lower() in ("1", "true", "yes")
+
+# Decoder yang dipakai: msgspec (payload zero-copy), orjson, atau json bawaan.
+JSON_BACKEND = "msgspec" if msgspec is not None else "orjson" if orjson is not None else "json"
+
+class FastPathError(ValueError):
+    """Body tidak valid; `errors` berbentuk seperti `ValidationError.errors()` pydantic."""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__("; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in errors))
+        self._errors = errors
+
+    def errors(self) -> List[Dict[str, Any]]:
+        return self._errors
+
+def _error(loc: Tuple[Any, ...], msg: str) -> FastPathError:
+    return FastPathError([{"type": "value_error", "loc": loc, "msg": msg}])
+
+def _timestamp_ms(value: Any) -> int:
+    if isinstance(value, datetime.datetime):
+        return datetime_to_ms(value)
+    if isinstance(value, str):
+        return datetime_to_ms(datetime.datetime.fromisoformat(value))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Sama seperti pydantic: angka besar dianggap milidetik, selain itu detik
+        return int(value) if abs(value) > 2e10 else int(value * 1000)
+    raise ValueError("Input should be a valid datetime")
+
+# decode_publish(body) / decode_event(line) mendekode body /publish atau satu
+# baris NDJSON langsung ke `EventRecord` tanpa model pydantic. Validasi dibatasi
+# pada yang dibutuhkan dedup dan penyimpanan: tipe topic/event_id/source,
+# event_id tidak kosong, timestamp yang bisa dikonversi ke epoch ms, dan payload
+# berupa objek JSON. Keduanya melempar FastPathError jika input tidak valid.
+if msgspec is not None:
+    class _WireEvent(msgspec.Struct):
+        topic: str
+        event_id: str
+        timestamp: Union[datetime.datetime, int, float]
+        source: str
+        payload: msgspec.Raw
+
+    class _WirePublish(msgspec.Struct):
+        events: List[_WireEvent]
+
+    _event_decoder = msgspec.json.Decoder(_WireEvent)
+    _publish_decoder = msgspec.json.Decoder(_WirePublish)
+
+    def _records(events: List[Any], loc: Tuple[Any, ...]) -> List[EventRecord]:
+        records = []
+        for i, wire in enumerate(events):
+            if not wire.event_id:
+                raise _error(loc + (i, "event_id"), "String should have at least 1 character")
+            # Raw menunjuk langsung ke byte body request; cukup cek bahwa ini objek JSON
+            if bytes(memoryview(wire.payload)[:1]) != b"{":
+                raise _error(loc + (i, "payload"), "Input should be a valid dictionary")
+            try:
+                timestamp_ms = _timestamp_ms(wire.timestamp)
+            except (TypeError, ValueError) as e:
+                raise _error(loc + (i, "timestamp"), str(e))
+            records.append(EventRecord(wire.topic, wire.event_id, timestamp_ms, wire.source, wire.payload))
+        return records
+
+    def decode_publish(body: bytes) -> List[EventRecord]:
+        try:
+            request = _publish_decoder.decode(body)
+        except msgspec.DecodeError as e:
+            raise _error((), str(e))
+        return _records(request.events, ("events",))
+
+    def decode_event(line: bytes) -> EventRecord:
+        try:
+            wire = _event_decoder.decode(line)
+        except msgspec.DecodeError as e:
+            raise _error((), str(e))
+        return _records([wire], ())[0]
+
+else:
+    _loads = orjson.loads if orjson is not None else json.loads
+
+    def _dumps(value: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(value)
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+    def _record(item: Any, loc: Tuple[Any, ...]) -> EventRecord:
+        if not isinstance(item, dict):
+            raise _error(loc, "Input should be a valid dictionary")
+        values = []
+        for field in ("topic", "event_id", "source"):
+            value = item.get(field)
+            if not isinstance(value, str):
+                raise _error(loc + (field,), "Field required" if value is None else "Input should be a valid string")
+            values.append(value)
+        topic, event_id, source = values
+        if not event_id:
+            raise _error(loc + ("event_id",), "String should have at least 1 character")
+        payload = item.get("payload")
+        if not isinstance(payload, dict):
+            raise _error(loc + ("payload",), "Input should be a valid dictionary")
+        try:
+            timestamp_ms = _timestamp_ms(item.get("timestamp"))
+        except (TypeError, ValueError) as e:
+            raise _error(loc + ("timestamp",), str(e))
+        # Tanpa msgspec payload harus di-encode ulang (tidak zero-copy)
+        return EventRecord(topic, event_id, timestamp_ms, source, _dumps(payload))
+
+    def decode_publish(body: bytes) -> List[EventRecord]:
+        try:
+            request = _loads(body)
+        except ValueError as e:
+            raise _error((), f"Invalid JSON: {e}")
+        events = request.get("events") if isinstance(request, dict) else None
+        if not isinstance(events, list):
+            raise _error(("events",), "Input should be a valid list")
+        return [_record(item, ("events", i)) for i, item in enumerate(events)]
+
+    def decode_event(line: bytes) -> EventRecord:
+        try:
+            item = _loads(line)
+        except ValueError as e:
+            raise _error((), f"Invalid JSON: {e}")
+        return _record(item, ())
@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import os
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from pydantic import ValidationError
+from .admission import AdmissionController
+from .ingest_log import INGEST_LOG_DIR, IngestLog
+from .metrics import PIPELINE_METRICS, render_samples
+from .fastpath import FastPathError, decode_event
+from .models import Event, EventRecord
+from .pipeline import Pipeline
+from .retention import Compactor, RetentionPolicy
+
+logger = logging.getLogger(__name__)
+
+# Batas panjang satu baris NDJSON; baris yang lebih panjang ditolak tanpa di-buffer utuh.
+NDJSON_MAX_LINE_BYTES = int(os.environ.get("NDJSON_MAX_LINE_BYTES", str(1024 * 1024)))
+# Jumlah maksimum detail error per-baris yang dikembalikan di response.
+NDJSON_MAX_REPORTED_ERRORS = int(os.environ.get("NDJSON_MAX_REPORTED_ERRORS", "100"))
+
+class IngestBusy(Exception):
+    """
+    Batch ditolak utuh (tidak ada event yang masuk antrian). `reason`:
+    "queue_full", "overloaded", atau "rate_limited"; `retry_after` dalam detik.
+    """
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Batch rejected ({reason}), retry after {retry_after:.2f}s.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class IngestUnavailable(Exception):
+    """Backend ingest (mis. proses writer di mode multi-process) tidak bisa dihubungi."""
+
+class LocalIngest:
+    """
+    Backend ingest di proses yang sama: memasukkan event ke `Pipeline` dan
+    mencatat `received_total` in-memory. Dipakai langsung oleh mode single
+    process dan oleh proses writer di mode multi-process. Jika ingest log
+    aktif, event ditulis durable ke log SEBELUM masuk antrian.
+    """
+
+    def __init__(self, pipeline, counters, log=None, compactor=None, admission=None):
+        self.pipeline = pipeline
+        self.counters = counters
+        self.log = log
+        self.compactor = compactor
+        self.admission = admission or AdmissionController(pipeline)
+        # Migrasi layout lama ke layout ringkas yang berjalan di background (jika ada)
+        self.migration: Optional[asyncio.Task] = None
+
+    async def submit(self, events: Sequence[EventRecord], block: bool = False) -> int:
+        """
+        Memasukkan event ke antrian shard-nya. `block=False`: batch diterima
+        utuh atau ditolak utuh dengan IngestBusy (antrian penuh, consumer
+        tertinggal, atau rate limit source); `block=True`: menunggu sampai
+        rate limit dan antrian mengizinkan (backpressure).
+        """
+        # Counter in-memory; nilai persisten ditulis consumer bersama batch event-nya
+        if block:
+            await self.admission.wait_for_tokens(events)
+            if self.log is not None:
+                await self.log.append(events)
+            for event in events:
+                await self.pipeline.put(event)
+                self.counters.record_received(1)
+            return len(events)
+
+        admission = self.admission.admit(events)
+        if admission.rejection is not None:
+            raise IngestBusy(admission.rejection.reason, admission.rejection.retry_after)
+        try:
+            if self.log is not None:
+                await self.log.append(events)
+            # Tempat sudah direservasi, jadi tidak ada QueueFull di sini
+            for event in events:
+                self.pipeline.put_nowait(event)
+        finally:
+            admission.release()
+        self.counters.record_received(len(events))
+        return len(events)
+
+    async def replay(self, checkpoint: int) -> int:
+        """Memutar ulang record ingest log di atas checkpoint ke pipeline (saat startup)."""
+        replayed = 0
+        for event in self.log.replay(checkpoint):
+            await self.pipeline.put(event)
+            self.counters.record_received(1)
+            replayed += 1
+        return replayed
+
+    async def stop(self):
+        """Menghentikan migrasi layout dan compaction, menguras pipeline, lalu menutup ingest log."""
+        if self.migration is not None:
+            self.migration.cancel()
+            await asyncio.gather(self.migration, return_exceptions=True)
+        if self.compactor is not None:
+            await self.compactor.stop()
+        await self.pipeline.stop()
+        if self.log is not None:
+            await self.log.close()
+
+    async def data_version(self) -> List[int]:
+        """
+        Versi data untuk cache baca: [commit sequence writer, received_total].
+        Berubah setiap ada commit atau event baru diterima (yang terakhir
+        mengubah /stats sebelum di-commit).
+        """
+        return [self.pipeline.db.commit_seq, self.counters.received_total]
+
+    async def stats(self) -> Dict[str, Any]:
+        stats = self.counters.snapshot()
+        stats["dedup_cache"] = self.pipeline.dedup_cache_stats()
+        stats["shards"] = self.pipeline.shard_stats()
+        if self.log is not None:
+            stats["ingest_log"] = self.log.stats()
+        if self.compactor is not None:
+            stats["retention"] = self.compactor.stats()
+        stats["admission"] = self.admission.stats()
+        stats["payload_codec"] = self.pipeline.db.codec.stats()
+        return stats
+
+    async def metrics(self) -> List[str]:
+        """Metrik pipeline format Prometheus: histogram consumer/writer plus counter dan gauge saat ini."""
+        lines = PIPELINE_METRICS.render()
+        counters = self.counters
+        for name, value, documentation in (
+            ("aggregator_events_received_total", counters.received_total, "Event yang diterima ingest."),
+            ("aggregator_events_unique_total", counters.unique_processed_total, "Event unik yang di-commit."),
+            ("aggregator_events_duplicate_total", counters.duplicate_dropped_total, "Event duplikat yang dibuang."),
+        ):
+            lines += render_samples(name, "counter", documentation, [({}, value)])
+
+        shards = self.pipeline.shard_stats()
+        lines += render_samples(
+            "aggregator_queue_depth", "gauge", "Jumlah event di antrian per shard.",
+            [({"shard": str(s["shard"])}, s["queue_depth"]) for s in shards]
+        )
+        lines += render_samples(
+            "aggregator_queue_capacity", "gauge", "Kapasitas antrian per shard.",
+            [({"shard": str(s["shard"])}, s["queue_capacity"]) for s in shards]
+        )
+
+        admission = self.admission.stats()
+        lines += render_samples(
+            "aggregator_admission_rejected_total", "counter", "Event yang ditolak admission control per alasan.",
+            [({"reason": reason}, admission["rejected_total"].get(reason, 0))
+             for reason in ("queue_full", "overloaded", "rate_limited")]
+        )
+
+        cache = self.pipeline.dedup_cache_stats()
+        lines += render_samples("aggregator_dedup_cache_size", "gauge", "Jumlah key di LRU dedup cache.", [({}, cache["size"])])
+        for key in ("hits", "misses", "bloom_positives", "bloom_false_positives"):
+            lines += render_samples(
+                f"aggregator_dedup_cache_{key}_total", "counter", f"Dedup cache {key.replace('_', ' ')}.", [({}, cache[key])]
+            )
+
+        if self.log is not None:
+            log_stats = self.log.stats()
+            lines += render_samples("aggregator_ingest_log_pending", "gauge", "Record ingest log yang belum di-commit.", [({}, log_stats["pending"])])
+            lines += render_samples("aggregator_ingest_log_fsyncs_total", "counter", "Jumlah fsync ingest log.", [({}, log_stats["fsyncs_total"])])
+        return lines
+
+async def start_local_ingest(db) -> LocalIngest:
+    """
+    Menyalakan pipeline consumer (dan ingest log jika INGEST_LOG_DIR diset)
+    di atas `db`, lalu memutar ulang record log yang belum di-commit.
+    Compaction retensi ikut dijalankan jika ada aturan retensi yang aktif,
+    begitu juga migrasi online jika DB masih berisi tabel layout lama.
+    """
+    log = None
+    checkpoint = 0
+    if INGEST_LOG_DIR:
+        checkpoint = await db.load_checkpoint()
+        log = IngestLog(INGEST_LOG_DIR)
+        log.open(checkpoint)
+        db.ingest_log = log
+
+    pipeline = Pipeline(db)
+    pipeline.start()
+    compactor = None
+    policy = RetentionPolicy()
+    if policy.enabled:
+        compactor = Compactor(db, policy)
+        await compactor.start()
+    ingest = LocalIngest(pipeline, db.counters, log, compactor)
+    if db.needs_layout_migration:
+        logger.info("Legacy storage layout found; migrating to the compact layout in the background.")
+        ingest.migration = asyncio.create_task(db.migrate_legacy_layout())
+    if log is not None:
+        replayed = await ingest.replay(checkpoint)
+        if replayed:
+            logger.info(f"Replayed {replayed} event(s) from ingest log after checkpoint {checkpoint}.")
+    return ingest
+
+async def _decompressed(chunks: AsyncIterator[bytes], gzip: bool) -> AsyncIterator[bytes]:
+    if not gzip:
+        async for chunk in chunks:
+            yield chunk
+        return
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+async def ingest_ndjson(
+    chunks: AsyncIterator[bytes],
+    sink: Callable[[EventRecord], Awaitable[None]],
+    gzip: bool = False,
+    fast: bool = False
+) -> Dict[str, Any]:
+    """
+    Mem-parse body NDJSON secara bertahap: setiap baris divalidasi sebagai
+    `Event` (atau lewat decoder cepat jika `fast`) begitu lengkap lalu
+    diteruskan ke `sink` sebagai `EventRecord` (sink boleh menunggu, mis.
+    `queue.put`, sebagai backpressure). Body tidak pernah di-buffer utuh.
+    Nomor baris di `errors` dimulai dari 1; baris kosong dilewati.
+    """
+    accepted = 0
+    rejected = 0
+    errors: List[Dict[str, Any]] = []
+    line_no = 0
+    buffer = bytearray()
+    oversized = False
+
+    async def handle(line: bytes, too_long: bool):
+        nonlocal accepted, rejected, line_no
+        line_no += 1
+        if not too_long and not line.strip():
+            return
+        if too_long:
+            error = f"Line exceeds {NDJSON_MAX_LINE_BYTES} bytes"
+        else:
+            try:
+                event = decode_event(line) if fast else Event.model_validate_json(line).to_record()
+            except (ValidationError, FastPathError) as e:
+                error = "; ".join(
+                    f"{'.'.join(str(p) for p in err['loc']) or 'line'}: {err['msg']}" for err in e.errors()
+                )
+            else:
+                await sink(event)
+                accepted += 1
+                return
+        rejected += 1
+        if len(errors) < NDJSON_MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": error})
+
+    async for data in _decompressed(chunks, gzip):
+        start = 0
+        while True:
+            newline = data.find(b"\n", start)
+            if newline == -1:
+                if not oversized:
+                    buffer += data[start:]
+                    if len(buffer) > NDJSON_MAX_LINE_BYTES:
+                        oversized = True
+                        buffer.clear()
+                break
+            if not oversized:
+                buffer += data[start:newline]
+            await handle(bytes(buffer), oversized or len(buffer) > NDJSON_MAX_LINE_BYTES)
+            buffer.clear()
+            oversized = False
+            start = newline + 1
+
+    if buffer or oversized:
+        await handle(bytes(buffer), oversized)
+
+    return {
+        "accepted": accepted,
+        "rejected": rejected,
+        "errors": errors,
+        "errors_truncated": rejected > len(errors),
+    }
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .models import EventRecord
+
+logger = logging.getLogger(__name__)
+
+# Direktori ingest log; kosong = ingest log dimatikan.
+INGEST_LOG_DIR = os.environ.get("INGEST_LOG_DIR", "")
+# Ukuran maksimum satu segment sebelum pindah ke file baru.
+INGEST_LOG_SEGMENT_BYTES = int(os.environ.get("INGEST_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+# Jendela group commit: append yang datang dalam jendela ini berbagi satu fsync.
+INGEST_LOG_GROUP_COMMIT_MS = float(os.environ.get("INGEST_LOG_GROUP_COMMIT_MS", "2"))
+
+# Header record: panjang payload, CRC32 payload, nomor urut (seq).
+_RECORD_HEADER = struct.Struct(">IIQ")
+_SEGMENT_SUFFIX = ".log"
+
+def _segment_name(first_seq: int) -> str:
+    return f"{first_seq:020d}{_SEGMENT_SUFFIX}"
+
+def _read_records(path: str) -> Iterator[Tuple[int, int, bytes]]:
+    """Menghasilkan (offset_akhir, seq, payload) sampai record valid terakhir."""
+    with open(path, "rb") as f:
+        offset = 0
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            length, crc, seq = _RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset += _RECORD_HEADER.size + length
+            yield offset, seq, payload
+
+def _fsync_and_close(sync_fds: Iterable[int], close_fds: Iterable[int]):
+    for fd in sync_fds:
+        os.fsync(fd)
+    for fd in close_fds:
+        os.close(fd)
+
+class IngestLog:
+    """
+    Ingest log append-only berbasis segment. /publish menulis event ke sini
+    (dan menunggu fsync) sebelum membalas, sehingga event yang sudah di-ACK
+    tidak hilang walau proses crash sebelum consumer menulisnya ke SQLite.
+
+    Setiap record punya seq yang naik terus. Consumer menyimpan checkpoint
+    (seq tertinggi yang semua record di bawahnya sudah di-commit) di transaksi
+    SQLite yang sama dengan batch event-nya; saat startup, record dengan seq
+    di atas checkpoint diputar ulang ke pipeline, dan segment yang seluruhnya
+    di bawah checkpoint dihapus.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = INGEST_LOG_SEGMENT_BYTES,
+        group_commit_ms: float = INGEST_LOG_GROUP_COMMIT_MS
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.group_commit_ms = group_commit_ms
+        self._segments: List[Tuple[int, str]] = []  # (first_seq, path), terurut
+        self._fd: Optional[int] = None
+        self._segment_size = 0
+        self._next_seq = 1
+        self._synced_seq = 0
+        self._unsynced_fds: List[int] = []
+        self._sync_task: Optional[asyncio.Task] = None
+        self._pending: Set[int] = set()
+        self.fsyncs_total = 0
+        self.appended_total = 0
+
+    def open(self, checkpoint: int = 0):
+        """Memindai segment, memotong ekor record yang rusak (torn write), lalu siap append."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(_SEGMENT_SUFFIX):
+                self._segments.append((int(name[:-len(_SEGMENT_SUFFIX)]), os.path.join(self.directory, name)))
+
+        self._next_seq = checkpoint + 1
+        if self._segments:
+            first_seq, path = self._segments[-1]
+            valid_end = 0
+            last_seq = first_seq - 1
+            for valid_end, last_seq, _ in _read_records(path):
+                pass
+            if valid_end < os.path.getsize(path):
+                logger.warning(f"Truncating torn tail of ingest log segment {path} at {valid_end} bytes.")
+                os.truncate(path, valid_end)
+            self._next_seq = max(self._next_seq, last_seq + 1)
+            self._open_segment(path)
+        else:
+            self._rotate()
+        self._synced_seq = self._next_seq - 1
+
+    def _open_segment(self, path: str):
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segment_size = os.path.getsize(path)
+
+    def _rotate(self):
+        if self._fd is not None:
+            # fd lama baru ditutup setelah di-fsync oleh group commit berikutnya
+            self._unsynced_fds.append(self._fd)
+        path = os.path.join(self.directory, _segment_name(self._next_seq))
+        self._segments.append((self._next_seq, path))
+        self._open_segment(path)
+
+    def replay(self, checkpoint: int) -> Iterator[EventRecord]:
+        """Event dengan seq > checkpoint, berurutan, dengan `_log_seq` terisi."""
+        for _, path in self._segments:
+            for _, seq, payload in _read_records(path):
+                if seq > checkpoint:
+                    event = EventRecord.from_wire(json.loads(payload))
+                    event._log_seq = seq
+                    self._pending.add(seq)
+                    yield event
+
+    def _write(self, events: Sequence[EventRecord]) -> List[int]:
+        if self._segment_size >= self.segment_bytes:
+            self._rotate()
+        chunks = []
+        seqs = []
+        for event in events:
+            seq = self._next_seq
+            self._next_seq += 1
+            payload = json.dumps(event.to_wire(), separators=(",", ":")).encode()
+            chunks.append(_RECORD_HEADER.pack(len(payload), zlib.crc32(payload), seq))
+            chunks.append(payload)
+            event._log_seq = seq
+            seqs.append(seq)
+        data = b"".join(chunks)
+        # Satu write() per append; ke page cache sehingga murah, durabilitas dari fsync.
+        os.write(self._fd, data)
+        self._segment_size += len(data)
+        self._pending.update(seqs)
+        self.appended_total += len(seqs)
+        return seqs
+
+    async def _sync(self):
+        if self.group_commit_ms > 0:
+            await asyncio.sleep(self.group_commit_ms / 1000)
+        target = self._next_seq - 1
+        rotated, self._unsynced_fds = self._unsynced_fds, []
+        await asyncio.to_thread(_fsync_and_close, rotated + [self._fd], rotated)
+        self.fsyncs_total += 1
+        self._synced_seq = max(self._synced_seq, target)
+
+    async def append(self, events: Sequence[EventRecord]) -> List[int]:
+        """Menulis event dan menunggu sampai tersimpan durable (group commit)."""
+        if not events:
+            return []
+        seqs = self._write(events)
+        while self._synced_seq < seqs[-1]:
+            if self._sync_task is None or self._sync_task.done():
+                self._sync_task = asyncio.create_task(self._sync())
+            # shield: fsync tetap berjalan untuk appender lain walau yang ini dibatalkan
+            await asyncio.shield(self._sync_task)
+        return seqs
+
+    def watermark(self, exclude: Iterable[int] = ()) -> int:
+        """
+        Seq tertinggi yang semua record di bawahnya sudah selesai, jika record
+        di `exclude` (batch yang sedang di-commit) dianggap selesai.
+        """
+        remaining = self._pending.difference(exclude)
+        return min(remaining) - 1 if remaining else self._next_seq - 1
+
+    def discard(self, seqs: Iterable[int]):
+        """Record yang ditulis tetapi tidak jadi masuk antrian (mis. antrian penuh)."""
+        self._pending.difference_update(seqs)
+
+    def ack(self, seqs: Iterable[int], checkpoint: int):
+        """Dipanggil setelah commit; menghapus segment yang seluruhnya <= checkpoint."""
+        self._pending.difference_update(seqs)
+        while len(self._segments) > 1 and self._segments[1][0] - 1 <= checkpoint:
+            _, path = self._segments.pop(0)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    async def close(self):
+        if self._sync_task is not None:
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+        if self._fd is not None:
+            await asyncio.to_thread(_fsync_and_close, self._unsynced_fds + [self._fd], self._unsynced_fds + [self._fd])
+            self._fd = None
+            self._unsynced_fds = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segments": len(self._segments),
+            "pending": len(self._pending),
+            "next_seq": self._next_seq,
+            "appended_total": self.appended_total,
+            "fsyncs_total": self.fsyncs_total,
+        }
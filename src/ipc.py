@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from .ingest import IngestBusy, IngestUnavailable, LocalIngest
+from .models import EventRecord
+
+logger = logging.getLogger(__name__)
+
+# Unix socket tempat proses writer menerima event dari HTTP worker.
+INGEST_SOCKET = os.environ.get("INGEST_SOCKET", "/tmp/uts-aggregator.sock")
+# Jumlah koneksi IPC yang dibuka tiap HTTP worker ke proses writer.
+INGEST_IPC_CONNECTIONS = int(os.environ.get("INGEST_IPC_CONNECTIONS", "4"))
+
+_HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Any]:
+    """Membaca satu frame (panjang 4 byte big-endian + JSON). None jika koneksi ditutup."""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame too large: {length} bytes")
+    return json.loads(await reader.readexactly(length))
+
+def write_frame(writer: asyncio.StreamWriter, message: Any):
+    body = json.dumps(message, separators=(",", ":")).encode()
+    writer.write(_HEADER.pack(len(body)) + body)
+
+class IngestServer:
+    """Sisi proses writer: meneruskan permintaan dari HTTP worker ke `LocalIngest`."""
+
+    def __init__(self, ingest: LocalIngest, socket_path: str = INGEST_SOCKET):
+        self.ingest = ingest
+        self.socket_path = socket_path
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        logger.info(f"Ingest server listening on {self.socket_path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "submit":
+            events = [EventRecord.from_wire(item) for item in request["events"]]
+            try:
+                accepted = await self.ingest.submit(events, block=request.get("block", False))
+            except IngestBusy as e:
+                return {"error": "busy", "reason": e.reason, "retry_after": e.retry_after}
+            return {"accepted": accepted}
+        if op == "data_version":
+            return {"data_version": await self.ingest.data_version()}
+        if op == "stats":
+            return {"stats": await self.ingest.stats()}
+        if op == "metrics":
+            return {"metrics": await self.ingest.metrics()}
+        return {"error": f"unknown op: {op!r}"}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await read_frame(reader)
+                if request is None:
+                    break
+                try:
+                    response = await self._dispatch(request)
+                except Exception as e:
+                    logger.error(f"Error handling IPC request: {e}")
+                    response = {"error": str(e)}
+                write_frame(writer, response)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+class RemoteIngest:
+    """
+    Sisi HTTP worker: antarmuka sama dengan `LocalIngest`, tetapi event dikirim
+    lewat Unix socket ke proses writer yang memegang pipeline, dedup, dan
+    statistik. Satu koneksi hanya dipakai satu permintaan pada satu waktu.
+    """
+
+    def __init__(self, socket_path: str = INGEST_SOCKET, pool_size: int = INGEST_IPC_CONNECTIONS):
+        self.socket_path = socket_path
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max(1, pool_size))
+
+    @asynccontextmanager
+    async def _connection(self) -> AsyncIterator[tuple]:
+        async with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except asyncio.QueueEmpty:
+                try:
+                    conn = await asyncio.open_unix_connection(self.socket_path)
+                except OSError as e:
+                    raise IngestUnavailable(f"Writer process unreachable: {e}") from e
+            try:
+                yield conn
+            except BaseException:
+                # Koneksi dalam keadaan tidak jelas (mis. dibatalkan di tengah) — buang.
+                conn[1].close()
+                raise
+            else:
+                self._idle.put_nowait(conn)
+
+    async def _call(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._connection() as (reader, writer):
+            try:
+                write_frame(writer, request)
+                await writer.drain()
+                response = await read_frame(reader)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                raise IngestUnavailable(f"Writer process connection lost: {e}") from e
+            if response is None:
+                raise IngestUnavailable("Writer process closed the connection.")
+        if response.get("error") and response["error"] != "busy":
+            raise IngestUnavailable(f"Writer process error: {response['error']}")
+        return response
+
+    async def submit(self, events: Sequence[EventRecord], block: bool = False) -> int:
+        response = await self._call({
+            "op": "submit",
+            "block": block,
+            "events": [event.to_wire() for event in events],
+        })
+        if response.get("error") == "busy":
+            raise IngestBusy(response["reason"], response["retry_after"])
+        return response["accepted"]
+
+    async def data_version(self) -> List[int]:
+        return (await self._call({"op": "data_version"}))["data_version"]
+
+    async def stats(self) -> Dict[str, Any]:
+        return (await self._call({"op": "stats"}))["stats"]
+
+    async def metrics(self) -> List[str]:
+        return (await self._call({"op": "metrics"}))["metrics"]
+
+    async def close(self):
+        while not self._idle.empty():
+            _, writer = self._idle.get_nowait()
+            writer.close()
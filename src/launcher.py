@@ -0,0 +1,51 @@
+import argparse
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import uvicorn
+
+from .ipc import INGEST_SOCKET
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def wait_for_socket(path: str, timeout: float = 30.0) -> bool:
+    """Menunggu sampai proses writer menerima koneksi di Unix socket."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(path)
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def main(argv=None):
+    """
+    Menjalankan mode multi-process: satu proses writer (`python -m src.writer`)
+    dan beberapa HTTP worker uvicorn yang meneruskan event ke writer itu.
+    """
+    parser = argparse.ArgumentParser(description="Run the aggregator with multiple HTTP workers.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+
+    os.environ["INGEST_MODE"] = "multi"
+    writer = subprocess.Popen([sys.executable, "-m", "src.writer"])
+    try:
+        if not wait_for_socket(INGEST_SOCKET):
+            raise SystemExit(f"Writer process did not open {INGEST_SOCKET}")
+        logger.info(f"Writer ready, starting {args.workers} HTTP worker(s)...")
+        uvicorn.run("src.main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        writer.terminate()
+        writer.wait()
+
+if __name__ == "__main__":
+    main()
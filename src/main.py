@@ -1,16 +1,41 @@
 import asyncio
+import datetime
+import json
+import os
 import time
 import logging
+import zlib
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks, Query
-from typing import List, Optional
+from fastapi import APIRouter, FastAPI, Request, Response, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import ValidationError
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Tuple
 
-from .models import PublishRequest, Event, StatsResponse
-from .database import init_db, update_received_count, get_stats, get_events
-from .consumer import event_consumer
+from . import fastpath
+from .fastpath import FastPathError, decode_publish
+from .admission import retry_after_header
+from .models import EventRecord, PublishRequest, StatsResponse
+from .database import TIMESERIES_BUCKETS, Database
+from .ingest import IngestBusy, IngestUnavailable, ingest_ndjson, start_local_ingest
+from .ipc import RemoteIngest
+from .export import ndjson_lines, csv_lines
+from .metrics import HTTP_METRICS, PUBLISH_LATENCY, render_samples, render_text
+from .read_cache import ReadCache, etag_matches
 
 START_TIME = time.time()
 
+# "single": satu proses memegang antrian, consumer, dan writer.
+# "multi": proses ini hanya HTTP worker; event diteruskan ke proses writer
+# (lihat src/writer.py dan src/launcher.py) lewat Unix socket.
+INGEST_MODE = os.environ.get("INGEST_MODE", "single")
+# Jumlah baris NDJSON yang dikumpulkan sebelum diserahkan ke backend ingest.
+STREAM_SUBMIT_BATCH = 256
+# Ukuran maksimum body /publish setelah didekompresi (melindungi dari gzip bomb).
+PUBLISH_MAX_BODY_BYTES = int(os.environ.get("PUBLISH_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -18,73 +43,331 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """Mengelola startup dan shutdown event."""
     logger.info("Starting up...")
+    # Cache response baca (/stats, /events) per proses HTTP
+    app.state.read_cache = ReadCache()
     
-    app.state.event_queue = asyncio.Queue(maxsize=10000)
-    
-    # --- KEMBALIKAN BARIS INI ---
-    # Ini penting untuk Docker dan juga aman untuk tes
-    await init_db()
-    
-    consumer_task = asyncio.create_task(event_consumer(app.state.event_queue))
+    if INGEST_MODE == "multi":
+        # HTTP worker: hanya reader untuk /events; event, dedup, dan statistik
+        # dipegang proses writer.
+        app.state.db = Database(read_only=True)
+        await app.state.db.open()
+        app.state.pipeline = None
+        app.state.ingest = RemoteIngest()
+    else:
+        # Storage layer: satu writer (WAL) + pool reader. open() juga membuat skema,
+        # jadi ini penting untuk Docker dan juga aman untuk tes.
+        app.state.db = Database()
+        await app.state.db.open()
+        
+        # Consumer ter-shard, masing-masing dengan antrian bounded dan dedup cache
+        # sendiri di depan dedup_keys. Warm-up cache berjalan di background
+        # karena DB tetap menjadi sumber kebenaran selama cache belum terisi.
+        # Jika INGEST_LOG_DIR diset, event yang belum di-commit diputar ulang di sini.
+        app.state.ingest = await start_local_ingest(app.state.db)
+        app.state.pipeline = app.state.ingest.pipeline
     
     yield
     
     logger.info("Shutting down...")
-    consumer_task.cancel()
-    try:
-        await consumer_task
-    except asyncio.CancelledError:
-        logger.info("Consumer task successfully cancelled.")
+    if app.state.pipeline is not None:
+        # Kosongkan semua antrian shard dulu, baru hentikan consumer
+        await app.state.ingest.stop()
+    else:
+        await app.state.ingest.close()
+    await app.state.db.close()
+
+class TimedRoute(APIRoute):
+    """Route yang mencatat latency handler (termasuk parsing dan validasi body) ke PUBLISH_LATENCY."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        histogram = PUBLISH_LATENCY.labels(self.path)
+
+        async def timed_handler(request: Request) -> Response:
+            started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return timed_handler
 
 app = FastAPI(
     title="UTS Log Aggregator",
     description="Implementasi Pub-Sub Aggregator dengan Idempotency dan Deduplikasi",
     lifespan=lifespan
 )
+publish_router = APIRouter(route_class=TimedRoute)
+
+def _inline_schema(model) -> Dict[str, Any]:
+    """JSON schema model dengan $defs di-inline, untuk requestBody di OpenAPI."""
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(defs[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(item) for item in node]
+        return node
+
+    return resolve(schema)
+
+def parse_publish_body(body: bytes) -> List[EventRecord]:
+    """
+    Body /publish ke `EventRecord`: lewat decoder cepat jika INGEST_FAST_PATH
+    aktif, selain itu validasi penuh `PublishRequest`. Error validasi
+    dilaporkan sebagai 422 dengan format yang sama seperti FastAPI.
+    """
+    try:
+        if fastpath.INGEST_FAST_PATH:
+            return decode_publish(body)
+        return [event.to_record() for event in PublishRequest.model_validate_json(body).events]
+    except (ValidationError, FastPathError) as e:
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors()])
 
-@app.post("/publish")
-async def publish_events(body: PublishRequest, request: Request, background_tasks: BackgroundTasks):
+def decode_publish_body(body: bytes, encoding: str) -> bytes:
+    """Body /publish sesuai `Content-Encoding` (identity atau gzip)."""
+    encoding = encoding.strip().lower() or "identity"
+    if encoding == "identity":
+        return body
+    if encoding != "gzip":
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+    decompressor = zlib.decompressobj(wbits=31)
+    try:
+        decoded = decompressor.decompress(body, PUBLISH_MAX_BODY_BYTES)
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+    if decompressor.unconsumed_tail:
+        raise HTTPException(status_code=413, detail="Decompressed body too large.")
+    if not decompressor.eof:
+        raise HTTPException(status_code=400, detail="Invalid gzip body: truncated stream")
+    return decoded
+
+@publish_router.post("/publish", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _inline_schema(PublishRequest)}},
+    }
+})
+async def publish_events(request: Request):
     """
     Endpoint untuk menerima (publish) satu atau lebih event.
     Bersifat asynchronous, merespon cepat, dan memproses di background.
+    Body boleh dikompres dengan `Content-Encoding: gzip`.
     """
-    events_received = len(body.events)
+    body = decode_publish_body(await request.body(), request.headers.get("content-encoding", "identity"))
+    events = parse_publish_body(body)
+    events_received = len(events)
     
     if events_received == 0:
         raise HTTPException(status_code=400, detail="No events provided")
     
-    queue = request.app.state.event_queue
+    try:
+        await request.app.state.ingest.submit(events)
+    except IngestBusy as e:
+        # Batch ditolak utuh; client boleh mengirim ulang seluruhnya setelah Retry-After
+        retry_after = retry_after_header(e.retry_after)
+        if e.reason == "rate_limited":
+            raise HTTPException(
+                status_code=429, detail="Rate limit exceeded for source.", headers={"Retry-After": retry_after}
+            )
+        raise HTTPException(
+            status_code=503, detail=f"Service busy ({e.reason}), batch not accepted.", headers={"Retry-After": retry_after}
+        )
+    except IngestUnavailable as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=503, detail="Ingest backend unavailable.")
     
-    for event in body.events:
-        try:
-            queue.put_nowait(event)
-        except asyncio.QueueFull:
-            logger.error("Internal queue is full. Dropping event.")
-            raise HTTPException(status_code=503, detail="Service busy, queue is full.")
+    return {"message": f"Queued {events_received} events for processing."}
+
+@publish_router.post("/publish/stream")
+async def publish_stream(request: Request):
+    """
+    Endpoint bulk ingest NDJSON (`application/x-ndjson`, boleh dengan
+    `Content-Encoding: gzip`). Setiap baris divalidasi dan dimasukkan ke
+    antrian begitu tiba; jika antrian penuh, pembacaan body ditahan
+    (backpressure) alih-alih mengembalikan 503.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in ("application/x-ndjson", "application/jsonl"):
+        raise HTTPException(status_code=415, detail="Expected application/x-ndjson body.")
+    encoding = request.headers.get("content-encoding", "identity").strip().lower()
+    if encoding not in ("identity", "gzip"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
     
-    background_tasks.add_task(update_received_count, events_received)
+    ingest = request.app.state.ingest
+    pending: List[EventRecord] = []
     
-    return {"message": f"Queued {events_received} events for processing."}
+    async def enqueue(event: EventRecord):
+        pending.append(event)
+        if len(pending) >= STREAM_SUBMIT_BATCH:
+            await ingest.submit(pending, block=True)
+            pending.clear()
+    
+    try:
+        summary = await ingest_ndjson(
+            request.stream(), enqueue, gzip=(encoding == "gzip"), fast=fastpath.INGEST_FAST_PATH
+        )
+        if pending:
+            await ingest.submit(pending, block=True)
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+    except IngestUnavailable as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=503, detail="Ingest backend unavailable.")
+    
+    return summary
+
+app.include_router(publish_router)
+
+async def cached_json(request: Request, compute: Callable[[], Awaitable[Tuple[Any, Dict[str, str]]]]) -> Response:
+    """
+    Response JSON lewat cache baca, di-key dengan path + parameter query dan
+    diberi versi data writer (commit sequence + received_total). `compute()` mengembalikan (isi,
+    header tambahan) dan hanya dipanggil jika cache meleset. Jika
+    `If-None-Match` cocok dengan ETag, dibalas 304 tanpa body.
+    """
+    try:
+        version = tuple(await request.app.state.ingest.data_version())
+    except IngestUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def render():
+        content, headers = await compute()
+        # Serialisasi sama seperti JSONResponse bawaan
+        body = json.dumps(
+            jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+        return body, headers
+
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    entry = await request.app.state.read_cache.get(key, version, render)
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
 
 @app.get("/events", response_model=List[dict])
 async def get_processed_events(
+    request: Request,
     topic: Optional[str] = Query(None, description="Filter by topic"),
-    limit: int = Query(100, ge=1, le=1000, description="Limit number of results")
+    limit: int = Query(100, ge=1, le=1000, description="Limit number of results"),
+    after: Optional[str] = Query(None, description="Cursor dari header X-Next-Cursor halaman sebelumnya"),
+    since: Optional[datetime.datetime] = Query(None, description="Timestamp minimum (inklusif)"),
+    until: Optional[datetime.datetime] = Query(None, description="Timestamp maksimum (eksklusif)"),
+    source: Optional[str] = Query(None, description="Filter by source"),
+    include_payload: bool = Query(True, description="false = tanpa payload (tidak didekompres)")
 ):
-    """Mengembalikan daftar event unik yang telah diproses dari DB."""
-    events = await get_events(topic=topic, limit=limit)
-    return events
+    """
+    Mengembalikan daftar event unik yang telah diproses dari DB, terbaru dulu.
+    Jika masih ada halaman berikutnya, cursor-nya dikirim di header X-Next-Cursor.
+    Hasil di-cache sampai ada commit baru (lihat `cached_json`).
+    """
+    async def compute():
+        try:
+            events, next_cursor = await request.app.state.db.get_events(
+                topic=topic, limit=limit, after=after, since=since, until=until, source=source,
+                include_payload=include_payload
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return events, {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    return await cached_json(request, compute)
+
+@app.get("/events/export")
+async def export_events(
+    request: Request,
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="Format output"),
+    topic: Optional[str] = Query(None, description="Filter by topic"),
+    since: Optional[datetime.datetime] = Query(None, description="Timestamp minimum (inklusif)"),
+    until: Optional[datetime.datetime] = Query(None, description="Timestamp maksimum (eksklusif)"),
+    source: Optional[str] = Query(None, description="Filter by source")
+):
+    """
+    Men-stream SEMUA event yang cocok (terlama dulu) sebagai NDJSON atau CSV,
+    langsung dari cursor DB tanpa batas jumlah baris.
+    """
+    rows = request.app.state.db.iter_events(topic=topic, since=since, until=until, source=source)
+    if format == "csv":
+        return StreamingResponse(
+            csv_lines(rows),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="events.csv"'}
+        )
+    return StreamingResponse(ndjson_lines(rows), media_type="application/x-ndjson")
 
 @app.get("/stats", response_model=StatsResponse)
-async def get_system_stats():
-    """Mengembalikan statistik operasional dari sistem (persisten)."""
-    uptime = time.time() - START_TIME
-    db_stats = await get_stats()
-    
-    return StatsResponse(
-        uptime_seconds=uptime,
-        **db_stats
-    )
+async def get_system_stats(request: Request):
+    """
+    Mengembalikan statistik operasional dari sistem (in-memory, persisten per batch).
+    Di-cache paling lama READ_CACHE_TTL detik atau sampai ada commit baru.
+    """
+    async def compute():
+        uptime = time.time() - START_TIME
+        try:
+            stats = await request.app.state.ingest.stats()
+        except IngestUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        return StatsResponse(uptime_seconds=uptime, **stats), {}
+
+    return await cached_json(request, compute)
+
+@app.get("/stats/timeseries")
+async def get_stats_timeseries(
+    request: Request,
+    bucket: Literal["minute", "hour", "day"] = Query("minute", description="Resolusi bucket waktu"),
+    since: Optional[datetime.datetime] = Query(None, description="Awal rentang (inklusif); default 60 bucket sebelum `until`"),
+    until: Optional[datetime.datetime] = Query(None, description="Akhir rentang (eksklusif); default sekarang"),
+    topic: Optional[str] = Query(None, description="Filter by topic"),
+    source: Optional[str] = Query(None, description="Filter by source"),
+    group_by: Literal["topic", "source", "none"] = Query("topic", description="Dimensi per titik data")
+):
+    """
+    Jumlah event unik dan duplikat per bucket waktu (berdasarkan timestamp
+    event), hanya dari tabel rollup sehingga aman di-poll dashboard.
+    """
+    # Timestamp tanpa zona waktu dianggap UTC, sama seperti /events
+    if until is None:
+        until = datetime.datetime.now(datetime.timezone.utc)
+    elif until.tzinfo is None:
+        until = until.replace(tzinfo=datetime.timezone.utc)
+    if since is None:
+        since = until - datetime.timedelta(seconds=60 * TIMESERIES_BUCKETS[bucket])
+    elif since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="`since` must be earlier than `until`.")
+
+    async def compute():
+        points = await request.app.state.db.get_timeseries(
+            since, until, bucket=bucket, topic=topic, source=source,
+            group_by=None if group_by == "none" else group_by
+        )
+        return {"bucket": bucket, "since": since, "until": until, "points": points}, {}
+
+    return await cached_json(request, compute)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    """
+    Metrik format teks Prometheus: latency handler publish (proses ini) dan
+    metrik pipeline (antrian, batch, commit, dedup cache) dari backend ingest.
+    """
+    lines = HTTP_METRICS.render()
+    cache = request.app.state.read_cache.stats()
+    for key in ("hits", "misses"):
+        lines += render_samples(
+            f"aggregator_read_cache_{key}_total", "counter", f"Read cache {key} (/stats, /events).", [({}, cache[key])]
+        )
+    try:
+        lines += await request.app.state.ingest.metrics()
+    except IngestUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return PlainTextResponse(render_text(lines), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 def read_root():
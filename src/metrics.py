@@ -0,0 +1,134 @@
+import bisect
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Bucket default (detik) untuk histogram latency.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Bucket untuk jumlah event per batch consumer.
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "bucket_counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Sequence[float]):
+        self.upper_bounds = upper_bounds
+        self.bucket_counts = [0] * len(upper_bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        # Satu bisect + dua penjumlahan; bucket kumulatif baru dihitung saat render
+        self.bucket_counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram:
+    """
+    Histogram bergaya Prometheus dengan bucket tetap. Semua update terjadi di
+    event loop tanpa `await`, jadi tidak perlu lock (sama seperti StatsCounters).
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.upper_bounds = tuple(sorted(buckets)) + (math.inf,)
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+        if not self.labelnames:
+            self._children[()] = _HistogramChild(self.upper_bounds)
+
+    def labels(self, *values: str) -> _HistogramChild:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _HistogramChild(self.upper_bounds)
+        return child
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds, child.bucket_counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+class Registry:
+    """Kumpulan histogram yang dirender bersama dalam satu scrape."""
+
+    def __init__(self):
+        self._histograms: List[Histogram] = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        histogram = Histogram(*args, **kwargs)
+        self._histograms.append(histogram)
+        return histogram
+
+    def render(self) -> List[str]:
+        lines: List[str] = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+        return lines
+
+def render_samples(
+    name: str,
+    kind: str,
+    documentation: str,
+    samples: Iterable[Tuple[Dict[str, str], float]]
+) -> List[str]:
+    """Merender counter/gauge yang nilainya sudah ada di tempat lain (StatsCounters, Shard, DedupCache)."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+    return lines
+
+def render_text(lines: Iterable[str]) -> str:
+    return "\n".join(lines) + "\n"
+
+# Metrik sisi HTTP (dicatat di proses yang melayani request).
+HTTP_METRICS = Registry()
+PUBLISH_LATENCY = HTTP_METRICS.histogram(
+    "aggregator_publish_duration_seconds",
+    "Latency handler publish, dari request diterima sampai response.",
+    labelnames=("endpoint",)
+)
+
+# Metrik sisi pipeline (dicatat di proses yang memegang consumer/writer).
+PIPELINE_METRICS = Registry()
+QUEUE_WAIT = PIPELINE_METRICS.histogram(
+    "aggregator_queue_wait_seconds",
+    "Waktu event menunggu di antrian shard sebelum diambil consumer."
+)
+BATCH_COMMIT_LATENCY = PIPELINE_METRICS.histogram(
+    "aggregator_batch_commit_duration_seconds",
+    "Latency transaksi batch di writer SQLite (termasuk menunggu write lock)."
+)
+BATCH_EVENTS = PIPELINE_METRICS.histogram(
+    "aggregator_batch_events",
+    "Jumlah event per batch consumer.",
+    buckets=BATCH_SIZE_BUCKETS
+)
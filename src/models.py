@@ -1,6 +1,52 @@
 import datetime
+import json
 from pydantic import BaseModel, Field
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MILLISECOND = datetime.timedelta(milliseconds=1)
+
+def datetime_to_ms(value: datetime.datetime) -> int:
+    """Epoch milidetik (UTC); timestamp tanpa zona waktu dianggap UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return (value - _EPOCH) // _MILLISECOND
+
+def ms_to_datetime(value: int) -> datetime.datetime:
+    return _EPOCH + datetime.timedelta(milliseconds=value)
+
+class EventRecord:
+    """
+    Representasi internal event yang ringkas: inilah yang masuk antrian,
+    ingest log, dan writer. `payload` adalah byte JSON mentah (bytes atau
+    objek buffer lain, mis. msgspec.Raw yang menunjuk langsung ke body
+    request) dan disimpan apa adanya.
+    """
+    __slots__ = ("topic", "event_id", "timestamp_ms", "source", "payload", "_log_seq", "_enqueued_at")
+
+    def __init__(self, topic: str, event_id: str, timestamp_ms: int, source: str, payload):
+        self.topic = topic
+        self.event_id = event_id
+        self.timestamp_ms = timestamp_ms
+        self.source = source
+        self.payload = payload
+        # Nomor urut record di ingest log (jika aktif).
+        self._log_seq: Optional[int] = None
+        # Waktu (time.monotonic) event masuk antrian shard, untuk metrik queue wait.
+        self._enqueued_at = 0.0
+
+    def payload_text(self) -> str:
+        return str(self.payload, "utf-8")
+
+    def to_wire(self) -> List[Any]:
+        """Representasi ringkas (list JSON) untuk IPC dan ingest log."""
+        return [self.topic, self.event_id, self.timestamp_ms, self.source, self.payload_text()]
+
+    @classmethod
+    def from_wire(cls, data: Sequence[Any]) -> "EventRecord":
+        # Event di wire sudah pernah divalidasi, jadi cukup dirakit kembali.
+        topic, event_id, timestamp_ms, source, payload = data
+        return cls(topic, event_id, timestamp_ms, source, payload.encode())
 
 class Event(BaseModel):
     """Model data untuk satu event log."""
@@ -10,6 +56,15 @@ class Event(BaseModel):
     source: str
     payload: Dict[str, Any]
 
+    def to_record(self) -> EventRecord:
+        return EventRecord(
+            self.topic,
+            self.event_id,
+            datetime_to_ms(self.timestamp),
+            self.source,
+            json.dumps(self.payload, separators=(",", ":"), ensure_ascii=False).encode()
+        )
+
 class PublishRequest(BaseModel):
     """Model untuk request body di /publish."""
     events: List[Event]
@@ -24,4 +79,9 @@ class StatsResponse(BaseModel):
     received_total: int
     unique_processed_total: int
     duplicate_dropped_total: int
-    topics: Dict[str, int]
\ No newline at end of file
+    topics: Dict[str, int]
+    dedup_cache: Optional[Dict[str, int]] = None
+    shards: Optional[List[Dict[str, Any]]] = None
+    ingest_log: Optional[Dict[str, int]] = None
+    retention: Optional[Dict[str, Any]] = None
+    admission: Optional[Dict[str, Any]] = None
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+Encoding kolom `payload` di tabel event.
+
+Payload disimpan sebagai JSON ringkas. Payload kecil tetap TEXT (bisa dibaca
+langsung dengan fungsi JSON SQLite); payload di atas ambang disimpan sebagai
+BLOB terkompresi dengan satu byte tag di depan:
+
+    0x01  zlib
+    0x02  zstd (jika paket `zstandard` terpasang)
+    0x03  zlib dengan dictionary   (+ 2 byte id dictionary)
+    0x04  zstd dengan dictionary   (+ 2 byte id dictionary)
+
+Dictionary dilatih dari sampel payload yang sudah tersimpan dan disimpan di
+tabel `payload_dictionaries`, sehingga payload kecil yang mirip satu sama lain
+(key JSON yang sama) tetap bisa dikompres. Dictionary tidak pernah dihapus
+karena baris lama masih merujuk id-nya.
+
+CLI:
+    python -m src.payload_codec train [--db PATH] [--samples N] [--size BYTES]
+    python -m src.payload_codec migrate [--db PATH] [--chunk N]
+"""
+import argparse
+import ast
+import asyncio
+import json
+import logging
+import os
+import re
+import struct
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependensi opsional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Kompresi payload: "zlib", "zstd" (butuh paket zstandard), atau "none".
+PAYLOAD_CODEC = os.environ.get("PAYLOAD_CODEC", "zlib").lower()
+# Payload (byte JSON) sepanjang ini atau lebih dikompres tanpa dictionary.
+PAYLOAD_COMPRESS_MIN_BYTES = int(os.environ.get("PAYLOAD_COMPRESS_MIN_BYTES", "512"))
+# Ambang yang lebih rendah jika dictionary aktif (payload kecil ikut dikompres).
+PAYLOAD_DICT_MIN_BYTES = int(os.environ.get("PAYLOAD_DICT_MIN_BYTES", "64"))
+# Pakai dictionary terbaru dari payload_dictionaries jika ada ("0" = tidak).
+PAYLOAD_USE_DICT = os.environ.get("PAYLOAD_USE_DICT", "1").lower() in ("1", "true", "yes")
+
+TAG_ZLIB = 1
+TAG_ZSTD = 2
+TAG_ZLIB_DICT = 3
+TAG_ZSTD_DICT = 4
+
+_DICT_ID = struct.Struct(">H")
+# zlib hanya melihat 32 KiB terakhir, jadi dictionary yang lebih besar sia-sia.
+ZLIB_MAX_DICT_BYTES = 32 * 1024
+# Fragmen yang dihitung saat melatih dictionary zlib: key dan string pendek.
+_FRAGMENT = re.compile(rb'"(?:[^"\\]|\\.){1,48}"\s*:?')
+
+class UnknownDictionary(KeyError):
+    """Payload merujuk dictionary yang belum dimuat (mis. baru dilatih proses lain)."""
+
+def train_dictionary(samples: List[bytes], size: int, codec: str) -> bytes:
+    """
+    Dictionary dari sampel payload. zstd memakai trainer bawaannya; untuk zlib
+    (yang hanya mendukung preset dictionary) dipakai fragmen yang paling sering
+    muncul, yang paling sering di ujung agar jaraknya paling dekat.
+    """
+    if codec == "zstd":
+        return zstandard.train_dictionary(size, samples).as_bytes()
+    size = min(size, ZLIB_MAX_DICT_BYTES)
+    counts: Counter = Counter()
+    for sample in samples:
+        counts.update(set(_FRAGMENT.findall(sample)))
+    chosen = []
+    total = 0
+    for fragment, count in counts.most_common():
+        if count < 2 or total + len(fragment) > size:
+            continue
+        chosen.append(fragment)
+        total += len(fragment)
+    return b"".join(reversed(chosen))
+
+def normalize_legacy(text: str) -> str:
+    """
+    Payload TEXT lama ke JSON ringkas. Baris dari versi awal berisi repr
+    dict Python (`str(payload)`); yang tidak bisa di-parse disimpan sebagai
+    string JSON agar tidak hilang.
+    """
+    try:
+        value = json.loads(text)
+    except ValueError:
+        try:
+            value = ast.literal_eval(text)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            value = text
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+class PayloadCodec:
+    """Encoder/decoder payload untuk satu koneksi Database (writer dan reader)."""
+
+    def __init__(
+        self,
+        codec: str = PAYLOAD_CODEC,
+        min_bytes: int = PAYLOAD_COMPRESS_MIN_BYTES,
+        dict_min_bytes: int = PAYLOAD_DICT_MIN_BYTES,
+        use_dictionary: bool = PAYLOAD_USE_DICT
+    ):
+        if codec not in ("none", "zlib", "zstd"):
+            raise ValueError(f"Unknown payload codec {codec!r}, expected none, zlib or zstd")
+        if codec == "zstd" and zstandard is None:
+            logger.warning("PAYLOAD_CODEC=zstd but the zstandard package is not installed; using zlib.")
+            codec = "zlib"
+        self.codec = codec
+        self.min_bytes = min_bytes
+        self.dict_min_bytes = dict_min_bytes
+        self.use_dictionary = use_dictionary
+        self._dictionaries: Dict[int, Tuple[str, bytes]] = {}
+        self._active: Optional[int] = None
+        self._zstd_compressor = zstandard.ZstdCompressor(level=3) if codec == "zstd" else None
+        self._zstd_dict_compressor = None
+        self._zstd_decompressors: Dict[Optional[int], object] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def load_dictionaries(self, rows: Iterable[Tuple[int, str, bytes]]):
+        """Memuat isi `payload_dictionaries`; yang terbaru dengan codec yang sama menjadi aktif."""
+        for dict_id, codec, data in rows:
+            self._dictionaries[dict_id] = (codec, bytes(data))
+        candidates = [i for i, (codec, _) in self._dictionaries.items() if codec == self.codec]
+        self._active = max(candidates) if candidates and self.use_dictionary else None
+        self._zstd_dict_compressor = None
+        if self._active is not None and self.codec == "zstd":
+            self._zstd_dict_compressor = zstandard.ZstdCompressor(
+                level=3, dict_data=zstandard.ZstdCompressionDict(self._dictionaries[self._active][1])
+            )
+
+    @property
+    def active_dictionary(self) -> Optional[int]:
+        return self._active
+
+    def encode(self, payload: Union[bytes, bytearray, memoryview]) -> Union[str, bytes]:
+        """Byte JSON payload ke nilai kolom: TEXT jika tidak dikompres, BLOB bertag jika dikompres."""
+        size = len(memoryview(payload))
+        encoded: Optional[bytes] = None
+        if self.codec != "none":
+            if self._active is not None and size >= self.dict_min_bytes:
+                encoded = self._compress_with_dictionary(payload)
+            elif size >= self.min_bytes:
+                if self.codec == "zstd":
+                    encoded = bytes([TAG_ZSTD]) + self._zstd_compressor.compress(payload)
+                else:
+                    encoded = bytes([TAG_ZLIB]) + zlib.compress(payload, 6)
+        self.bytes_in += size
+        if encoded is None or len(encoded) >= size:
+            self.bytes_out += size
+            return str(payload, "utf-8")
+        self.bytes_out += len(encoded)
+        return encoded
+
+    def _compress_with_dictionary(self, payload) -> bytes:
+        header = _DICT_ID.pack(self._active)
+        if self.codec == "zstd":
+            return bytes([TAG_ZSTD_DICT]) + header + self._zstd_dict_compressor.compress(payload)
+        compressor = zlib.compressobj(6, zdict=self._dictionaries[self._active][1])
+        return bytes([TAG_ZLIB_DICT]) + header + compressor.compress(payload) + compressor.flush()
+
+    def decode(self, value: Union[str, bytes, None]) -> Optional[str]:
+        """Nilai kolom payload ke teks JSON. UnknownDictionary jika dictionary-nya belum dimuat."""
+        if value is None or isinstance(value, str):
+            return value
+        tag = value[0]
+        if tag == TAG_ZLIB:
+            return zlib.decompress(value[1:]).decode()
+        if tag == TAG_ZSTD:
+            return self._zstd_decompressor(None).decompress(value[1:]).decode()
+        (dict_id,) = _DICT_ID.unpack_from(value, 1)
+        if dict_id not in self._dictionaries:
+            raise UnknownDictionary(dict_id)
+        if tag == TAG_ZLIB_DICT:
+            decompressor = zlib.decompressobj(zdict=self._dictionaries[dict_id][1])
+            return (decompressor.decompress(value[3:]) + decompressor.flush()).decode()
+        if tag == TAG_ZSTD_DICT:
+            return self._zstd_decompressor(dict_id).decompress(value[3:]).decode()
+        raise ValueError(f"Unknown payload encoding tag {tag}")
+
+    def _zstd_decompressor(self, dict_id: Optional[int]):
+        if zstandard is None:
+            raise RuntimeError("Payload is zstd-compressed but the zstandard package is not installed")
+        decompressor = self._zstd_decompressors.get(dict_id)
+        if decompressor is None:
+            if dict_id is None:
+                decompressor = zstandard.ZstdDecompressor()
+            else:
+                decompressor = zstandard.ZstdDecompressor(
+                    dict_data=zstandard.ZstdCompressionDict(self._dictionaries[dict_id][1])
+                )
+            self._zstd_decompressors[dict_id] = decompressor
+        return decompressor
+
+    def stats(self):
+        return {
+            "codec": self.codec,
+            "active_dictionary": self._active,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+async def _main(args: argparse.Namespace):
+    from .database import Database
+
+    db = Database(path=args.db) if args.db else Database()
+    await db.open()
+    try:
+        if args.command == "train":
+            dict_id = await db.train_payload_dictionary(samples=args.samples, size=args.size)
+            print(json.dumps({"dictionary_id": dict_id, **db.codec.stats()}))
+        else:
+            print(json.dumps(await db.migrate_payloads(chunk_size=args.chunk)))
+    finally:
+        await db.close()
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Dictionary dan migrasi encoding payload.")
+    parser.add_argument("command", choices=["train", "migrate"])
+    parser.add_argument("--db", help="Path database (default DB_PATH)")
+    parser.add_argument("--samples", type=int, default=2000, help="Jumlah payload terbaru untuk melatih dictionary")
+    parser.add_argument("--size", type=int, default=16 * 1024, help="Ukuran dictionary (byte)")
+    parser.add_argument("--chunk", type=int, default=1000, help="Baris per transaksi migrasi")
+    asyncio.run(_main(parser.parse_args(argv)))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+import time
+import zlib
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from .consumer import CONSUMER_BATCH_SIZE, CONSUMER_LINGER_MS, event_consumer
+from .database import Database
+from .dedup_cache import DEDUP_CACHE_SIZE, DEDUP_BLOOM_CAPACITY, DedupCache
+from .models import EventRecord
+
+logger = logging.getLogger(__name__)
+
+# Jumlah consumer worker (shard); masing-masing punya antrian dan batch sendiri.
+CONSUMER_SHARDS = int(os.environ.get("CONSUMER_SHARDS", "1"))
+# Kapasitas antrian PER shard.
+QUEUE_MAXSIZE = int(os.environ.get("QUEUE_MAXSIZE", "10000"))
+# Batas waktu menunggu antrian kosong saat shutdown sebelum consumer dibatalkan.
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+# Jendela (detik) untuk menghitung throughput per shard.
+THROUGHPUT_WINDOW_SECONDS = 10.0
+
+def shard_for(topic: str, event_id: str, num_shards: int) -> int:
+    """
+    Shard untuk key (topic, event_id). Memakai CRC32, bukan hash() bawaan
+    Python yang diacak per proses, agar routing stabil antar proses/restart.
+    """
+    if num_shards == 1:
+        return 0
+    return zlib.crc32(f"{topic}\x00{event_id}".encode()) % num_shards
+
+class Shard:
+    """Satu consumer worker: antrian bounded, dedup cache, dan statistik throughput sendiri."""
+
+    def __init__(self, index: int, queue_maxsize: int, dedup_cache: DedupCache):
+        self.index = index
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_maxsize)
+        self.dedup_cache = dedup_cache
+        self.task: Optional[asyncio.Task] = None
+        self.processed_total = 0
+        self.batches_total = 0
+        self._samples: deque = deque()
+
+    def record_batch(self, size: int):
+        now = time.monotonic()
+        self.processed_total += size
+        self.batches_total += 1
+        self._samples.append((now, self.processed_total))
+
+    def events_per_second(self) -> float:
+        """Rata-rata event/detik selama THROUGHPUT_WINDOW_SECONDS terakhir."""
+        now = time.monotonic()
+        while self._samples and now - self._samples[0][0] > THROUGHPUT_WINDOW_SECONDS:
+            self._samples.popleft()
+        if len(self._samples) < 2:
+            return 0.0
+        first_time, first_total = self._samples[0]
+        return (self.processed_total - first_total) / max(now - first_time, 1e-3)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shard": self.index,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "processed_total": self.processed_total,
+            "batches_total": self.batches_total,
+            "events_per_second": round(self.events_per_second(), 2),
+        }
+
+class Pipeline:
+    """
+    Pipeline consumer ter-shard. Event di-route berdasarkan hash (topic, event_id)
+    sehingga semua salinan satu key selalu diproses shard yang sama: dedup
+    tetap benar tanpa lock antar shard. Commit tetap lewat satu writer SQLite
+    (yang memang hanya mengizinkan satu penulis), diserialisasi oleh Database.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        num_shards: int = CONSUMER_SHARDS,
+        queue_maxsize: int = QUEUE_MAXSIZE,
+        batch_size: int = CONSUMER_BATCH_SIZE,
+        linger_ms: float = CONSUMER_LINGER_MS
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.linger_ms = linger_ms
+        num_shards = max(1, num_shards)
+        self.shards: List[Shard] = [
+            Shard(
+                i,
+                queue_maxsize,
+                DedupCache(
+                    max_size=DEDUP_CACHE_SIZE // num_shards,
+                    bloom_capacity=DEDUP_BLOOM_CAPACITY // num_shards
+                )
+            )
+            for i in range(num_shards)
+        ]
+        self._warm_tasks: List[asyncio.Task] = []
+
+    def route(self, event: EventRecord) -> Shard:
+        return self.shards[shard_for(event.topic, event.event_id, len(self.shards))]
+
+    def put_nowait(self, event: EventRecord):
+        """Memasukkan event ke antrian shard-nya; asyncio.QueueFull jika penuh."""
+        event._enqueued_at = time.monotonic()
+        self.route(event).queue.put_nowait(event)
+
+    async def put(self, event: EventRecord):
+        """Memasukkan event, menunggu jika antrian shard-nya penuh (backpressure)."""
+        await self.route(event).queue.put(event)
+        # Diisi setelah put(): waktu menunggu tempat kosong bukan bagian dari
+        # queue wait. Tidak ada yield di antaranya, jadi consumer belum melihatnya.
+        event._enqueued_at = time.monotonic()
+
+    def start(self):
+        num_shards = len(self.shards)
+        for shard in self.shards:
+            # Warm-up per shard hanya mengambil key yang memang di-route ke shard itu.
+            self._warm_tasks.append(asyncio.create_task(shard.dedup_cache.warm(
+                self.db,
+                accept=lambda topic, event_id, i=shard.index: shard_for(topic, event_id, num_shards) == i
+            )))
+            shard.task = asyncio.create_task(event_consumer(
+                shard.queue,
+                self.db,
+                shard.dedup_cache,
+                batch_size=self.batch_size,
+                linger_ms=self.linger_ms,
+                on_batch=shard.record_batch
+            ))
+        logger.info(f"Pipeline started with {num_shards} shard(s).")
+
+    async def stop(self, drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        """Menunggu semua antrian kosong (maks. `drain_timeout` detik), lalu menghentikan consumer."""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(shard.queue.join() for shard in self.shards)),
+                timeout=drain_timeout
+            )
+        except asyncio.TimeoutError:
+            remaining = sum(shard.queue.qsize() for shard in self.shards)
+            logger.warning(f"Drain timed out, {remaining} event(s) still queued.")
+
+        for task in self._warm_tasks:
+            task.cancel()
+        for shard in self.shards:
+            if shard.task is not None:
+                shard.task.cancel()
+        await asyncio.gather(
+            *self._warm_tasks,
+            *(shard.task for shard in self.shards if shard.task is not None),
+            return_exceptions=True
+        )
+        logger.info("Pipeline stopped.")
+
+    def queue_depth(self) -> int:
+        return sum(shard.queue.qsize() for shard in self.shards)
+
+    def dedup_cache_stats(self) -> Dict[str, int]:
+        total: Dict[str, int] = {}
+        for shard in self.shards:
+            for key, value in shard.dedup_cache.stats().items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+    def shard_stats(self) -> List[Dict[str, Any]]:
+        return [shard.stats() for shard in self.shards]
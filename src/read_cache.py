@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Umur maksimum entri cache baca (detik); 0 = cache mati.
+READ_CACHE_TTL = float(os.environ.get("READ_CACHE_TTL", "1.0"))
+# Jumlah maksimum entri (LRU).
+READ_CACHE_MAX_ENTRIES = int(os.environ.get("READ_CACHE_MAX_ENTRIES", "1024"))
+
+class CachedResponse:
+    """Body JSON yang sudah di-serialize beserta ETag dan header tambahannya."""
+
+    __slots__ = ("body", "etag", "headers", "version", "created")
+
+    def __init__(self, body: bytes, headers: Dict[str, str], version: Hashable, created: float):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.headers = headers
+        self.version = version
+        self.created = created
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Apakah header `If-None-Match` cocok dengan `etag` (perbandingan weak, seperti RFC 9110)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+class ReadCache:
+    """
+    Cache response baca di dalam proses, per (endpoint, parameter query).
+    Entri berlaku selama `version` (versi data writer) belum berubah
+    DAN umurnya di bawah `ttl`; TTL membatasi basi-nya nilai yang berubah
+    tanpa commit (mis. antrian dan uptime di /stats). Permintaan bersamaan
+    untuk key yang sama yang meleset berbagi satu komputasi.
+    """
+
+    def __init__(self, ttl: float = READ_CACHE_TTL, max_entries: int = READ_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: Hashable, version: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version or time.monotonic() - entry.created >= self.ttl:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    async def get(
+        self,
+        key: Hashable,
+        version: Hashable,
+        compute: Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]]
+    ) -> CachedResponse:
+        """Entri yang masih berlaku, atau hasil `compute()` (body, header) yang baru disimpan."""
+        entry = self.lookup(key, version) if self.ttl > 0 else None
+        if entry is not None:
+            return entry
+        inflight = self._inflight.get((key, version))
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[(key, version)] = future
+        try:
+            body, headers = await compute()
+            entry = CachedResponse(body, headers, version, time.monotonic())
+            future.set_result(entry)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Tandai sudah diambil agar tidak ada warning jika tidak ada yang menunggu
+            future.exception()
+            raise
+        finally:
+            del self._inflight[(key, version)]
+        if self.ttl > 0:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
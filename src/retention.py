@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+# Retensi default event (hari, berdasarkan timestamp event); 0 = selamanya.
+RETENTION_DAYS = float(os.environ.get("RETENTION_DAYS", "0"))
+# Override per topic, mis. "audit=365,debug=1"; 0 = topic itu disimpan selamanya.
+RETENTION_TOPIC_DAYS = os.environ.get("RETENTION_TOPIC_DAYS", "")
+# Lama key diingat di dedup_keys (hari, sejak diproses); 0 = selamanya.
+DEDUP_WINDOW_DAYS = float(os.environ.get("DEDUP_WINDOW_DAYS", "0"))
+# Jeda antar putaran compaction (detik).
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL", "300"))
+# Baris per transaksi DELETE; kecil agar write lock cepat kembali ke consumer.
+RETENTION_CHUNK_SIZE = int(os.environ.get("RETENTION_CHUNK_SIZE", "1000"))
+# Halaman per langkah PRAGMA incremental_vacuum.
+RETENTION_VACUUM_PAGES = int(os.environ.get("RETENTION_VACUUM_PAGES", "512"))
+
+_DAY_SECONDS = 86400
+
+def parse_topic_days(spec: str) -> Dict[str, float]:
+    """Mem-parse "topic=hari,topic2=hari" menjadi dict. ValueError jika formatnya salah."""
+    result = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        topic, sep, days = item.rpartition("=")
+        if not sep or not topic:
+            raise ValueError(f"Invalid retention rule {item!r}, expected topic=days")
+        result[topic.strip()] = float(days)
+    return result
+
+class RetentionPolicy:
+    """Aturan retensi event (default + override per topic) dan jendela dedup."""
+
+    def __init__(
+        self,
+        default_days: float = RETENTION_DAYS,
+        topic_days: Optional[Mapping[str, float]] = None,
+        dedup_window_days: float = DEDUP_WINDOW_DAYS
+    ):
+        self.default_days = default_days
+        self.topic_days = dict(parse_topic_days(RETENTION_TOPIC_DAYS) if topic_days is None else topic_days)
+        self.dedup_window_days = dedup_window_days
+
+    @property
+    def enabled(self) -> bool:
+        return (
+            self.default_days > 0
+            or self.dedup_window_days > 0
+            or any(days > 0 for days in self.topic_days.values())
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "default_days": self.default_days,
+            "topic_days": self.topic_days,
+            "dedup_window_days": self.dedup_window_days,
+        }
+
+def _cutoff_ms(now: float, days: float) -> int:
+    return int((now - days * _DAY_SECONDS) * 1000)
+
+class Compactor:
+    """
+    Task background yang menghapus event di luar retensi dan key dedup di luar
+    jendela dedup. Penghapusan dilakukan per chunk kecil, masing-masing satu
+    transaksi pendek di writer bersama, sehingga consumer hanya tertahan paling
+    lama satu chunk. Setelah itu halaman kosong dikembalikan ke OS dengan
+    `PRAGMA incremental_vacuum` (hanya jika DB dibuat dengan auto_vacuum=INCREMENTAL).
+
+    Catatan: dedup cache in-memory bisa masih mengingat key yang sudah kedaluwarsa
+    sampai tergeser, jadi jendela dedup adalah batas minimum.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        policy: RetentionPolicy,
+        interval: float = RETENTION_INTERVAL,
+        chunk_size: int = RETENTION_CHUNK_SIZE,
+        vacuum_pages: int = RETENTION_VACUUM_PAGES
+    ):
+        self.db = db
+        self.policy = policy
+        self.interval = interval
+        self.chunk_size = max(1, chunk_size)
+        self.vacuum_pages = max(1, vacuum_pages)
+        self._task: Optional[asyncio.Task] = None
+        self.runs_total = 0
+        self.events_expired_total = 0
+        self.dedup_expired_total = 0
+        self.pages_vacuumed_total = 0
+        self.partitions_dropped_total = 0
+        self.last_run_at: Optional[float] = None
+        self.last_run_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._storage: Dict[str, Any] = {}
+
+    async def _drain(self, delete) -> int:
+        total = 0
+        while True:
+            deleted = await delete()
+            total += deleted
+            if deleted < self.chunk_size:
+                return total
+            # Beri kesempatan consumer mengambil write lock di antara chunk
+            await asyncio.sleep(0)
+
+    async def _partition_expired(self, table, end_ts, default_cutoff, topic_cutoffs) -> bool:
+        """
+        True jika SEMUA baris partisi pasti kedaluwarsa, sehingga cukup DROP TABLE:
+        seluruh rentangnya di bawah cutoff default, dan tidak ada topic dengan
+        retensi lebih panjang yang masih punya baris di sana.
+        """
+        if default_cutoff is None or end_ts > default_cutoff:
+            return False
+        for topic, cutoff in topic_cutoffs.items():
+            if (cutoff is None or end_ts > cutoff) and await self.db.partition_has_topic(table, topic):
+                return False
+        return True
+
+    async def run_once(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Satu putaran compaction; mengembalikan jumlah baris/halaman yang dibersihkan."""
+        started = time.monotonic()
+        now = time.time() if now is None else now
+        policy = self.policy
+        events = 0
+        partitions_dropped = 0
+
+        # Cutoff per aturan; None = disimpan selamanya
+        default_cutoff = _cutoff_ms(now, policy.default_days) if policy.default_days > 0 else None
+        topic_cutoffs = {
+            topic: _cutoff_ms(now, days) if days > 0 else None
+            for topic, days in policy.topic_days.items()
+        }
+        overridden = list(policy.topic_days)
+
+        for table, start_ts, end_ts in await self.db.list_partitions():
+            if end_ts is not None and await self._partition_expired(table, end_ts, default_cutoff, topic_cutoffs):
+                events += await self.db.drop_partition(table)
+                partitions_dropped += 1
+                continue
+            for topic, cutoff in topic_cutoffs.items():
+                if cutoff is not None and (start_ts is None or start_ts < cutoff):
+                    events += await self._drain(
+                        lambda: self.db.delete_expired_events(cutoff, self.chunk_size, topic=topic, table=table)
+                    )
+            if default_cutoff is not None and (start_ts is None or start_ts < default_cutoff):
+                events += await self._drain(
+                    lambda: self.db.delete_expired_events(
+                        default_cutoff, self.chunk_size, exclude_topics=overridden, table=table
+                    )
+                )
+
+        dedup = 0
+        if policy.dedup_window_days > 0:
+            # processed_at dalam epoch detik; key dipindai per rentang sampai habis
+            cutoff = _cutoff_ms(now, policy.dedup_window_days) // 1000
+            after = None
+            while True:
+                deleted, after = await self.db.delete_expired_dedup(cutoff, self.chunk_size, after)
+                dedup += deleted
+                if after is None:
+                    break
+                await asyncio.sleep(0)
+
+        pages = 0
+        while True:
+            freed = await self.db.incremental_vacuum(self.vacuum_pages)
+            pages += freed
+            if freed < self.vacuum_pages:
+                break
+            await asyncio.sleep(0)
+
+        self.runs_total += 1
+        self.events_expired_total += events
+        self.partitions_dropped_total += partitions_dropped
+        self.dedup_expired_total += dedup
+        self.pages_vacuumed_total += pages
+        self.last_run_at = now
+        self.last_run_seconds = round(time.monotonic() - started, 4)
+        self._storage = await self.db.storage_info()
+        if events or dedup:
+            logger.info(
+                f"Retention removed {events} event(s) ({partitions_dropped} partition(s) dropped) "
+                f"and {dedup} dedup key(s), vacuumed {pages} page(s)."
+            )
+        return {
+            "events_expired": events,
+            "partitions_dropped": partitions_dropped,
+            "dedup_expired": dedup,
+            "pages_vacuumed": pages,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Retention compaction failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        stats, _ = await self.db.load_stats()
+        # Total sejak DB dibuat; dipersistenkan di transaksi DELETE yang sama
+        self.events_expired_total = stats.get("events_expired_total", 0)
+        self.dedup_expired_total = stats.get("dedup_expired_total", 0)
+        self._storage = await self.db.storage_info()
+        if self._storage.get("auto_vacuum") != 2:
+            logger.warning("Database was not created with auto_vacuum=INCREMENTAL; space is reused but not returned to the OS.")
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Retention compaction started: {self.policy.describe()}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.policy.describe(),
+            "runs_total": self.runs_total,
+            "events_expired_total": self.events_expired_total,
+            "dedup_expired_total": self.dedup_expired_total,
+            "partitions_dropped_total": self.partitions_dropped_total,
+            "pages_vacuumed_total": self.pages_vacuumed_total,
+            "last_run_at": self.last_run_at,
+            "last_run_seconds": self.last_run_seconds,
+            "last_error": self.last_error,
+            "freelist_pages": self._storage.get("freelist_count"),
+            "page_count": self._storage.get("page_count"),
+        }
@@ -0,0 +1,42 @@
+from collections import Counter
+from typing import Any, Dict, Mapping
+
+class StatsCounters:
+    """
+    Counter statistik in-memory. Semua update terjadi di event loop yang sama
+    tanpa `await` di tengahnya, jadi setiap update bersifat atomik.
+
+    Nilai persisten di tabel `statistics`/`topic_stats` ditulis oleh writer di
+    transaksi yang sama dengan batch event, lalu counter ini di-update SETELAH
+    commit. `received_total` di memori juga mencakup event yang sudah diterima
+    /publish tetapi belum di-commit (masih di antrian).
+    """
+
+    def __init__(self):
+        self.received_total = 0
+        self.unique_processed_total = 0
+        self.duplicate_dropped_total = 0
+        self.topics: Counter = Counter()
+
+    def load(self, stats: Mapping[str, int], topics: Mapping[str, int]):
+        """Mengisi counter dari nilai yang tersimpan di DB (saat startup)."""
+        self.received_total = stats.get("received_total", 0)
+        self.unique_processed_total = stats.get("unique_processed_total", 0)
+        self.duplicate_dropped_total = stats.get("duplicate_dropped_total", 0)
+        self.topics = Counter(topics)
+
+    def record_received(self, count: int):
+        self.received_total += count
+
+    def record_committed(self, unique_count: int, duplicate_count: int, topic_counts: Mapping[str, int]):
+        self.unique_processed_total += unique_count
+        self.duplicate_dropped_total += duplicate_count
+        self.topics.update(topic_counts)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "received_total": self.received_total,
+            "unique_processed_total": self.unique_processed_total,
+            "duplicate_dropped_total": self.duplicate_dropped_total,
+            "topics": dict(self.topics),
+        }
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import signal
+
+from .database import Database
+from .ingest import start_local_ingest
+from .ipc import INGEST_SOCKET, IngestServer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def run_writer(socket_path: str = INGEST_SOCKET):
+    """
+    Proses writer untuk mode multi-process: satu-satunya pemilik koneksi
+    writer SQLite, pipeline consumer, dedup cache, dan counter statistik.
+    HTTP worker mengirim event ke sini lewat Unix socket.
+    """
+    db = Database()
+    await db.open()
+    ingest = await start_local_ingest(db)
+    server = IngestServer(ingest, socket_path)
+    await server.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Writer shutting down...")
+    # Tutup socket dulu agar tidak ada event baru, lalu kuras antrian
+    await server.stop()
+    await ingest.stop()
+    await db.close()
+
+def main():
+    asyncio.run(run_writer())
+
+if __name__ == "__main__":
+    main()
@@ -197,4 +197,752 @@ def test_stress_test_batch(client: TestClient):
     assert stats["received_total"] == num_events
     assert stats["unique_processed_total"] == (num_events - num_dupes) # 400
     assert stats["duplicate_dropped_total"] == num_dupes # 100
-    assert stats["topics"]["stress-test"] == (num_events - num_dupes)
\ No newline at end of file
+    assert stats["topics"]["stress-test"] == (num_events - num_dupes)
+def test_batch_store_reports_new_and_duplicates():
+    """T7: Tes batch writer: flag baru/duplikat sejajar dengan urutan batch."""
+    import asyncio
+    from src.models import Event
+    from src.database import Database
+
+    first = Event(**create_event("batch-topic")).to_record()
+    second = Event(**create_event("batch-topic")).to_record()
+
+    async def run():
+        db = Database()
+        await db.open()
+        try:
+            r1 = await db.store_processed_events_batch([first, second, first])
+            r2 = await db.store_processed_events_batch([second])
+        finally:
+            await db.close()
+        return r1, r2
+
+    r1, r2 = asyncio.run(run())
+    assert r1 == [True, True, False]
+    assert r2 == [False]
+
+def test_storage_wal_and_read_only_readers():
+    """T8: Tes storage layer: writer memakai WAL, reader bersifat read-only."""
+    import asyncio
+    import sqlite3
+    from src.database import Database
+
+    async def run():
+        db = Database(reader_pool_size=1)
+        await db.open()
+        try:
+            async with db.writer.execute("PRAGMA journal_mode") as cursor:
+                mode = (await cursor.fetchone())[0]
+            async with db.reader() as reader:
+                with pytest.raises(sqlite3.OperationalError):
+                    await reader.execute("DELETE FROM statistics")
+        finally:
+            await db.close()
+        return mode
+
+    assert asyncio.run(run()) == "wal"
+
+def test_dedup_cache_rejects_known_duplicates(client: TestClient):
+    """T9: Tes dedup cache: duplikat yang sudah di-commit ditolak dari cache."""
+    event = create_event("cache-topic")
+    client.post("/publish", json={"events": [event]})
+    wait_for_processing(client, 1)
+
+    client.post("/publish", json={"events": [event]})
+    wait_for_processing(client, 2)
+
+    stats = client.get("/stats").json()
+    assert stats["unique_processed_total"] == 1
+    assert stats["duplicate_dropped_total"] == 1
+    assert stats["dedup_cache"]["hits"] == 1
+    assert stats["dedup_cache"]["size"] == 1
+
+def test_dedup_cache_lru_and_bloom_counters():
+    """T10: Tes unit DedupCache: LRU terbatas dan hitungan false positive Bloom."""
+    from src.dedup_cache import DedupCache
+
+    cache = DedupCache(max_size=2, bloom_capacity=1000, bloom_error_rate=0.01)
+    cache.record_committed([("t", "a"), ("t", "b"), ("t", "c")], [True, True, None])
+    assert cache.is_known_duplicate("t", "a")
+    assert not cache.is_known_duplicate("t", "c")  # gagal disimpan, tidak diingat
+
+    cache.record_committed([("t", "c")], [True])  # "b" terdorong keluar dari LRU
+    assert not cache.is_known_duplicate("t", "b")
+
+    # "b" masih ada di Bloom; DB yang memutuskan, dan DB bilang duplikat
+    cache.record_committed([("t", "b")], [False])
+    stats = cache.stats()
+    assert stats["bloom_positives"] == 1
+    assert stats["bloom_false_positives"] == 0
+
+def test_stats_counters_persist_with_batches():
+    """T11: Tes counter statistik: persisten di transaksi batch dan dimuat ulang saat open()."""
+    import asyncio
+    from src.models import Event
+    from src.database import Database
+
+    events = [Event(**create_event("counter-a")).to_record(), Event(**create_event("counter-b")).to_record()]
+
+    async def run():
+        db = Database()
+        await db.open()
+        try:
+            await db.store_processed_events_batch(events + [events[0]], known_duplicates=2)
+        finally:
+            await db.close()
+
+        reopened = Database()
+        await reopened.open()
+        try:
+            return reopened.get_stats()
+        finally:
+            await reopened.close()
+
+    stats = asyncio.run(run())
+    assert stats["received_total"] == 5
+    assert stats["unique_processed_total"] == 2
+    assert stats["duplicate_dropped_total"] == 3
+    assert stats["topics"] == {"counter-a": 1, "counter-b": 1}
+
+def test_get_events_keyset_pagination(client: TestClient):
+    """T12: Tes pagination /events dengan cursor, filter waktu dan source."""
+    events = []
+    for minute in range(5):
+        event = create_event("page-topic")
+        event["timestamp"] = f"2025-10-20T10:0{minute}:00Z"
+        events.append(event)
+    events[0]["source"] = "other-source"
+    client.post("/publish", json={"events": events})
+    wait_for_processing(client, 5)
+
+    page1 = client.get("/events?topic=page-topic&limit=2")
+    assert [e["event_id"] for e in page1.json()] == [events[4]["event_id"], events[3]["event_id"]]
+    cursor = page1.headers["X-Next-Cursor"]
+
+    page2 = client.get(f"/events?topic=page-topic&limit=2&after={cursor}")
+    assert [e["event_id"] for e in page2.json()] == [events[2]["event_id"], events[1]["event_id"]]
+
+    page3 = client.get(f"/events?topic=page-topic&limit=2&after={page2.headers['X-Next-Cursor']}")
+    assert [e["event_id"] for e in page3.json()] == [events[0]["event_id"]]
+    assert "X-Next-Cursor" not in page3.headers
+
+    ranged = client.get("/events?since=2025-10-20T10:01:00Z&until=2025-10-20T10:03:00Z")
+    assert [e["event_id"] for e in ranged.json()] == [events[2]["event_id"], events[1]["event_id"]]
+
+    by_source = client.get("/events?source=other-source")
+    assert [e["event_id"] for e in by_source.json()] == [events[0]["event_id"]]
+
+    assert client.get("/events?after=not-a-cursor").status_code == 400
+
+def test_publish_stream_ndjson(client: TestClient):
+    """T13: Tes bulk ingest NDJSON (plain dan gzip) dengan laporan error per baris."""
+    import gzip
+    import json
+
+    good = [create_event("stream-topic") for _ in range(3)]
+    lines = [json.dumps(good[0]), "{not json", json.dumps(good[1]), "", json.dumps({"topic": "x"}), json.dumps(good[2])]
+    body = "\n".join(lines).encode()
+
+    response = client.post("/publish/stream", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    summary = response.json()
+    assert summary["accepted"] == 3
+    assert summary["rejected"] == 2
+    assert [e["line"] for e in summary["errors"]] == [2, 5]
+
+    gz = client.post(
+        "/publish/stream",
+        content=gzip.compress(json.dumps(good[0]).encode() + b"\n"),
+        headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+    )
+    assert gz.json()["accepted"] == 1
+
+    wait_for_processing(client, 4)
+    stats = client.get("/stats").json()
+    assert stats["received_total"] == 4
+    assert stats["unique_processed_total"] == 3
+    assert stats["duplicate_dropped_total"] == 1
+
+    wrong_type = client.post("/publish/stream", content=body, headers={"Content-Type": "text/plain"})
+    assert wrong_type.status_code == 415
+
+def test_export_events_streaming(client: TestClient):
+    """T14: Tes export event sebagai NDJSON dan CSV dengan filter topic."""
+    import csv
+    import io
+    import json
+
+    events = [create_event("export-a") for _ in range(3)] + [create_event("export-b")]
+    client.post("/publish", json={"events": events})
+    wait_for_processing(client, 4)
+
+    ndjson = client.get("/events/export?topic=export-a")
+    assert ndjson.status_code == 200
+    rows = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert sorted(r["event_id"] for r in rows) == sorted(e["event_id"] for e in events[:3])
+
+    as_csv = client.get("/events/export?format=csv")
+    records = list(csv.DictReader(io.StringIO(as_csv.text)))
+    assert len(records) == 4
+    assert {r["topic"] for r in records} == {"export-a", "export-b"}
+
+def test_sharded_pipeline_routing_and_drain():
+    """T15: Tes pipeline ter-shard: duplikat selalu ke shard yang sama, shutdown menguras semua antrian."""
+    import asyncio
+    from src.models import Event
+    from src.database import Database
+    from src.pipeline import Pipeline
+
+    unique = [Event(**create_event("shard-topic")).to_record() for _ in range(40)]
+    events = unique + unique[:10]
+
+    async def run():
+        db = Database()
+        await db.open()
+        pipeline = Pipeline(db, num_shards=4, linger_ms=0)
+        pipeline.start()
+        for event in events:
+            db.counters.record_received(1)
+            pipeline.put_nowait(event)
+        await pipeline.stop()
+        stats = db.get_stats()
+        shards = pipeline.shard_stats()
+        await db.close()
+        return stats, shards
+
+    stats, shards = asyncio.run(run())
+    assert stats["unique_processed_total"] == 40
+    assert stats["duplicate_dropped_total"] == 10
+    assert len(shards) == 4
+    assert sum(s["processed_total"] for s in shards) == 50
+    assert all(s["queue_depth"] == 0 for s in shards)
+
+def test_remote_ingest_over_unix_socket(tmp_path):
+    """T16: Tes mode multi-process: HTTP worker meneruskan event ke proses writer lewat Unix socket."""
+    import asyncio
+    from src.models import Event
+    from src.database import Database
+    from src.ingest import LocalIngest
+    from src.ipc import IngestServer, RemoteIngest
+    from src.pipeline import Pipeline
+
+    socket_path = str(tmp_path / "ingest.sock")
+    event = Event(**create_event("ipc-topic")).to_record()
+
+    async def run():
+        db = Database()
+        await db.open()
+        pipeline = Pipeline(db, linger_ms=0)
+        pipeline.start()
+        server = IngestServer(LocalIngest(pipeline, db.counters), socket_path)
+        await server.start()
+
+        client = RemoteIngest(socket_path, pool_size=2)
+        try:
+            assert await client.submit([event, event]) == 2
+            await asyncio.gather(*(shard.queue.join() for shard in pipeline.shards))
+            return await client.stats()
+        finally:
+            await client.close()
+            await server.stop()
+            await pipeline.stop()
+            await db.close()
+
+    stats = asyncio.run(run())
+    assert stats["received_total"] == 2
+    assert stats["unique_processed_total"] == 1
+    assert stats["duplicate_dropped_total"] == 1
+    assert stats["topics"] == {"ipc-topic": 1}
+
+def test_ingest_log_replays_uncommitted_events(tmp_path):
+    """T17: Tes ingest log: event yang sudah di-ACK tetapi belum di-commit diputar ulang setelah crash."""
+    import asyncio
+    from src.models import Event
+    from src.database import Database
+    from src.ingest import LocalIngest
+    from src.ingest_log import IngestLog
+    from src.pipeline import Pipeline
+
+    log_dir = str(tmp_path / "ingest-log")
+    events = [Event(**create_event("wal-topic")).to_record() for _ in range(5)]
+
+    async def crash_before_commit():
+        # Event ditulis durable ke log, tetapi "proses mati" sebelum consumer berjalan
+        log = IngestLog(log_dir, group_commit_ms=0)
+        log.open()
+        assert await log.append(events) == [1, 2, 3, 4, 5]
+        await log.close()
+
+    async def restart():
+        db = Database()
+        await db.open()
+        checkpoint = await db.load_checkpoint()
+        log = IngestLog(log_dir, group_commit_ms=0)
+        log.open(checkpoint)
+        db.ingest_log = log
+        pipeline = Pipeline(db, linger_ms=0)
+        pipeline.start()
+        ingest = LocalIngest(pipeline, db.counters, log)
+        replayed = await ingest.replay(checkpoint)
+        await asyncio.gather(*(shard.queue.join() for shard in pipeline.shards))
+        stats = await ingest.stats()
+        checkpoint = await db.load_checkpoint()
+        await ingest.stop()
+        await db.close()
+        return replayed, stats, checkpoint
+
+    asyncio.run(crash_before_commit())
+    replayed, stats, checkpoint = asyncio.run(restart())
+    assert replayed == 5
+    assert stats["unique_processed_total"] == 5
+    assert stats["ingest_log"]["pending"] == 0
+    assert checkpoint == 5
+
+    # Restart kedua: semua sudah di-checkpoint, tidak ada yang diputar ulang
+    replayed, stats, _ = asyncio.run(restart())
+    assert replayed == 0
+    assert stats["unique_processed_total"] == 5
+
+def test_bench_harness_in_process():
+    """T18: Tes smoke benchmark harness: publisher async terhadap app in-process."""
+    import asyncio
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "publisher"))
+    from bench import BenchConfig, in_process_client, percentile, run_benchmark
+
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 100) == 4.0
+
+    config = BenchConfig(events=300, batch_size=50, concurrency=4, duplicate_ratio=0.2, topics=3)
+
+    async def run():
+        async with in_process_client(None) as client:
+            return await run_benchmark(client, config)
+
+    results = asyncio.run(run())
+    assert results["events_sent"] == 300
+    assert results["events_processed"] == 300
+    assert results["unique_processed"] + results["duplicates_dropped"] == 300
+    assert results["duplicates_dropped"] > 0
+    assert results["latency_ms"]["p50"] <= results["latency_ms"]["p99"]
+
+def test_metrics_endpoint_prometheus_format(client: TestClient):
+    """T19: Tes /metrics: histogram publish/antrian/commit dan counter dedup cache dalam format Prometheus."""
+    from src.metrics import Histogram
+
+    histogram = Histogram("t_seconds", "tes", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    lines = histogram.render()
+    assert 't_seconds_bucket{le="0.1"} 2' in lines
+    assert 't_seconds_bucket{le="1"} 3' in lines
+    assert 't_seconds_bucket{le="+Inf"} 4' in lines
+    assert "t_seconds_count 4" in lines
+
+    event = create_event("metrics-topic")
+    client.post("/publish", json={"events": [event]})
+    wait_for_processing(client, 1)
+    client.post("/publish", json={"events": [event]})
+    wait_for_processing(client, 2)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE aggregator_publish_duration_seconds histogram" in body
+    assert 'aggregator_publish_duration_seconds_count{endpoint="/publish"}' in body
+    assert "aggregator_queue_wait_seconds_count" in body
+    assert "aggregator_batch_commit_duration_seconds_count" in body
+    assert "aggregator_batch_events_bucket" in body
+    assert 'aggregator_queue_depth{shard="0"} 0' in body
+    assert "aggregator_dedup_cache_hits_total 1" in body
+
+def test_publish_fast_path_stores_raw_payload(client: TestClient, monkeypatch):
+    """T20: Tes fast path /publish: decoder cepat, validasi minimal, payload disimpan sebagai JSON mentah."""
+    import json
+    from src import fastpath
+
+    monkeypatch.setattr(fastpath, "INGEST_FAST_PATH", True)
+    event = create_event("fast-topic")
+    event["timestamp"] = "2025-10-20T10:00:00.123Z"
+    event["payload"] = {"nested": {"values": [1, 2.5, None]}, "text": "héllo"}
+
+    assert client.post("/publish", json={"events": [event, event]}).status_code == 200
+    bad = dict(event, event_id="")
+    response = client.post("/publish", json={"events": [bad]})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][:2] == ["body", "events"]
+    assert client.post("/publish", content=b"not json", headers={"content-type": "application/json"}).status_code == 422
+
+    ndjson = json.dumps(create_event("fast-topic")) + "\n" + json.dumps(dict(event, payload=[1])) + "\n"
+    summary = client.post(
+        "/publish/stream", content=ndjson, headers={"content-type": "application/x-ndjson"}
+    ).json()
+    assert summary["accepted"] == 1 and summary["rejected"] == 1
+
+    wait_for_processing(client, 3)
+    stored = {e["event_id"]: e for e in client.get("/events?topic=fast-topic").json()}
+    assert json.loads(stored[event["event_id"]]["payload"]) == event["payload"]
+    assert stored[event["event_id"]]["timestamp"].startswith("2025-10-20 10:00:00.123")
+    assert client.get("/openapi.json").status_code == 200
+
+def test_retention_compaction_in_chunks(tmp_path):
+    """T21: Tes retensi: event lama dihapus per chunk sesuai aturan per topic, key dedup di luar jendela dihapus."""
+    import asyncio
+    import datetime
+    from src.models import Event
+    from src.database import Database
+    from src.retention import Compactor, RetentionPolicy, parse_topic_days
+
+    assert parse_topic_days("audit=365, debug=1") == {"audit": 365.0, "debug": 1.0}
+
+    def make(topic, timestamp):
+        event = create_event(topic)
+        event["timestamp"] = timestamp
+        event["payload"] = {"data": "x" * 2000}
+        return Event(**event).to_record()
+
+    old, recent = "2020-01-01T00:00:00Z", "2025-10-20T10:00:00Z"
+    events = (
+        [make("logs", old) for _ in range(250)]
+        + [make("logs", recent) for _ in range(5)]
+        + [make("audit", old) for _ in range(5)]
+    )
+
+    async def run():
+        db = Database(path=str(tmp_path / "retention.db"))
+        await db.open()
+        await db.store_processed_events_batch(events)
+        # Key tertua (urutan insert) diproses jauh sebelum jendela dedup
+        await db.writer.execute("UPDATE dedup_store SET processed_at = '2020-01-01 00:00:00' WHERE rowid <= 5")
+        await db.writer.commit()
+
+        now = datetime.datetime(2025, 10, 21, tzinfo=datetime.timezone.utc).timestamp()
+        policy = RetentionPolicy(default_days=30, topic_days={"audit": 0}, dedup_window_days=7)
+        compactor = Compactor(db, policy, chunk_size=100, vacuum_pages=10)
+        result = await compactor.run_once(now=now)
+        async with db.reader() as conn:
+            async with conn.execute("SELECT topic, COUNT(*) FROM processed_events GROUP BY topic") as cursor:
+                remaining = dict(await cursor.fetchall())
+            async with conn.execute("SELECT COUNT(*) FROM dedup_store") as cursor:
+                dedup_left = (await cursor.fetchone())[0]
+        persisted, _ = await db.load_stats()
+        await db.close()
+        return result, remaining, dedup_left, persisted, compactor.stats()
+
+    result, remaining, dedup_left, persisted, stats = asyncio.run(run())
+    assert result["events_expired"] == 250
+    assert result["dedup_expired"] == 5
+    assert result["pages_vacuumed"] > 0
+    assert remaining == {"logs": 5, "audit": 5}
+    assert dedup_left == 255
+    assert persisted["events_expired_total"] == 250
+    assert stats["runs_total"] == 1 and stats["dedup_expired_total"] == 5
+
+def test_partitioned_storage_pruning_and_drop(tmp_path):
+    """T22: Tes partisi harian: katalog, urutan/pagination lintas partisi, pruning, export, dan drop partisi lama."""
+    import asyncio
+    import datetime
+    from src.models import Event
+    from src.database import Database
+    from src.retention import Compactor, RetentionPolicy
+
+    def make(topic, day, hour):
+        event = create_event(topic)
+        event["timestamp"] = f"2025-10-{day:02d}T{hour:02d}:00:00Z"
+        return Event(**event).to_record()
+
+    events = [make("logs", day, hour) for day in (18, 19, 20) for hour in (1, 12, 23)]
+    events.append(make("audit", 18, 5))
+
+    async def run():
+        db = Database(path=str(tmp_path / "partitioned.db"), partitioning="day")
+        await db.open()
+        await db.store_processed_events_batch(events)
+        partitions = await db.list_partitions()
+
+        pages, cursor = [], None
+        while True:
+            page, cursor = await db.get_events(topic="logs", limit=4, after=cursor)
+            pages.append(page)
+            if not cursor:
+                break
+        ranged, _ = await db.get_events(
+            since=datetime.datetime(2025, 10, 19, 12, tzinfo=datetime.timezone.utc),
+            until=datetime.datetime(2025, 10, 20, tzinfo=datetime.timezone.utc)
+        )
+        exported = [row async for row in db.iter_events()]
+
+        now = datetime.datetime(2025, 10, 21, 6, tzinfo=datetime.timezone.utc).timestamp()
+        # Partisi 18 Okt masih berisi "audit" yang disimpan selamanya: hanya baris "logs" yang dihapus
+        policy = RetentionPolicy(default_days=1.25, topic_days={"audit": 0}, dedup_window_days=0)
+        result = await Compactor(db, policy).run_once(now=now)
+        after = await db.list_partitions()
+        remaining, _ = await db.get_events(limit=100)
+        persisted, _ = await db.load_stats()
+        await db.close()
+        return partitions, pages, ranged, exported, result, after, remaining, persisted
+
+    partitions, pages, ranged, exported, result, after, remaining, persisted = asyncio.run(run())
+    names = {name for name, _, _ in partitions}
+    assert names == {"processed_events", "events_p20251018", "events_p20251019", "events_p20251020"}
+
+    listed = [event["timestamp"] for page in pages for event in page]
+    assert [len(page) for page in pages] == [4, 4, 1]
+    assert listed == sorted(listed, reverse=True) and len(set(listed)) == 9
+    assert [event["timestamp"][:13] for event in ranged] == ["2025-10-19 23", "2025-10-19 12"]
+    assert [row[2] for row in exported] == sorted(row[2] for row in exported) and len(exported) == 10
+
+    assert result["partitions_dropped"] == 1 and result["events_expired"] == 6
+    assert {name for name, _, _ in after} == names - {"events_p20251019"}
+    assert sorted(event["topic"] for event in remaining) == ["audit"] + ["logs"] * 3
+    assert persisted["events_expired_total"] == 6
+
+def test_stats_timeseries_from_rollups(client: TestClient):
+    """T23: Tes /stats/timeseries: rollup per menit memisahkan event unik dan duplikat, per topic atau source."""
+    events = []
+    for minute, topic in ((0, "orders"), (0, "orders"), (1, "orders"), (1, "audit"), (61, "orders")):
+        event = create_event(topic)
+        event["timestamp"] = f"2025-10-20T10:{minute % 60:02d}:30Z" if minute < 60 else "2025-10-20T11:01:30Z"
+        events.append(event)
+    # Dua duplikat: satu di batch yang sama, satu di request berikutnya (ditolak dedup cache)
+    client.post("/publish", json={"events": events + [events[0]]})
+    wait_for_processing(client, 6)
+    client.post("/publish", json={"events": [events[1]]})
+    wait_for_processing(client, 7)
+
+    window = {"since": "2025-10-20T10:00:00Z", "until": "2025-10-20T12:00:00Z"}
+    response = client.get("/stats/timeseries", params=window)
+    assert response.status_code == 200
+    points = [(p["bucket"][11:16], p["topic"], p["unique"], p["duplicates"]) for p in response.json()["points"]]
+    assert points == [
+        ("10:00", "orders", 2, 2),
+        ("10:01", "audit", 1, 0),
+        ("10:01", "orders", 1, 0),
+        ("11:01", "orders", 1, 0),
+    ]
+
+    hourly = client.get("/stats/timeseries", params={**window, "bucket": "hour", "group_by": "none"}).json()
+    assert [(p["bucket"][11:13], p["unique"], p["duplicates"]) for p in hourly["points"]] == [("10", 4, 2), ("11", 1, 0)]
+
+    by_source = client.get("/stats/timeseries", params={**window, "topic": "audit", "group_by": "source"}).json()
+    assert by_source["points"][0]["source"] == "test-suite" and len(by_source["points"]) == 1
+
+    bad = client.get("/stats/timeseries", params={"since": window["until"], "until": window["since"]})
+    assert bad.status_code == 400
+
+def test_publisher_client_batches_compresses_and_retries(client: TestClient):
+    """T24: Tes library publisher: batch otomatis ber-gzip ke app, retry 503 dengan Retry-After, 4xx tidak diulang."""
+    import asyncio
+    import gzip
+    import sys
+    import httpx
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "publisher"))
+    from client import AsyncPublisher, Publisher, PublisherConfig, backoff_delay, parse_retry_after
+
+    # Sync: TestClient adalah httpx.Client, jadi dipakai langsung sebagai pool koneksi
+    events = [create_event("client-topic") for _ in range(250)]
+    config = PublisherConfig(batch_size=100, linger_ms=5, max_in_flight=3, compress_min_bytes=0)
+    with Publisher("http://testserver", config, client=client) as publisher:
+        publisher.publish_many(events + events[:10])
+    assert publisher.stats.snapshot()["events_sent"] == 260
+    assert publisher.stats.batches_sent == 3 and not publisher.errors
+    wait_for_processing(client, 260)
+    assert client.get("/stats").json()["unique_processed_total"] == 250
+
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412470.0) == 10.0
+    assert parse_retry_after("soon") is None
+    assert 1.0 <= backoff_delay(3, PublisherConfig(), retry_after=1.0) <= 1.05
+
+    # Async: 503 + Retry-After dua kali lalu sukses; 400 langsung gagal
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = gzip.decompress(request.content) if request.headers.get("content-encoding") == "gzip" else request.content
+        calls.append(len(body))
+        if b'"bad"' in body:
+            return httpx.Response(400, json={"detail": "bad"})
+        if len(calls) <= 2:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"message": "ok"})
+
+    async def run():
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport) as http:
+            fast = PublisherConfig(batch_size=5, linger_ms=1, backoff_base=0.001)
+            async with AsyncPublisher("http://aggregator", fast, client=http) as publisher:
+                await publisher.publish_many(create_event("t") for _ in range(3))
+                await publisher.flush()
+                await publisher.publish(create_event("bad"))
+            return publisher
+
+    publisher = asyncio.run(run())
+    assert publisher.stats.retries == 2 and publisher.stats.events_sent == 3
+    assert publisher.stats.events_failed == 1 and publisher.errors[0].status_code == 400
+
+def test_admission_all_or_nothing_and_source_rate_limit(client: TestClient):
+    """T25: Tes admission control: batch diterima/ditolak utuh, lag consumer, rate limit per source dengan Retry-After."""
+    import asyncio
+    from src.admission import AdmissionController
+    from src.ingest import IngestBusy, LocalIngest
+    from src.models import Event
+    from src.pipeline import Pipeline
+    from src.stats import StatsCounters
+
+    def records(n, source="svc-a"):
+        events = []
+        for _ in range(n):
+            event = create_event("adm")
+            event["source"] = source
+            events.append(Event(**event).to_record())
+        return events
+
+    async def run():
+        # Pipeline tanpa consumer: antrian hanya terisi
+        pipeline = Pipeline(None, num_shards=2, queue_maxsize=5)
+        counters = StatsCounters()
+        ingest = LocalIngest(pipeline, counters, admission=AdmissionController(pipeline, max_lag_seconds=0))
+        await ingest.submit(records(4))
+        try:
+            # Melebihi sisa kapasitas: tidak satu event pun boleh masuk
+            await ingest.submit(records(7))
+            busy = None
+        except IngestBusy as e:
+            busy = e
+        depth_after_reject = pipeline.queue_depth()
+
+        # Lag: shard memproses ~1 event/detik, antrian sudah terisi -> overloaded
+        lag_ingest = LocalIngest(pipeline, counters, admission=AdmissionController(pipeline, max_lag_seconds=0.5))
+        for shard in pipeline.shards:
+            shard.events_per_second = lambda: 1.0
+        try:
+            await lag_ingest.submit(records(1))
+            overloaded = None
+        except IngestBusy as e:
+            overloaded = e
+        return busy, depth_after_reject, counters.received_total, overloaded, ingest.admission.stats()
+
+    busy, depth, received, overloaded, stats = asyncio.run(run())
+    assert busy is not None and busy.reason == "queue_full" and busy.retry_after > 0
+    assert depth == 4 and received == 4
+    assert stats["rejected_total"] == {"queue_full": 7} and stats["admitted_total"] == 4
+    assert overloaded is not None and overloaded.reason == "overloaded"
+
+    # Rate limit per source lewat HTTP: source lain tidak ikut tertahan
+    ingest = client.app.state.ingest
+    ingest.admission = AdmissionController(ingest.pipeline, source_rate=0.5, source_burst=3)
+    noisy = [dict(create_event("adm"), source="noisy") for _ in range(3)]
+    assert client.post("/publish", json={"events": noisy}).status_code == 200
+    limited = client.post("/publish", json={"events": [dict(create_event("adm"), source="noisy")]})
+    assert limited.status_code == 429 and limited.headers["Retry-After"] == "2"
+    assert client.post("/publish", json={"events": [dict(create_event("adm"), source="quiet")]}).status_code == 200
+    wait_for_processing(client, 4)
+    assert client.get("/stats").json()["admission"]["rejected_total"] == {"rate_limited": 1}
+
+def test_read_cache_etag_and_commit_invalidation(client: TestClient):
+    """T26: Tes cache baca: ETag/If-None-Match 304 tanpa akses DB, invalidasi saat ada commit baru."""
+    client.post("/publish", json={"events": [create_event("cached") for _ in range(3)]})
+    wait_for_processing(client, 3)
+
+    db = client.app.state.db
+    original = db.get_events
+    calls = []
+
+    async def counting_get_events(**kwargs):
+        calls.append(kwargs)
+        return await original(**kwargs)
+
+    db.get_events = counting_get_events
+    try:
+        first = client.get("/events", params={"topic": "cached"})
+        etag = first.headers["ETag"]
+        assert len(first.json()) == 3 and len(calls) == 1
+
+        # Data belum berubah: 304 tanpa body dan tanpa query DB
+        not_modified = client.get("/events", params={"topic": "cached"}, headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304 and not_modified.content == b""
+        assert not_modified.headers["ETag"] == etag and len(calls) == 1
+        # Parameter berbeda = key cache berbeda
+        client.get("/events", params={"topic": "cached", "limit": 2})
+        assert len(calls) == 2
+
+        # Commit baru membuat entri lama tidak berlaku
+        client.post("/publish", json={"events": [create_event("cached")]})
+        wait_for_processing(client, 4)
+        fresh = client.get("/events", params={"topic": "cached"}, headers={"If-None-Match": etag})
+        assert fresh.status_code == 200 and len(fresh.json()) == 4
+        assert fresh.headers["ETag"] != etag and len(calls) == 3
+    finally:
+        db.get_events = original
+
+    stats = client.get("/stats")
+    assert client.get("/stats", headers={"If-None-Match": stats.headers["ETag"]}).status_code == 304
+    assert "aggregator_read_cache_hits_total" in client.get("/metrics").text
+
+def test_payload_compression_dictionary_and_legacy_migration(tmp_path):
+    """T27: Tes encoding payload: kompresi di atas ambang, dictionary untuk payload kecil, migrasi repr lama, dan include_payload."""
+    import asyncio
+    import json
+    from src.models import Event
+    from src.database import Database
+    from src.payload_codec import PayloadCodec
+
+    def make(i, size=0):
+        event = create_event("codec")
+        event["payload"] = {"user_id": i, "action": "page_view", "path": f"/products/{i % 7}", "blob": "x" * size}
+        return Event(**event).to_record()
+
+    async def run():
+        db = Database(path=str(tmp_path / "codec.db"))
+        db.codec = PayloadCodec(codec="zlib", min_bytes=512, dict_min_bytes=32)
+        await db.open()
+        big = make(0, size=4000)
+        small = [make(i) for i in range(1, 301)]
+        await db.store_processed_events_batch([big] + small)
+
+        async with db.reader() as conn:
+            async with conn.execute(
+                "SELECT typeof(payload), length(payload) FROM processed_events WHERE event_id = ?", (big.event_id,)
+            ) as cursor:
+                kind, length = await cursor.fetchone()
+        assert kind == "blob" and length < 200
+
+        # Payload kecil baru dikompres setelah dictionary dilatih
+        before = db.codec.bytes_out
+        await db.store_processed_events_batch([make(1000 + i) for i in range(100)])
+        plain_bytes = db.codec.bytes_out - before
+        assert await db.train_payload_dictionary(samples=300, size=4096) == 1
+        before = db.codec.bytes_out
+        fresh = [make(2000 + i) for i in range(100)]
+        await db.store_processed_events_batch(fresh)
+        assert db.codec.bytes_out - before < plain_bytes * 0.7
+
+        # Baris lama berisi repr dict Python
+        await db.writer.execute(
+            "INSERT INTO processed_events (topic, event_id, timestamp, source, payload) VALUES (?, ?, ?, ?, ?)",
+            ("codec", "legacy-1", "2020-01-01 00:00:00.000000", "old", str({"ok": True, "n": None}))
+        )
+        await db.writer.commit()
+        migrated = await db.migrate_payloads(chunk_size=50)
+        assert migrated["rows_rewritten"] >= 1 and migrated["bytes_after"] < migrated["bytes_before"]
+
+        all_events, _ = await db.get_events(topic="codec", limit=1000)
+        bare, _ = await db.get_events(topic="codec", limit=5, include_payload=False)
+        exported = [row async for row in db.iter_events(topic="codec")]
+        await db.close()
+
+        # Reader baru memuat dictionary dari DB
+        reopened = Database(path=str(tmp_path / "codec.db"))
+        await reopened.open()
+        again, _ = await reopened.get_events(topic="codec", limit=1000)
+        await reopened.close()
+        return all_events, bare, exported, again, fresh
+
+    all_events, bare, exported, again, fresh = asyncio.run(run())
+    payloads = {event["event_id"]: json.loads(event["payload"]) for event in all_events}
+    assert payloads["legacy-1"] == {"ok": True, "n": None}
+    assert payloads[fresh[0].event_id]["user_id"] == 2000
+    assert len(payloads) == 502 and all("payload" not in event for event in bare)
+    assert {row[1]: json.loads(row[4]) for row in exported} == payloads
+    assert [event["payload"] for event in again] == [event["payload"] for event in all_events]